@@ -1,37 +1,137 @@
-import json
-
-class AccountManager:
-    def __init__(self, account_file='accounts.json'):
-        self.account_file = account_file
-        self.load_accounts()
-
-    def load_accounts(self):
-        try:
-            with open(self.account_file, 'r') as file:
-                self.accounts = json.load(file)
-        except FileNotFoundError:
-            self.accounts = {}
-
-    def save_accounts(self):
-        with open(self.account_file, 'w') as file:
-            json.dump(self.accounts, file, indent=4)
-
-    def get_account(self, account_id):
-        account_id = str(account_id)
-        if account_id not in self.accounts:
-            self.accounts[account_id] = {
-                'balance': 10000.0,
-                'positions': {}
-            }
-            self.save_accounts()
-        return self.accounts[account_id]
-
-    def update_account(self, account_id, account_data):
-        self.accounts[str(account_id)] = account_data
-        self.save_accounts()
-
-    def display_account(self, account_id):
-        account = self.get_account(account_id)
-        print(f"Account {account_id}:")
-        print(f"  Balance: {account['balance']}")
-        print(f"  Positions: {account['positions']}")
+import copy
+import time
+import weakref
+from metrics import MetricsRegistry
+from storage import CASH_SCALE, JsonAccountStore
+
+# Account balances are whole minor units (cents), so every change to one is
+# exact. They are converted to currency units only where they leave the
+# engine: the account stores and the displays.
+
+
+def to_minor_units(amount):
+    return round(amount * CASH_SCALE)
+
+
+def from_minor_units(units):
+    return units / CASH_SCALE
+
+
+class _Unsaved:
+    """A manager's accounts and the IDs of those changed since the last write.
+
+    The manager's finalizer holds this rather than the manager, so changes
+    not yet written when the manager is collected, or when the interpreter
+    exits, are still written.
+    """
+
+    def __init__(self, store):
+        self.store = store
+        self.accounts = {}
+        self.dirty = set()
+
+    def write(self):
+        if self.dirty:
+            self.store.save(self.accounts, self.dirty)
+            self.dirty.clear()
+
+
+class AccountManager:
+    """Accounts kept in memory and written to their store (``accounts.json`` by
+    default) behind the updates.
+
+    Updating an account only marks it dirty. The store is written when
+    ``flush_every`` accounts are dirty, when ``flush_interval`` seconds have
+    passed since the last write, or when ``sync()`` is called; any pending
+    changes are also written when the manager is garbage collected or the
+    process exits. The interval is only checked on an update, so an owner
+    that can go idle calls ``flush_if_due()`` on a timer.
+    """
+
+    # Methods timed by instrumentation.StageStats, as {method name: stage}
+    STAGES = {'update_account': 'account_update', 'save_accounts': 'account_save'}
+
+    def __init__(self, account_file='accounts.json', flush_every=1000, flush_interval=5.0, storage=None,
+                 metrics=None):
+        self.account_file = account_file
+        self.store = storage.accounts if storage is not None else JsonAccountStore(account_file)
+        self.flush_every = flush_every
+        self.flush_interval = flush_interval
+        self._unsaved = _Unsaved(self.store)
+        self.dirty = self._unsaved.dirty
+        self.last_flush = time.monotonic()
+        self.metrics = metrics if metrics is not None else MetricsRegistry()
+        self._persist_seconds = self.metrics.histogram('engine_persist_seconds',
+                                                       "Time to write changes to storage", ('target',))
+        # The collectors read the unsaved state rather than the manager, so a
+        # registry that outlives the manager does not keep it from being collected
+        unsaved = self._unsaved
+        self.metrics.gauge('engine_accounts', "Accounts", collect=lambda: {(): len(unsaved.accounts)})
+        self.metrics.gauge('engine_dirty_accounts', "Accounts with changes not yet written",
+                           collect=lambda: {(): len(unsaved.dirty)})
+        self.load_accounts()
+        weakref.finalize(self, self._unsaved.write)
+
+    @property
+    def accounts(self):
+        return self._unsaved.accounts
+
+    @accounts.setter
+    def accounts(self, accounts):
+        self._unsaved.accounts = accounts
+
+    def load_accounts(self):
+        self.accounts = self.store.load()
+        self.dirty.clear()
+        self.last_flush = time.monotonic()
+
+    def save_accounts(self):
+        started = time.perf_counter()
+        self.store.save(self.accounts, self.dirty)
+        self.dirty.clear()
+        self.last_flush = time.monotonic()
+        self._persist_seconds.observe(time.perf_counter() - started, ('accounts',))
+
+    def reset_accounts(self, accounts):
+        """Replace every account, in memory and in the store; balances are in cents."""
+        self.accounts = copy.deepcopy(accounts)
+        self.store.replace(self.accounts)
+        self.dirty.clear()
+        self.last_flush = time.monotonic()
+
+    def mark_dirty(self, account_id):
+        self.dirty.add(str(account_id))
+        if len(self.dirty) >= self.flush_every:
+            self.save_accounts()
+        else:
+            self.flush_if_due()
+
+    def flush_if_due(self):
+        """Write pending changes if ``flush_interval`` seconds have passed since the last write."""
+        if self.dirty and time.monotonic() - self.last_flush >= self.flush_interval:
+            self.save_accounts()
+
+    def sync(self):
+        """Write pending account changes to disk now."""
+        if self.dirty:
+            self.save_accounts()
+
+    def get_account(self, account_id):
+        account_id = str(account_id)
+        if account_id not in self.accounts:
+            self.accounts[account_id] = {
+                'balance': 10000 * CASH_SCALE,
+                'positions': {}
+            }
+            self.mark_dirty(account_id)
+        return self.accounts[account_id]
+
+    def update_account(self, account_id, account_data):
+        self.accounts[str(account_id)] = account_data
+        self.mark_dirty(account_id)
+
+    def display_account(self, account_id):
+        account = self.get_account(account_id)
+        print(f"Account {account_id}:")
+        print(f"  Balance: {from_minor_units(account['balance'])}")
+        print(f"  Positions: {account['positions']}")
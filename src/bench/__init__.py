@@ -0,0 +1 @@
+"""Benchmarks of the matching engine and its storage; run with ``python -m bench`` from src/."""
@@ -0,0 +1,52 @@
+import argparse
+import json
+import sys
+from bench.runner import best_of, compare, format_comparison, format_results
+from bench.workload import parse_mix
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m bench', description="Benchmark the matching engine")
+    parser.add_argument('--count', type=int, default=20000, help="steps of order flow to play (default: 20000)")
+    parser.add_argument('--storage', choices=('json', 'binary', 'sqlite', 'memory'), default='json',
+                        help="storage backend, in a temporary directory (default: json)")
+    parser.add_argument('--mix', type=parse_mix, default=None,
+                        help="shares of each step, e.g. limit=0.6,market=0.1,stop=0.1,cancel=0.15,price=0.05")
+    parser.add_argument('--tickers', type=int, default=5, help="number of tickers traded (default: 5)")
+    parser.add_argument('--skew', type=float, default=1.0,
+                        help="how unevenly the flow is spread over the tickers; 0 is even (default: 1.0)")
+    parser.add_argument('--depth', type=int, default=50,
+                        help="ticks either side of the price that limit orders are placed at (default: 50)")
+    parser.add_argument('--accounts', type=int, default=20, help="number of trading accounts (default: 20)")
+    parser.add_argument('--seed', type=int, default=1, help="random seed of the order flow (default: 1)")
+    parser.add_argument('--repeat', type=int, default=1,
+                        help="run the flow this many times and keep the fastest run (default: 1)")
+    parser.add_argument('--save', metavar='FILE', help="write the results to FILE as JSON")
+    parser.add_argument('--baseline', metavar='FILE', help="compare the results with a run saved in FILE")
+    parser.add_argument('--threshold', type=float, default=0.10,
+                        help="relative change counted as a regression against the baseline (default: 0.10)")
+    args = parser.parse_args(argv)
+
+    results = best_of(args.repeat, count=args.count, storage=args.storage, mix=args.mix, tickers=args.tickers,
+                      skew=args.skew, depth=args.depth, accounts=args.accounts, seed=args.seed)
+    print(format_results(results))
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f"Results saved to {args.save}.")
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if baseline.get('config') != results['config']:
+            print("Warning: the baseline was run with different settings.")
+        rows = compare(results, baseline, args.threshold)
+        print(format_comparison(rows))
+        regressions = sum(row[-1] for row in rows)
+        if regressions:
+            print(f"{regressions} regressions against {args.baseline}.")
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,173 @@
+import os
+import platform
+import tempfile
+import time
+from datetime import datetime
+from account import CASH_SCALE, AccountManager
+from events import null_sink
+from order_execution import OrderBook
+from stock_info import StockInfo
+from storage import JsonStorage, MemoryStorage, SqliteStorage
+from bench.workload import DEFAULT_MIX, generate
+
+# OrderBook methods timed on every call. Calls made from inside another
+# timed method are timed as well, so match_orders and save_executed_trade
+# are also part of the add_order times.
+OPERATIONS = ('add_order', 'match_orders', 'cancel_order', 'cancel_stop_order', 'check_stop_orders',
+              'save_executed_trade')
+PERCENTILES = (50, 99, 99.9)
+PHASES = 10  # the run is split into this many parts to show how p50 moves as the book grows
+MIN_TAIL = 10  # a percentile is compared only if at least this many calls lie above it
+
+
+def percentile(ordered, pct):
+    """Nearest-rank percentile of an ascending list."""
+    if not ordered:
+        return None
+    rank = max(1, -(-len(ordered) * pct // 100))
+    return ordered[int(rank) - 1]
+
+
+def _label(pct):
+    return 'p' + format(pct, 'g').replace('.', '')
+
+
+def summarize(samples):
+    """Count, ops/sec and latency percentiles, in microseconds, of a list of call times in ns."""
+    ordered = sorted(samples)
+    total = sum(ordered)
+    stats = {'count': len(ordered),
+             'ops_per_sec': len(ordered) / (total / 1e9) if total else 0.0,
+             'mean_us': total / len(ordered) / 1000 if ordered else None}
+    for pct in PERCENTILES:
+        value = percentile(ordered, pct)
+        stats[_label(pct) + '_us'] = value / 1000 if value is not None else None
+    chunk = -(-len(samples) // PHASES)
+    stats['p50_by_phase_us'] = [percentile(sorted(samples[i:i + chunk]), 50) / 1000
+                                for i in range(0, len(samples), chunk)] if samples else []
+    return stats
+
+
+def _timed(method, samples):
+    clock = time.perf_counter_ns
+
+    def timed(*args, **kwargs):
+        started = clock()
+        try:
+            return method(*args, **kwargs)
+        finally:
+            samples.append(clock() - started)
+    return timed
+
+
+def open_bench_storage(kind, directory):
+    if kind == 'json':
+        return JsonStorage(os.path.join(directory, 'unmatched_orders.json'),
+                           os.path.join(directory, 'executed_trades.jsonl'),
+                           os.path.join(directory, 'accounts.json'))
+    if kind == 'binary':
+        return JsonStorage(os.path.join(directory, 'unmatched_orders.json'),
+                           os.path.join(directory, 'executed_trades.bin'),
+                           os.path.join(directory, 'accounts.json'), trade_log='binary')
+    if kind == 'sqlite':
+        return SqliteStorage(os.path.join(directory, 'trading.db'))
+    if kind == 'memory':
+        return MemoryStorage()
+    raise ValueError(f"Unknown storage backend: {kind}")
+
+
+def best_of(repeat, **options):
+    """The results of the fastest of ``repeat`` runs, which are the least disturbed by other load."""
+    results = min((run(**options) for _ in range(repeat)), key=lambda results: results['wall_seconds'])
+    results['runs'] = repeat
+    return results
+
+
+def run(count=20000, storage='json', mix=None, tickers=5, skew=1.0, depth=50, accounts=20, seed=1):
+    """Play a generated order flow against a fresh engine in a temporary directory; return the results.
+
+    The engine reports to the null event sink, so printing is not measured.
+    """
+    config = {'count': count, 'storage': storage, 'mix': mix or DEFAULT_MIX, 'tickers': tickers,
+              'skew': skew, 'depth': depth, 'accounts': accounts, 'seed': seed}
+    samples = {name: [] for name in OPERATIONS}
+    with tempfile.TemporaryDirectory(prefix='bench-') as directory:
+        store = open_bench_storage(storage, directory)
+        stock_info = StockInfo()
+        steps = list(generate(stock_info, count, mix, tickers, skew, depth, accounts, seed))
+        account_manager = AccountManager(storage=store)
+        account_manager.reset_accounts({
+            str(i): {'balance': 10 ** 12 * CASH_SCALE, 'positions': {ticker: 1.0e9 for ticker in stock_info.stocks}}
+            for i in range(accounts)
+        })
+        order_book = OrderBook(stock_info, storage=store, events=null_sink())
+        for name in OPERATIONS:
+            setattr(order_book, name, _timed(getattr(order_book, name), samples[name]))
+
+        started = time.perf_counter()
+        for operation, args in steps:
+            if operation == 'update_market_price':
+                order_book.update_market_price(*args, account_manager)
+            elif operation == 'add_order':
+                order_book.add_order(*args, account_manager)
+            else:
+                getattr(order_book, operation)(*args)
+        account_manager.sync()
+        elapsed = time.perf_counter() - started
+        store.close()
+
+    return {
+        'config': config,
+        'started': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'wall_seconds': elapsed,
+        'steps_per_sec': count / elapsed if elapsed else 0.0,
+        'fills': order_book.fill_count,
+        'runs': 1,
+        'operations': {name: summarize(times) for name, times in samples.items() if times},
+    }
+
+
+def compare(current, baseline, threshold=0.10):
+    """Rows of (operation, metric, baseline, current, change, regressed) for the metrics both runs have.
+
+    A latency percentile regresses when it grows by more than ``threshold``
+    (a fraction), and ops/sec when it falls by more than that. Percentiles
+    with fewer than MIN_TAIL calls above them in either run are left out:
+    they are a handful of calls and mostly noise.
+    """
+    rows = []
+    for name, stats in current['operations'].items():
+        base = baseline.get('operations', {}).get(name)
+        if base is None:
+            continue
+        count = min(stats['count'], base['count'])
+        metrics = ['ops_per_sec'] + [_label(pct) + '_us' for pct in PERCENTILES
+                                     if count * (100 - pct) / 100 >= MIN_TAIL]
+        for metric in metrics:
+            old, new = base.get(metric), stats.get(metric)
+            if not old or new is None:
+                continue
+            change = (new - old) / old
+            regressed = change < -threshold if metric == 'ops_per_sec' else change > threshold
+            rows.append((name, metric, old, new, change, regressed))
+    return rows
+
+
+def format_results(results):
+    best = f", best of {results['runs']} runs" if results['runs'] > 1 else ''
+    lines = [f"{results['config']['count']} steps on {results['config']['storage']} storage in "
+             f"{results['wall_seconds']:.2f} s ({results['steps_per_sec']:.0f} steps/s, {results['fills']} fills{best})",
+             f"{'operation':<20}{'count':>8}{'ops/s':>11}{'p50 us':>10}{'p99 us':>10}{'p999 us':>10}"]
+    for name, stats in results['operations'].items():
+        lines.append(f"{name:<20}{stats['count']:>8}{stats['ops_per_sec']:>11.0f}{stats['p50_us']:>10.1f}"
+                     f"{stats['p99_us']:>10.1f}{stats['p999_us']:>10.1f}")
+    return '\n'.join(lines)
+
+
+def format_comparison(rows):
+    lines = [f"{'operation':<20}{'metric':<12}{'baseline':>12}{'current':>12}{'change':>9}"]
+    for name, metric, old, new, change, regressed in rows:
+        flag = '  REGRESSION' if regressed else ''
+        lines.append(f"{name:<20}{metric:<12}{old:>12.1f}{new:>12.1f}{change:>+9.1%}{flag}")
+    return '\n'.join(lines)
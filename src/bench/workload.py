@@ -0,0 +1,89 @@
+import random
+import time
+
+# Share of each kind of step in the generated flow. 'price' steps move a
+# ticker's market price, which checks its stop orders.
+DEFAULT_MIX = {'limit': 0.6, 'market': 0.1, 'stop': 0.1, 'cancel': 0.15, 'price': 0.05}
+
+
+def parse_mix(text):
+    """``limit=0.6,market=0.1,...`` as a mix dict; kinds left out get no share."""
+    mix = {}
+    for part in text.split(','):
+        kind, sep, share = part.partition('=')
+        kind = kind.strip()
+        if not sep or kind not in DEFAULT_MIX:
+            raise ValueError(f"invalid mix entry '{part}'; use {', '.join(DEFAULT_MIX)}")
+        mix[kind] = float(share)
+    if sum(mix.values()) <= 0:
+        raise ValueError("the mix needs at least one positive share")
+    return mix
+
+
+def add_tickers(stock_info, count):
+    """Make sure stock_info has ``count`` tickers, adding synthetic ones after its own; return them."""
+    index = len(stock_info.stocks)
+    while len(stock_info.stocks) < count:
+        ticker = f"SYM{index}"
+        stock_info.stocks.append(ticker)
+        stock_info.initial_prices[ticker] = 100.0
+        stock_info.ticks_per_unit[ticker] = stock_info.ticks_per_unit[stock_info.stocks[0]]
+        index += 1
+    return stock_info.stocks[:count]
+
+
+def generate(stock_info, count, mix=None, tickers=5, skew=1.0, depth=50, accounts=20, seed=1):
+    """Yield ``count`` steps of synthetic order flow as (operation, arguments) pairs.
+
+    Operations are 'add_order' (with an order dict), 'cancel_order' and
+    'cancel_stop_order' (with account_id, order_id) and 'update_market_price'
+    (with ticker, price). Ticker ``i`` is picked with weight 1 / (i + 1) **
+    ``skew``, so 0 spreads the flow evenly and larger values pile it onto
+    the first tickers. Limit prices are drawn from ``depth`` ticks either side
+    of the ticker's initial price, so about 2 * depth price levels fill up
+    and crossing prices trade. Cancels pick one of the recent orders (up to 1000),
+    which may already have traded.
+    """
+    rng = random.Random(seed)
+    mix = mix or DEFAULT_MIX
+    kinds, shares = list(mix), list(mix.values())
+    symbols = add_tickers(stock_info, tickers)
+    weights = [1 / (i + 1) ** skew for i in range(len(symbols))]
+    mids = {ticker: stock_info.to_ticks(ticker, stock_info.get_initial_price(ticker)) for ticker in symbols}
+    placed = []  # (account_id, order_id, is_stop) of recent orders
+    next_id = 0
+    now = time.time_ns()
+
+    for kind in rng.choices(kinds, shares, k=count):
+        ticker = rng.choices(symbols, weights)[0]
+        mid = mids[ticker]
+        if kind == 'cancel' and placed:
+            account_id, order_id, is_stop = placed[rng.randrange(len(placed))]
+            yield ('cancel_stop_order' if is_stop else 'cancel_order'), (account_id, order_id)
+            continue
+        if kind == 'price':
+            yield 'update_market_price', (ticker, stock_info.from_ticks(ticker, mid + rng.randint(-depth, depth)))
+            continue
+
+        action = rng.choice(('buy', 'sell'))
+        order = {'action': action, 'ticker': ticker, 'quantity': rng.randint(1, 10),
+                 'account_id': str(rng.randrange(accounts)), 'timestamp': now}
+        if kind == 'market':
+            order.update(order_type='market', price=None)
+        elif kind == 'stop':
+            # Buy stops sit above the price and sell stops below it
+            offset = rng.randint(1, depth) * (1 if action == 'buy' else -1)
+            order['stop_price'] = stock_info.from_ticks(ticker, mid + offset)
+            if rng.random() < 0.5:
+                order.update(order_type='stop_market', price=None)
+            else:
+                order.update(order_type='stop_limit', price=stock_info.from_ticks(ticker, mid + 2 * offset))
+        else:
+            order.update(order_type='limit', price=stock_info.from_ticks(ticker, mid + rng.randint(-depth, depth)))
+
+        next_id += 1
+        order['order_id'] = f"b{next_id}"
+        placed.append((order['account_id'], order['order_id'], kind == 'stop'))
+        if len(placed) > 1000:
+            del placed[:500]
+        yield 'add_order', (order,)
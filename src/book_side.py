@@ -0,0 +1,211 @@
+from array import array
+from bisect import bisect_left, bisect_right, insort
+from itertools import islice
+from order import OrderType
+
+
+class OrderNode:
+    __slots__ = ('order', 'prev', 'next', 'queue')
+
+    def __init__(self, order, queue):
+        self.order = order
+        self.prev = None
+        self.next = None
+        self.queue = queue
+
+
+class OrderQueue:
+    """FIFO of orders as a doubly linked list, so any node unlinks in O(1).
+
+    ``quantity`` is the total open quantity of the queued orders and is kept
+    up to date on append, unlink and partial fills.
+    """
+    __slots__ = ('side', 'head', 'tail', 'size', 'quantity')
+
+    def __init__(self, side):
+        self.side = side  # BookSide that owns this queue
+        self.head = None
+        self.tail = None
+        self.size = 0
+        self.quantity = 0
+
+    def append(self, order):
+        node = OrderNode(order, self)
+        if self.tail is None:
+            self.head = node
+        else:
+            node.prev = self.tail
+            self.tail.next = node
+        self.tail = node
+        self.size += 1
+        self.quantity += order.quantity
+        return node
+
+    def unlink(self, node):
+        if node.prev is None:
+            self.head = node.next
+        else:
+            node.prev.next = node.next
+        if node.next is None:
+            self.tail = node.prev
+        else:
+            node.next.prev = node.prev
+        node.prev = node.next = node.queue = None
+        self.size -= 1
+        if self.size:
+            self.quantity -= node.order.quantity
+        else:
+            self.quantity = 0
+
+    def find(self, order):
+        node = self.head
+        while node is not None:
+            if node.order is order:
+                return node
+            node = node.next
+        return None
+
+    def __iter__(self):
+        node = self.head
+        while node is not None:
+            next_node = node.next
+            yield node.order
+            node = next_node
+
+    def __len__(self):
+        return self.size
+
+
+class BookSide:
+    """One side (buy or sell) of a ticker's order book in price-time priority.
+
+    Limit orders are grouped into price levels, each a FIFO queue, and the
+    level prices are kept sorted so the best price is always at one end of
+    ``prices``. Prices are whole numbers of ticks (``order.price_ticks``),
+    so they are exact level keys and ``prices`` is a compact array of
+    64-bit integers. Market orders wait in their own FIFO queue ahead of
+    every limit order. The structure is updated in place on insert, fill
+    and cancel, so nothing has to be re-sorted when matching.
+    """
+
+    def __init__(self, action):
+        self.action = action  # 'buy' or 'sell'
+        self.market_orders = OrderQueue(self)  # market orders, oldest first
+        self.levels = {}  # {price in ticks: OrderQueue of limit orders, oldest first}
+        self.prices = array('q')  # prices that have resting limit orders, ascending
+        self.count = 0
+
+    def append(self, order):
+        """Add an order behind all orders of the same priority and return its node."""
+        if order.order_type == OrderType.MARKET:
+            node = self.market_orders.append(order)
+        else:
+            price = order.price_ticks
+            level = self.levels.get(price)
+            if level is None:
+                level = OrderQueue(self)
+                self.levels[price] = level
+                insort(self.prices, price)
+            node = level.append(order)
+        self.count += 1
+        return node
+
+    def remove_node(self, node):
+        queue = node.queue
+        if queue is None or queue.side is not self:
+            raise ValueError("Order is not in the book.")
+        price = node.order.price_ticks
+        queue.unlink(node)
+        if queue is not self.market_orders and not queue:
+            del self.levels[price]
+            del self.prices[bisect_left(self.prices, price)]
+        self.count -= 1
+
+    def _queue_for(self, order):
+        if order.order_type == OrderType.MARKET:
+            return self.market_orders
+        return self.levels.get(order.price_ticks)
+
+    def reduce(self, order, quantity):
+        """Take a partial or full fill off a resting order's open quantity."""
+        queue = self._queue_for(order)
+        order.quantity -= quantity
+        if queue is not None:
+            queue.quantity -= quantity
+
+    def remove(self, order):
+        queue = self._queue_for(order)
+        # Filled orders are almost always at the head of their queue.
+        # Compare by identity: two different orders can hold equal fields.
+        node = None
+        if queue is not None:
+            node = queue.head if queue.head is not None and queue.head.order is order else queue.find(order)
+        if node is None:
+            raise ValueError("Order is not in the book.")
+        self.remove_node(node)
+
+    def contains(self, node):
+        return node.queue is not None and node.queue.side is self
+
+    def best_price(self):
+        """Best limit price on this side in ticks, or None when no limit orders rest."""
+        if not self.prices:
+            return None
+        return self.prices[-1] if self.action == 'buy' else self.prices[0]
+
+    def top(self):
+        """(best price in ticks, open quantity at that price, orders at that price), or None."""
+        price = self.best_price()
+        if price is None:
+            return None
+        level = self.levels[price]
+        return price, level.quantity, level.size
+
+    def level_prices(self):
+        """Level prices from best to worst."""
+        return reversed(self.prices) if self.action == 'buy' else iter(self.prices)
+
+    def nodes_after(self, node=None):
+        """Nodes in priority order after ``node``, or from the top when it is None.
+
+        ``node`` must still be in this side, and the side must not change
+        while the nodes are walked.
+        """
+        if node is None:
+            node, prices = self.market_orders.head, self.level_prices()
+        else:
+            price = node.order.price_ticks
+            if node.queue is self.market_orders:
+                prices = self.level_prices()
+            elif self.action == 'buy':
+                prices = (self.prices[i] for i in range(bisect_left(self.prices, price) - 1, -1, -1))
+            else:
+                prices = (self.prices[i] for i in range(bisect_right(self.prices, price), len(self.prices)))
+            node = node.next
+        while node is not None:
+            yield node
+            node = node.next
+        for price in prices:
+            node = self.levels[price].head
+            while node is not None:
+                yield node
+                node = node.next
+
+    def __iter__(self):
+        yield from self.market_orders
+        for price in self.level_prices():
+            yield from self.levels[price]
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += self.count
+        if 0 <= index < self.count:
+            if index == 0:
+                if self.market_orders:
+                    return self.market_orders.head.order
+                return self.levels[self.best_price()].head.order
+            return next(islice(iter(self), index, None))
+        raise IndexError("BookSide index out of range")
@@ -0,0 +1,122 @@
+import json
+
+# Kinds of engine events. Every event is a dict with its kind under 'event',
+# like the order journal's records:
+#   accepted   order_id, ticker, account_id, action, order_type, quantity, price, stop_price, stop
+#   rejected   request ('order', 'cancel' or 'cancel_stop'), account_id, order_id, reason (such as
+#              'invalid_price' or 'not_found'), error
+#   filled     trade_id, ticker, price, quantity, buy_account_id, sell_account_id, timestamp (ns since 1970),
+#              buy_order_id, sell_order_id
+#   triggered  order_id, ticker, action
+#   cancelled  order_id, ticker, account_id, stop, reason ('request' or 'insufficient_balance')
+#   cascade    ticker, depth, triggered, fills, elapsed_ms
+# The accepted and rejected events of orders added with OrderBook.add_orders
+# also have batch: True.
+ACCEPTED = 'accepted'
+REJECTED = 'rejected'
+FILLED = 'filled'
+TRIGGERED = 'triggered'
+CANCELLED = 'cancelled'
+CASCADE = 'cascade'
+
+
+class EventSink:
+    """Hands the engine's events to its subscribers, callables that take an event dict.
+
+    The engine only builds an event when the sink has subscribers, so a sink
+    without any (see ``null_sink``) costs next to nothing per order.
+    """
+
+    def __init__(self, subscribers=()):
+        self.subscribers = list(subscribers)
+
+    def subscribe(self, subscriber):
+        self.subscribers.append(subscriber)
+
+    def unsubscribe(self, subscriber):
+        self.subscribers.remove(subscriber)
+
+    def emit(self, event):
+        for subscriber in self.subscribers:
+            subscriber(event)
+
+    def close(self):
+        """Close the subscribers that hold resources, such as files."""
+        for subscriber in self.subscribers:
+            close = getattr(subscriber, 'close', None)
+            if close is not None:
+                close()
+
+
+def null_sink():
+    """A sink that drops every event, for benchmarks and embedding."""
+    return EventSink()
+
+
+class ConsolePrinter:
+    """Prints events as the simulator's console messages.
+
+    With ``quiet`` only rejections and cancellations are printed. Orders
+    accepted or rejected in a batch are not printed; the batch reports them.
+    """
+
+    QUIET_KINDS = (REJECTED, CANCELLED)
+
+    def __init__(self, quiet=False):
+        self.quiet = quiet
+
+    def __call__(self, event):
+        kind = event['event']
+        if self.quiet and kind not in self.QUIET_KINDS:
+            return
+        if event.get('batch'):
+            return
+        print(self.format(event))
+
+    @staticmethod
+    def format(event):
+        kind = event['event']
+        if kind == ACCEPTED:
+            if event['stop']:
+                return f"Stop order added with Order ID: {event['order_id']}"
+            return f"Order added to the order book with Order ID: {event['order_id']}"
+        if kind == FILLED:
+            return (f"Executed {event['quantity']} shares of {event['ticker']} at {event['price']} between "
+                    f"Account {event['buy_account_id']} (buy) and Account {event['sell_account_id']} (sell).")
+        if kind == TRIGGERED:
+            return f"Stop {event['action']} order {event['order_id']} triggered."
+        if kind == CANCELLED:
+            if event['reason'] == 'insufficient_balance':
+                return f"Account {event['account_id']} has insufficient balance."
+            return f"{'Stop order' if event['stop'] else 'Order'} {event['order_id']} canceled."
+        if kind == REJECTED:
+            if event['request'] == 'cancel':
+                return f"Order ID {event['order_id']} not found for Account {event['account_id']}."
+            if event['request'] == 'cancel_stop':
+                return f"Stop Order ID {event['order_id']} not found for Account {event['account_id']}."
+            return f"Error: {event['error']}"
+        if kind == CASCADE:
+            return (f"Stop cascade on {event['ticker']}: depth {event['depth']}, {event['triggered']} stop orders "
+                    f"triggered, {event['fills']} fills in {event['elapsed_ms']:.3f} ms.")
+        return str(event)
+
+
+class EventFileWriter:
+    """Appends events to a JSON Lines file through a large write buffer.
+
+    Events reach the disk when the buffer fills, on ``flush`` and on ``close``.
+    """
+
+    def __init__(self, path, buffer_size=1 << 20):
+        self.path = path
+        self._file = open(path, 'a', buffering=buffer_size)
+
+    def __call__(self, event):
+        self._file.write(json.dumps(event, default=str) + '\n')
+
+    def flush(self):
+        self._file.flush()
+
+    def close(self):
+        if not self._file.closed:
+            self._file.close()
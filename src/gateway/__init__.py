@@ -0,0 +1,2 @@
+"""A TCP order gateway in front of the matching engine, and a load generator for it; run with ``python -m gateway``
+from src/."""
@@ -0,0 +1,96 @@
+import argparse
+import asyncio
+import sys
+from account import CASH_SCALE, AccountManager
+from events import EventFileWriter, EventSink
+from gateway.loadgen import format_load, run_load
+from gateway.server import Gateway
+from metrics import MetricsRegistry, MetricsServer
+from order_execution import OrderBook
+from stock_info import StockInfo
+from storage import open_storage
+
+
+def funded_accounts(count, stock_info):
+    """Accounts '0' to count - 1 with enough cash and shares that load tests are not rejected for lack of them."""
+    return {str(i): {'balance': 10 ** 12 * CASH_SCALE, 'positions': {ticker: 1.0e9 for ticker in stock_info.stocks}}
+            for i in range(count)}
+
+
+async def serve(args):
+    stock_info = StockInfo()
+    storage = open_storage(args.storage, args.db)
+    metrics = MetricsRegistry()
+    account_manager = AccountManager(storage=storage, metrics=metrics)
+    if args.fund_accounts:
+        account_manager.reset_accounts(funded_accounts(args.fund_accounts, stock_info))
+    events = EventSink()
+    if args.event_log:
+        events.subscribe(EventFileWriter(args.event_log))
+    order_book = OrderBook(stock_info, storage=storage, events=events, metrics=metrics)
+    gateway = Gateway(order_book, account_manager, args.queue_size, args.max_inflight, args.outbound_size)
+    await gateway.start(args.host, args.port)
+    metrics_server = MetricsServer(metrics, args.metrics_port) if args.metrics_port is not None else None
+    print(f"Gateway listening on {gateway.host}:{gateway.port}")
+    try:
+        await gateway.serve_forever()
+    finally:
+        await gateway.close()
+        if metrics_server is not None:
+            metrics_server.close()
+        account_manager.sync()
+        storage.close()
+        events.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m gateway', description="TCP order gateway for the matching engine")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    server = commands.add_parser('serve', help="run the gateway")
+    server.add_argument('--host', default='127.0.0.1', help="address to listen on (default: 127.0.0.1)")
+    server.add_argument('--port', type=int, default=9200, help="port to listen on (default: 9200)")
+    server.add_argument('--storage', choices=('json', 'sqlite', 'memory'), default='json',
+                        help="where orders, trades and accounts are kept (default: json files)")
+    server.add_argument('--db', help="database file for --storage sqlite (default: trading.db)")
+    server.add_argument('--queue-size', type=int, default=1024,
+                        help="requests waiting for the engine before clients are no longer read (default: 1024)")
+    server.add_argument('--max-inflight', type=int, default=64,
+                        help="unanswered requests read from one client (default: 64)")
+    server.add_argument('--outbound-size', type=int, default=4096,
+                        help="responses and events queued for one client before it is disconnected (default: 4096)")
+    server.add_argument('--fund-accounts', type=int, metavar='N',
+                        help="replace the accounts with N well-funded accounts '0' to N-1, for load tests")
+    server.add_argument('--event-log', metavar='FILE', help="append every engine event to FILE as JSON Lines")
+    server.add_argument('--metrics-port', type=int, metavar='PORT',
+                        help="serve the engine and gateway metrics at http://127.0.0.1:PORT/metrics")
+
+    load = commands.add_parser('load', help="send generated order flow to a gateway and report round-trip latency")
+    load.add_argument('--host', default='127.0.0.1', help="gateway address (default: 127.0.0.1)")
+    load.add_argument('--port', type=int, default=9200, help="gateway port (default: 9200)")
+    load.add_argument('--clients', type=int, default=4, help="connections sending at once (default: 4)")
+    load.add_argument('--count', type=int, default=10000, help="requests sent by each connection (default: 10000)")
+    load.add_argument('--window', type=int, default=16,
+                      help="unanswered requests each connection may have (default: 16)")
+    load.add_argument('--accounts', type=int, default=20, help="accounts '0' to N-1 that trade (default: 20)")
+    load.add_argument('--seed', type=int, default=1, help="random seed of the order flow (default: 1)")
+    args = parser.parse_args(argv)
+
+    if args.command == 'serve':
+        try:
+            asyncio.run(serve(args))
+        except KeyboardInterrupt:
+            pass
+        return 0
+    try:
+        results = asyncio.run(run_load(args.host, args.port, args.clients, args.count, args.window, args.accounts,
+                                       seed=args.seed))
+    except OSError as e:
+        print(f"Error: cannot reach the gateway at {args.host}:{args.port}: {e}")
+        return 1
+    print(format_load(results))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
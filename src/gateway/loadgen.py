@@ -0,0 +1,97 @@
+import asyncio
+import json
+import time
+from bench.runner import PERCENTILES, percentile
+from bench.workload import DEFAULT_MIX, generate
+from stock_info import StockInfo
+
+# The gateway takes no market price updates, so the flow leaves them out
+LOAD_MIX = {kind: share for kind, share in DEFAULT_MIX.items() if kind != 'price'}
+
+
+def requests_for(steps):
+    """Gateway requests for the order flow of bench.workload.generate.
+
+    Each cancel names the workload's order_id, which the client swaps for
+    the engine's order ID once the order's response has come back.
+    """
+    for operation, args in steps:
+        if operation == 'add_order':
+            order = dict(args[0])
+            workload_id = order.pop('order_id')
+            del order['timestamp']
+            yield {'type': 'submit', 'order': order}, workload_id
+        elif operation in ('cancel_order', 'cancel_stop_order'):
+            account_id, order_id = args
+            yield {'type': 'cancel', 'account_id': account_id, 'order_id': order_id,
+                   'stop': operation == 'cancel_stop_order'}, None
+
+
+async def _client(host, port, requests, window, latencies, outcomes):
+    """Send requests over one connection with at most ``window`` unanswered; record each round trip in ns."""
+    reader, writer = await asyncio.open_connection(host, port)
+    clock = time.perf_counter_ns
+    slots = asyncio.Semaphore(window)
+    sent = {}  # {request id: (time sent, workload order_id)}
+    engine_ids = {}  # {workload order_id: engine order_id}
+
+    async def receive():
+        for _ in requests:
+            line = await reader.readline()
+            if not line:
+                raise ConnectionError("the gateway closed the connection")
+            response = json.loads(line)
+            started, workload_id = sent.pop(response['id'])
+            latencies.append(clock() - started)
+            outcomes['ok' if response['ok'] else 'failed'] += 1
+            if workload_id is not None and response['ok']:
+                engine_ids[workload_id] = response['order_id']
+            slots.release()
+
+    receiver = asyncio.create_task(receive())
+    try:
+        for number, (request, workload_id) in enumerate(requests):
+            await slots.acquire()
+            if request['type'] == 'cancel':
+                request['order_id'] = engine_ids.get(request['order_id'], request['order_id'])
+            request['id'] = number
+            sent[number] = (clock(), workload_id)
+            writer.write(json.dumps(request).encode() + b'\n')
+            await writer.drain()
+        await receiver
+    finally:
+        receiver.cancel()
+        writer.close()
+
+
+async def run_load(host='127.0.0.1', port=9200, clients=4, count=10000, window=16, accounts=20, depth=50, seed=1):
+    """Play ``count`` requests of generated order flow per client over ``clients`` connections at once.
+
+    Returns the round-trip latency, from sending a request to reading its
+    response, and the request rate over all clients. Client ``i`` plays the
+    flow of seed ``seed + i``; its account IDs are '0' to accounts - 1, so
+    the gateway should have funded them (``serve --fund-accounts``).
+    """
+    stock_info = StockInfo()
+    tickers = len(stock_info.stocks)
+    flows = [list(requests_for(generate(stock_info, count, LOAD_MIX, tickers, 1.0, depth, accounts, seed + i)))
+             for i in range(clients)]
+    latencies = []
+    outcomes = {'ok': 0, 'failed': 0}
+    started = time.perf_counter()
+    await asyncio.gather(*(_client(host, port, flow, window, latencies, outcomes) for flow in flows))
+    elapsed = time.perf_counter() - started
+    latencies.sort()
+    rtt = {f"p{format(pct, 'g').replace('.', '')}_us": percentile(latencies, pct) / 1000 for pct in PERCENTILES}
+    rtt['max_us'] = latencies[-1] / 1000 if latencies else None
+    return {'clients': clients, 'window': window, 'requests': len(latencies), 'wall_seconds': elapsed,
+            'requests_per_sec': len(latencies) / elapsed if elapsed else 0.0, **outcomes, 'rtt': rtt}
+
+
+def format_load(results):
+    rtt = results['rtt']
+    return (f"{results['requests']} requests over {results['clients']} connections "
+            f"(window {results['window']}) in {results['wall_seconds']:.2f} s: "
+            f"{results['requests_per_sec']:.0f} requests/s, {results['ok']} ok, {results['failed']} failed\n"
+            f"round trip us: p50 {rtt['p50_us']:.1f}  p99 {rtt['p99_us']:.1f}  p999 {rtt['p999_us']:.1f}  "
+            f"max {rtt['max_us']:.1f}")
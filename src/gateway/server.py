@@ -0,0 +1,316 @@
+import asyncio
+import json
+from datetime import datetime
+from account import from_minor_units
+from events import CANCELLED, FILLED, REJECTED
+from main import order_from_record
+
+# Requests are JSON objects, one per line, with a 'type' and an optional
+# 'id' that the response carries back:
+#   submit       order: an order object as in a batch file (see main.order_from_record)
+#   cancel       account_id, order_id, stop (true for a stop order)
+#   book         ticker, levels (default 10)
+#   account      account_id
+#   subscribe    tickers (optional list; all tickers if left out)
+#   unsubscribe
+# Every response has id, seq (the engine's number for the request), ok and,
+# when ok is false, error. Subscribers are also sent the engine's events
+# (see events.py) as they happen, each with the seq of the request that
+# caused it; events have an 'event' key and responses do not.
+MAX_LINE = 64 * 1024  # longest request accepted, in bytes
+YIELD_EVERY = 64  # the engine lets connections run after this many requests in a row
+# Fields of a submitted order checked here, since the engine expects them
+# to be of these types; a missing field or None is left to the engine
+ORDER_FIELDS = {
+    'action': (str, "text"),
+    'order_type': (str, "text"),
+    'ticker': (str, "text"),
+    'quantity': ((int, float), "a number"),
+    'price': ((int, float), "a number"),
+    'stop_price': ((int, float), "a number"),
+    'timestamp': (str, "ISO date and time text"),
+}
+
+
+class Connection:
+    """A client connection: its responses and events waiting to be written, and its subscription.
+
+    ``inflight`` limits the requests read from the client and not yet
+    answered; a slot is given back when the response has been written, so a
+    client that does not read its responses stops being read from.
+    """
+
+    def __init__(self, writer, max_inflight, outbound_size):
+        self.writer = writer
+        self.inflight = asyncio.Semaphore(max_inflight)
+        self.outbound = asyncio.Queue(outbound_size)
+        self.tickers = None  # tickers subscribed to; empty for all, None when not subscribed
+        self.closed = False
+
+    def send(self, message):
+        """Queue a response or event to be written; False if the queue is full."""
+        try:
+            self.outbound.put_nowait(message)
+        except asyncio.QueueFull:
+            if 'event' not in message:
+                self.inflight.release()
+            return False
+        return True
+
+    def wants(self, event):
+        return self.tickers is not None and (not self.tickers or event.get('ticker') in self.tickers)
+
+
+class Gateway:
+    """Serves the order book to many TCP clients through one engine task.
+
+    Connections only read and write lines; every request goes through one
+    bounded queue to the engine task, which owns the OrderBook and the
+    AccountManager and handles requests one at a time in the order they
+    were queued, numbering them. When the engine falls behind the queue
+    fills up, connections wait to put their requests on it and stop
+    reading, and TCP pushes back on the clients. A subscriber that does not
+    read its events fast enough to keep ``outbound_size`` of them queued is
+    disconnected, so it cannot hold up the engine.
+    """
+
+    def __init__(self, order_book, account_manager, queue_size=1024, max_inflight=64, outbound_size=4096):
+        if outbound_size <= max_inflight:
+            raise ValueError("outbound_size must be larger than max_inflight")
+        self.order_book = order_book
+        self.account_manager = account_manager
+        self.max_inflight = max_inflight
+        self.outbound_size = outbound_size
+        self.requests = asyncio.Queue(queue_size)
+        self.connections = set()
+        self.subscribers = set()
+        self.sequence = 0     # number of the request being handled
+        self.captured = None  # events of the request being handled
+        self.dropped = 0      # connections closed for not reading
+        self._handlers = set()
+        self._server = None
+        self._engine = None
+        self._flusher = None
+        order_book.events.subscribe(self._on_event)
+        metrics = order_book.metrics
+        self._requests_total = metrics.counter('gateway_requests', "Gateway requests handled", ('type',))
+        self._dropped_total = metrics.counter('gateway_dropped_connections',
+                                              "Connections closed for not reading their events")
+        metrics.gauge('gateway_connections', "Open gateway connections",
+                      collect=lambda: {(): len(self.connections)})
+        metrics.gauge('gateway_queue_depth', "Requests waiting for the engine",
+                      collect=lambda: {(): self.requests.qsize()})
+
+    async def start(self, host='127.0.0.1', port=9200):
+        """Start listening and the engine task; port 0 picks a free port, which is then in ``port``."""
+        self._engine = asyncio.create_task(self._run_engine())
+        if self.account_manager.flush_interval > 0:
+            self._flusher = asyncio.create_task(self._flush_accounts())
+        self._server = await asyncio.start_server(self._serve, host, port, limit=MAX_LINE)
+        self.host, self.port = self._server.sockets[0].getsockname()[:2]
+
+    async def serve_forever(self):
+        await self._server.serve_forever()
+
+    async def close(self):
+        """Stop accepting, answer the requests already read, close every connection and stop the engine."""
+        self._server.close()
+        await self._server.wait_closed()
+        for conn in list(self.connections):
+            conn.writer.transport.abort()
+        await asyncio.gather(*self._handlers, return_exceptions=True)
+        tasks = [task for task in (self._engine, self._flusher) if task is not None]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def _serve(self, reader, writer):
+        task = asyncio.current_task()
+        self._handlers.add(task)
+        conn = Connection(writer, self.max_inflight, self.outbound_size)
+        self.connections.add(conn)
+        write_task = asyncio.create_task(self._write_loop(conn))
+        try:
+            while True:
+                try:
+                    line = await reader.readline()
+                except ValueError:
+                    # A request that cannot be read is queued as its error,
+                    # so that it is answered in turn like any other
+                    await conn.inflight.acquire()
+                    await self.requests.put((conn, "Request too long."))
+                    break
+                if not line:
+                    break
+                await conn.inflight.acquire()
+                try:
+                    request = json.loads(line)
+                    if not isinstance(request, dict):
+                        raise ValueError('not an object')
+                except ValueError:
+                    request = "Invalid JSON request."
+                await self.requests.put((conn, request))
+        except ConnectionError:
+            pass
+        finally:
+            # Wait for the answers to the requests already read, then close
+            for _ in range(self.max_inflight):
+                await conn.inflight.acquire()
+            self._unsubscribe(conn)
+            await conn.outbound.put(None)
+            await write_task
+            self.connections.discard(conn)
+            writer.close()
+            self._handlers.discard(task)
+
+    async def _write_loop(self, conn):
+        writer = conn.writer
+        while True:
+            message = await conn.outbound.get()
+            if message is None:
+                return
+            if not conn.closed:
+                try:
+                    writer.write(json.dumps(message, default=str).encode() + b'\n')
+                    if conn.outbound.empty():
+                        await writer.drain()
+                except ConnectionError:
+                    conn.closed = True
+            if 'event' not in message:
+                conn.inflight.release()
+
+    def _drop(self, conn):
+        """Disconnect a client whose queue of responses and events is full."""
+        if conn.closed:
+            return
+        conn.closed = True
+        self._unsubscribe(conn)
+        self.dropped += 1
+        self._dropped_total.inc()
+        conn.writer.transport.abort()
+
+    async def _run_engine(self):
+        handled = 0
+        while True:
+            conn, request = await self.requests.get()
+            self.sequence += 1
+            try:
+                response = self._handle(conn, request)
+            except Exception as e:
+                # A request the engine fails on is answered with the failure;
+                # the engine goes on with the next one
+                request_id = request.get('id') if isinstance(request, dict) else None
+                response = {'id': request_id, 'seq': self.sequence, 'ok': False,
+                            'error': f"Request failed: {type(e).__name__}: {e}"}
+            if not conn.send(response):
+                self._drop(conn)
+            handled += 1
+            if handled % YIELD_EVERY == 0:
+                await asyncio.sleep(0)
+
+    async def _flush_accounts(self):
+        # Account changes are otherwise only written on the next update, so
+        # a quiet gateway would hold them past the flush interval. This runs
+        # between requests, on the loop the engine runs on.
+        while True:
+            await asyncio.sleep(self.account_manager.flush_interval)
+            self.account_manager.flush_if_due()
+
+    def _handle(self, conn, request):
+        if isinstance(request, str):
+            return {'id': None, 'seq': self.sequence, 'ok': False, 'error': request}
+        kind = request.get('type')
+        response = {'id': request.get('id'), 'seq': self.sequence, 'ok': True}
+        handler = self.REQUESTS.get(kind) if isinstance(kind, str) else None
+        if handler is None:
+            response.update(ok=False, error=f"Unknown request type: {kind}")
+            return response
+        self._requests_total.inc((kind,))
+        self.captured = []
+        try:
+            error = handler(self, conn, request, response)
+        finally:
+            self.captured = None
+        if error is not None:
+            response.update(ok=False, error=error)
+        return response
+
+    def _on_event(self, event):
+        event['seq'] = self.sequence
+        if self.captured is not None:
+            self.captured.append(event)
+        for conn in list(self.subscribers):
+            if conn.wants(event) and not conn.send(event):
+                self._drop(conn)
+
+    def _unsubscribe(self, conn):
+        conn.tickers = None
+        self.subscribers.discard(conn)
+
+    # Request handlers fill in the response and return an error message, or None
+
+    def _submit(self, conn, request, response):
+        record = request.get('order')
+        if not isinstance(record, dict):
+            return "'order' must be an order object."
+        for field, (types, described) in ORDER_FIELDS.items():
+            value = record.get(field)
+            if value is not None and (not isinstance(value, types) or isinstance(value, bool)):
+                return f"'{field}' must be {described}."
+        try:
+            order = order_from_record(record)
+        except ValueError:
+            return "'timestamp' must be ISO date and time text."
+        if isinstance(order['timestamp'], datetime) and order['timestamp'].tzinfo is not None:
+            return "'timestamp' must be local time without a UTC offset."
+        order.pop('order_id', None)  # the engine numbers every order
+        if not self.order_book.add_order(order, self.account_manager):
+            return next(event['error'] for event in self.captured if event['event'] == REJECTED)
+        response['order_id'] = order['order_id']
+        response['fills'] = sum(event['event'] == FILLED for event in self.captured)
+
+    def _cancel(self, conn, request, response):
+        account_id, order_id = str(request.get('account_id')), str(request.get('order_id'))
+        if request.get('stop'):
+            self.order_book.cancel_stop_order(account_id, order_id)
+        else:
+            self.order_book.cancel_order(account_id, order_id)
+        if not any(event['event'] == CANCELLED for event in self.captured):
+            return f"Order ID {order_id} not found for Account {account_id}."
+
+    def _book(self, conn, request, response):
+        ticker = str(request.get('ticker', '')).upper()
+        if not self.order_book.stock_info.is_valid_ticker(ticker):
+            return f"{ticker} is not a valid ticker."
+        levels = request.get('levels', 10)
+        if not isinstance(levels, int) or levels <= 0:
+            return "'levels' must be a positive whole number."
+        response['ticker'] = ticker
+        response.update(self.order_book.get_depth(ticker, levels))
+
+    def _account(self, conn, request, response):
+        account_id = str(request.get('account_id'))
+        account = self.account_manager.accounts.get(account_id)
+        if account is None:
+            return f"Account {account_id} does not exist."
+        response.update(account_id=account_id, balance=from_minor_units(account['balance']),
+                        positions=dict(account['positions']))
+
+    def _subscribe(self, conn, request, response):
+        tickers = request.get('tickers') or []
+        if not isinstance(tickers, list):
+            return "'tickers' must be a list."
+        conn.tickers = {str(ticker).upper() for ticker in tickers}
+        self.subscribers.add(conn)
+
+    def _unsubscribe_request(self, conn, request, response):
+        self._unsubscribe(conn)
+
+    REQUESTS = {
+        'submit': _submit,
+        'cancel': _cancel,
+        'book': _book,
+        'account': _account,
+        'subscribe': _subscribe,
+        'unsubscribe': _unsubscribe_request,
+    }
@@ -0,0 +1,280 @@
+import cProfile
+import io
+import pstats
+import time
+import tracemalloc
+import weakref
+from array import array
+
+_MISSING = object()
+# {obj: {method name: (what obj's own attribute held, the method, [layer, ...])}}
+_wrapped_methods = weakref.WeakKeyDictionary()
+
+
+def _wrap(obj, name, wrapper):
+    """Wrap obj.name with wrapper(method); return what to hand _unwrap to take this wrapper off.
+
+    StageStats and OperationProfiler can wrap the same method and be
+    turned off in either order, so the wrappers of a method are kept as
+    layers over the original, and the method is rebuilt from the layers
+    left whenever one is added or taken off.
+    """
+    methods = _wrapped_methods.setdefault(obj, {})
+    if name not in methods:
+        methods[name] = (vars(obj).get(name, _MISSING), getattr(obj, name), [])
+    layer = [wrapper]  # compared by identity, so the same wrapper can be added twice
+    methods[name][2].append(layer)
+    _rebuild(obj, name)
+    return obj, name, layer
+
+
+def _unwrap(obj, name, layer):
+    methods = _wrapped_methods.get(obj, {})
+    if name in methods:
+        layers = methods[name][2]
+        for index, added in enumerate(layers):
+            if added is layer:
+                del layers[index]
+                _rebuild(obj, name)
+                break
+
+
+def _rebuild(obj, name):
+    methods = _wrapped_methods[obj]
+    previous, method, layers = methods[name]
+    if layers:
+        for layer in layers:
+            method = layer[0](method)
+        setattr(obj, name, method)
+        return
+    del methods[name]
+    if previous is not _MISSING:
+        setattr(obj, name, previous)
+    elif name in vars(obj):
+        delattr(obj, name)
+
+
+class LatencyHistogram:
+    """Counts of durations in nanoseconds, in logarithmic buckets.
+
+    Like an HDR histogram, every power of two is split into 2 ** SUB_BITS
+    equal buckets, so a bucket is at most 1 / 2 ** SUB_BITS (12.5%) wider
+    than its lower bound and values below 2 ** (SUB_BITS + 1) ns are exact.
+    Recording is an index computation and an increment, and the size is
+    fixed however many values are recorded.
+    """
+
+    SUB_BITS = 3  # record() has this value written in
+    SUB_BUCKETS = 1 << SUB_BITS
+
+    def __init__(self):
+        self.clear()
+
+    def clear(self):
+        self.counts = array('q', bytes(8 * (64 << self.SUB_BITS)))
+        self.count = 0
+        self.total = 0
+        self.max = 0
+
+    @classmethod
+    def bucket(cls, value):
+        if value < cls.SUB_BUCKETS:
+            return value
+        shift = value.bit_length() - cls.SUB_BITS - 1
+        return ((shift + 1) << cls.SUB_BITS) + (value >> shift) - cls.SUB_BUCKETS
+
+    @classmethod
+    def bucket_high(cls, index):
+        """The largest value that falls in bucket ``index``."""
+        if index < cls.SUB_BUCKETS:
+            return index
+        shift = (index >> cls.SUB_BITS) - 1
+        mantissa = (index & (cls.SUB_BUCKETS - 1)) + cls.SUB_BUCKETS
+        return ((mantissa + 1) << shift) - 1
+
+    def record(self, value):
+        # bucket(value), inlined: this runs for every timed call
+        if value < 8:
+            self.counts[value] += 1
+        else:
+            shift = value.bit_length() - 4
+            self.counts[((shift + 1) << 3) + (value >> shift) - 8] += 1
+        self.count += 1
+        self.total += value
+        if value > self.max:
+            self.max = value
+
+    def percentile(self, pct):
+        """The upper bound of the bucket holding the ``pct`` percentile, or None if nothing was recorded."""
+        if not self.count:
+            return None
+        rank = max(1, -(-self.count * pct // 100))
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank:
+                return min(self.bucket_high(index), self.max)
+        return self.max
+
+    def mean(self):
+        return self.total / self.count if self.count else None
+
+
+class StageStats:
+    """Latency histograms of the stages of order processing.
+
+    ``instrument`` wraps the methods an object lists in its ``STAGES``
+    ({method name: stage}) so that each call is timed with perf_counter_ns
+    and recorded under its stage; ``uninstrument`` puts the methods back.
+    Objects that are not instrumented pay nothing. Stages nest: the time
+    of a stage includes the stages it calls.
+    """
+
+    def __init__(self):
+        self.histograms = {}  # {stage: LatencyHistogram}, in the order stages were first seen
+        self._wrapped = []    # what _unwrap needs to put each instrumented method back
+
+    def histogram(self, stage):
+        histogram = self.histograms.get(stage)
+        if histogram is None:
+            histogram = self.histograms[stage] = LatencyHistogram()
+        return histogram
+
+    def record(self, stage, nanoseconds):
+        self.histogram(stage).record(nanoseconds)
+
+    def instrument(self, obj):
+        for name, stage in obj.STAGES.items():
+            self._wrapped.append(_wrap(obj, name, lambda method, stage=stage: self._timed(method, stage)))
+
+    def uninstrument(self):
+        for wrapped in reversed(self._wrapped):
+            _unwrap(*wrapped)
+        self._wrapped = []
+
+    @property
+    def enabled(self):
+        return bool(self._wrapped)
+
+    @property
+    def recorded(self):
+        return any(histogram.count for histogram in self.histograms.values())
+
+    def reset(self):
+        for histogram in self.histograms.values():
+            histogram.clear()
+
+    def _timed(self, method, stage):
+        clock = time.perf_counter_ns
+        record = self.histogram(stage).record
+
+        def timed(*args, **kwargs):
+            started = clock()
+            try:
+                return method(*args, **kwargs)
+            finally:
+                record(clock() - started)
+        return timed
+
+    def report(self):
+        """The histograms as a table of microseconds, one line per stage."""
+        lines = [f"{'stage':<16}{'count':>9}{'mean us':>10}{'p50 us':>10}{'p99 us':>10}{'p999 us':>10}{'max us':>10}"]
+        for stage, histogram in self.histograms.items():
+            if not histogram.count:
+                continue
+            values = [histogram.mean()] + [histogram.percentile(pct) for pct in (50, 99, 99.9)] + [histogram.max]
+            lines.append(f"{stage:<16}{histogram.count:>9}" + ''.join(f"{value / 1000:>10.1f}" for value in values))
+        return '\n'.join(lines)
+
+
+class OperationProfiler:
+    """Profiles the next ``operations`` calls of an object's entry points, then reports and detaches.
+
+    ``kind`` is 'cpu' for cProfile or 'memory' for tracemalloc. The entry
+    points are wrapped like StageStats does, so the profiler can be attached
+    to a running engine; profiling starts with the first call and stops
+    after the last. The report (the ``limit`` most costly functions or
+    source lines) is printed and kept in ``report``. With ``output`` the
+    cProfile data is also saved there for pstats or snakeviz.
+    """
+
+    ENTRY_POINTS = ('add_order', 'add_orders', 'cancel_order', 'cancel_stop_order', 'update_market_price')
+    KINDS = ('cpu', 'memory')
+
+    def __init__(self, obj, operations, kind='cpu', limit=15, output=None, entry_points=ENTRY_POINTS):
+        if kind not in self.KINDS:
+            raise ValueError(f"Unknown profile kind: {kind}")
+        if operations <= 0:
+            raise ValueError("operations must be positive")
+        self.obj = obj
+        self.operations = operations
+        self.remaining = operations
+        self.kind = kind
+        self.limit = limit
+        self.output = output
+        self.report = None
+        self._profile = None
+        self._snapshot = None
+        self._started_tracing = False
+        self._wrapped = [_wrap(obj, name, self._counted) for name in entry_points if hasattr(obj, name)]
+
+    @property
+    def active(self):
+        return self.remaining > 0
+
+    def _counted(self, method):
+        def counted(*args, **kwargs):
+            if not self.active:
+                return method(*args, **kwargs)
+            if self.remaining == self.operations:
+                self._start()
+            try:
+                return method(*args, **kwargs)
+            finally:
+                self.remaining -= 1
+                if not self.remaining:
+                    self._finish()
+        return counted
+
+    def _start(self):
+        if self.kind == 'cpu':
+            self._profile = cProfile.Profile()
+            self._profile.enable()
+            return
+        if tracemalloc.is_tracing():
+            tracemalloc.reset_peak()
+        else:
+            tracemalloc.start()
+            self._started_tracing = True
+        self._snapshot = tracemalloc.take_snapshot()
+
+    def _finish(self):
+        if self.kind == 'cpu':
+            self._profile.disable()
+            out = io.StringIO()
+            pstats.Stats(self._profile, stream=out).sort_stats('cumulative').print_stats(self.limit)
+            if self.output:
+                self._profile.dump_stats(self.output)
+            self.report = f"CPU profile of {self.operations} operations:\n{out.getvalue().strip()}"
+        else:
+            snapshot = tracemalloc.take_snapshot()
+            peak = tracemalloc.get_traced_memory()[1]
+            if self._started_tracing:
+                tracemalloc.stop()
+            lines = [f"Memory profile of {self.operations} operations (peak {peak / 1024:.1f} KiB traced):"]
+            lines += [str(stat) for stat in snapshot.compare_to(self._snapshot, 'lineno')[:self.limit]]
+            self.report = '\n'.join(lines)
+        self.detach()
+        print(self.report)
+
+    def detach(self):
+        """Stop counting and put the entry points back; an unfinished profile is dropped."""
+        if self.remaining and self.remaining != self.operations:
+            if self.kind == 'cpu':
+                self._profile.disable()
+            elif self._started_tracing:
+                tracemalloc.stop()
+        self.remaining = 0
+        for wrapped in reversed(self._wrapped):
+            _unwrap(*wrapped)
+        self._wrapped = []
@@ -1,317 +1,561 @@
-from stock_info import StockInfo
-from account import AccountManager
-from order_execution import OrderBook
-from datetime import datetime
-import os
-import json
-
-def main():
-    stock_info = StockInfo()
-    account_manager = AccountManager()
-    order_book = OrderBook(stock_info)  # Pass stock_info to OrderBook
-
-    print("Welcome to the Stock Trading Simulator!")
-    print("Type 'help' to see available commands.")
-
-    # Predefined default accounts configuration for resetting:
-    default_accounts = {
-        "1": {
-            "balance": 50000.0,
-            "positions": {
-                "AAPL": 200,
-                "TSLA": 200,
-                "GOOG": 200,
-                "AMZN": 200,
-                "MSFT": 200
-            }
-        },
-        "2": {
-            "balance": 50000.0,
-            "positions": {
-                "AAPL": 200,
-                "TSLA": 200,
-                "GOOG": 200,
-                "AMZN": 200,
-                "MSFT": 200
-            }
-        },
-        "3": {
-            "balance": 50000.0,
-            "positions": {
-                "AAPL": 200,
-                "TSLA": 200,
-                "GOOG": 200,
-                "AMZN": 200,
-                "MSFT": 200
-            }
-        },
-        "999": {
-            "balance": 50000.0,
-            "positions": {
-                "AAPL": 200,
-                "TSLA": 200,
-                "GOOG": 200,
-                "AMZN": 200,
-                "MSFT": 200
-            }
-        }
-    }
-
-    while True:
-        command = input("Enter a command: ").strip()
-        parts = command.split()
-        if not parts:
-            print("Please enter a command. Type 'help' to see available commands.")
-            continue
-
-        cmd = parts[0].lower()
-
-        if cmd == 'help':
-            print("""
-Available Commands:
-- buy <account_id> <ticker> <quantity> [order_type] [price]
-- sell <account_id> <ticker> <quantity> [order_type] [price]
-- stop buy <account_id> <ticker> <quantity> market <stop_price>
-- stop sell <account_id> <ticker> <quantity> market <stop_price>
-- stop buy <account_id> <ticker> <quantity> limit <stop_price> <limit_price>
-- stop sell <account_id> <ticker> <quantity> limit <stop_price> <limit_price>
-- cancel <account_id> <order_id>
-- cancel stop <account_id> <order_id>
-- stock info [<ticker>]
-- account info <account_id>
-- order book
-- order stop book
-- executed trades display
-- executed trades export <filename>
-- executed trades delete <trade_id>
-- reset
-- exit
-""")
-        elif cmd == 'exit':
-            print("Exiting the simulator.")
-            break
-        elif cmd == 'stock':
-            if len(parts) >= 2 and parts[1].lower() == 'info':
-                if len(parts) == 3:
-                    ticker = parts[2].upper()
-                    stock_info.display_stock_info(ticker, order_book)
-                else:
-                    stock_info.display_stocks()
-            else:
-                print("Invalid command. Usage: stock info [<ticker>]")
-        elif cmd == 'account':
-            if len(parts) == 3 and parts[1].lower() == 'info':
-                account_id = parts[2]
-                account_manager.display_account(account_id)
-            else:
-                print("Invalid command. Usage: account info <account_id>")
-        elif cmd == 'order':
-            if len(parts) == 2 and parts[1].lower() == 'book':
-                order_book.display_order_book()
-            elif len(parts) == 3 and parts[1].lower() == 'stop' and parts[2].lower() == 'book':
-                order_book.display_stop_orders()
-            else:
-                print("Invalid command. Usage:")
-                print("  order book")
-                print("  order stop book")
-        elif cmd == 'executed':
-            if len(parts) >= 2 and parts[1].lower() == 'trades':
-                if len(parts) == 3 and parts[2].lower() == 'display':
-                    order_book.display_executed_trades()
-                elif len(parts) == 4 and parts[2].lower() == 'export':
-                    filename = parts[3]
-                    order_book.export_executed_trades(filename)
-                elif len(parts) == 4 and parts[2].lower() == 'delete':
-                    trade_id = parts[3]
-                    order_book.delete_executed_trade(trade_id, account_manager)
-                else:
-                    print("Invalid command. Usage:")
-                    print("  executed trades display")
-                    print("  executed trades export <filename>")
-                    print("  executed trades delete <trade_id>")
-            else:
-                print("Invalid command. Usage:")
-                print("  executed trades display")
-                print("  executed trades export <filename>")
-                print("  executed trades delete <trade_id>")
-        elif cmd == 'cancel':
-            if len(parts) == 3:
-                account_id = parts[1]
-                order_id = parts[2]
-                order_book.cancel_order(account_id, order_id)
-            elif len(parts) == 4 and parts[1].lower() == 'stop':
-                account_id = parts[2]
-                order_id = parts[3]
-                order_book.cancel_stop_order(account_id, order_id)
-            else:
-                print("Invalid command. Usage:")
-                print("  cancel <account_id> <order_id>")
-                print("  cancel stop <account_id> <order_id>")
-        elif cmd == 'stop':
-            if len(parts) >= 6:
-                action = parts[1].lower()
-                if action not in ['buy', 'sell']:
-                    print("Error: Action must be 'buy' or 'sell'.")
-                    continue
-                account_id = parts[2]
-                ticker = parts[3].upper()
-                if not stock_info.is_valid_ticker(ticker):
-                    print(f"Error: {ticker} is not a valid ticker.")
-                    continue
-                try:
-                    quantity = float(parts[4])
-                    if quantity <= 0:
-                        print("Error: Quantity must be positive.")
-                        continue
-                except ValueError:
-                    print("Error: Quantity must be a number.")
-                    continue
-                order_subtype = parts[5].lower()
-                if order_subtype == 'market':
-                    if len(parts) == 7:
-                        try:
-                            stop_price = float(parts[6])
-                            if stop_price <= 0:
-                                print("Error: Stop price must be positive.")
-                                continue
-                        except ValueError:
-                            print("Error: Stop price must be a number.")
-                            continue
-                        order_type = 'stop_market'
-                        price = None
-                    else:
-                        print("Usage: stop buy/sell <account_id> <ticker> <quantity> market <stop_price>")
-                        continue
-                elif order_subtype == 'limit':
-                    if len(parts) == 8:
-                        try:
-                            stop_price = float(parts[6])
-                            limit_price = float(parts[7])
-                            if stop_price <= 0 or limit_price <= 0:
-                                print("Error: Prices must be positive.")
-                                continue
-                        except ValueError:
-                            print("Error: Prices must be numbers.")
-                            continue
-                        order_type = 'stop_limit'
-                        price = limit_price
-                    else:
-                        print("Usage: stop buy/sell <account_id> <ticker> <quantity> limit <stop_price> <limit_price>")
-                        continue
-                else:
-                    print("Error: Order type must be 'market' or 'limit'.")
-                    continue
-                # Create stop order
-                order = {
-                    'action': action,
-                    'account_id': account_id,
-                    'ticker': ticker,
-                    'quantity': quantity,
-                    'order_type': order_type,
-                    'price': price,  # For stop_limit orders
-                    'stop_price': stop_price if order_type.startswith('stop') else None,
-                    'timestamp': datetime.now()
-                }
-                # Assign unique order_id
-                order_id = f"{order['account_id']}_{ticker}_{int(order['timestamp'].timestamp())}"
-                order['order_id'] = order_id
-                # Add order to order book
-                order_added = order_book.add_order(order, account_manager)
-                if not order_added:
-                    continue
-            else:
-                print("Invalid command. Usage:")
-                print("  stop buy/sell <account_id> <ticker> <quantity> market <stop_price>")
-                print("  stop buy/sell <account_id> <ticker> <quantity> limit <stop_price> <limit_price>")
-        elif cmd in ['buy', 'sell']:
-            if len(parts) >= 4:
-                action = cmd
-                account_id = parts[1]
-                ticker = parts[2].upper()
-                if not stock_info.is_valid_ticker(ticker):
-                    print(f"Error: {ticker} is not a valid ticker.")
-                    continue
-                try:
-                    quantity = float(parts[3])
-                    if quantity <= 0:
-                        print("Error: Quantity must be a positive number.")
-                        continue
-                except ValueError:
-                    print("Error: Quantity must be a number.")
-                    continue
-
-                order_type = 'market'
-                price = None
-
-                if len(parts) >= 5:
-                    order_type = parts[4].lower()
-                    if order_type not in ['market', 'limit']:
-                        print("Error: Order type must be 'market' or 'limit'.")
-                        continue
-                if len(parts) == 6:
-                    try:
-                        price = float(parts[5])
-                        if price <= 0:
-                            print("Error: Price must be a positive number.")
-                            continue
-                    except ValueError:
-                        print("Error: Price must be a number.")
-                        continue
-
-                # Create order
-                order = {
-                    'action': action,
-                    'account_id': account_id,
-                    'ticker': ticker,
-                    'quantity': quantity,
-                    'order_type': order_type,
-                    'price': price,
-                    'timestamp': datetime.now()
-                }
-
-                # Validate order
-                if order_type == 'limit' and price is None:
-                    print("Error: Limit orders require a price.")
-                    continue
-                if order_type == 'market' and price is not None:
-                    print("Error: Market orders should not have a price.")
-                    continue
-
-                # Add order to order book
-                order_added = order_book.add_order(order, account_manager)
-                if not order_added:
-                    continue  # Skip to the next command
-
-                # Attempt to match orders immediately
-                order_book.match_orders(ticker, account_manager)
-            else:
-                print("Invalid command. Usage: buy/sell <account_id> <ticker> <quantity> [order_type] [price]")
-        elif cmd == 'reset':
-            if len(parts) == 1:
-                # Remove unmatched_orders and executed_trades files
-                if os.path.exists(order_book.unmatched_orders_file):
-                    os.remove(order_book.unmatched_orders_file)
-                if os.path.exists(order_book.executed_trades_file):
-                    os.remove(order_book.executed_trades_file)
-
-                # Reset in-memory order books
-                order_book.buy_orders = {}
-                order_book.sell_orders = {}
-                order_book.stop_buy_orders = {}
-                order_book.stop_sell_orders = {}
-                order_book.last_trade_price = {}
-
-                # Reset accounts.json to default configuration
-                accounts_file = account_manager.account_file
-                with open(accounts_file, 'w') as f:
-                    json.dump(default_accounts, f, indent=4)
-                account_manager.load_accounts()
-
-                print("All trades cleared and accounts reset to default!")
-            else:
-                print("Invalid command. Usage: reset")
-        else:
-            print("Unknown command. Type 'help' to see available commands.")
-
-if __name__ == '__main__':
-    main()
+from stock_info import StockInfo
+from account import CASH_SCALE, AccountManager
+from order_execution import OrderBook
+from storage import open_storage
+from events import ConsolePrinter, EventFileWriter, EventSink
+from instrumentation import OperationProfiler, StageStats
+from metrics import MetricsRegistry, MetricsServer
+from datetime import datetime
+import argparse
+import json
+import sys
+import time
+
+TRADE_QUERY_KEYS = {'ticker': 'ticker', 'account': 'account_id', 'from': 'start', 'to': 'end', 'limit': 'limit'}
+
+def parse_trade_query(args):
+    """Turn ``key=value`` words into query_executed_trades() arguments; None if they are invalid."""
+    filters = {}
+    for arg in args:
+        key, sep, value = arg.partition('=')
+        key = key.lower()
+        if not sep or not value or key not in TRADE_QUERY_KEYS:
+            print(f"Error: invalid query filter '{arg}'. Use ticker=, account=, from=, to= or limit=.")
+            return None
+        if key == 'ticker':
+            value = value.upper()
+        elif key in ('from', 'to'):
+            try:
+                value = datetime.fromisoformat(value)
+            except ValueError:
+                print(f"Error: '{value}' is not a date or time (use YYYY-MM-DD or YYYY-MM-DDTHH:MM:SS).")
+                return None
+        elif key == 'limit':
+            if not value.isdigit() or int(value) == 0:
+                print("Error: 'limit' must be a positive whole number.")
+                return None
+            value = int(value)
+        filters[TRADE_QUERY_KEYS[key]] = value
+    return filters
+
+def parse_display_options(args):
+    """Turn ``--page N --limit N --tail N`` into display_executed_trades() arguments; None if invalid."""
+    options = {}
+    if len(args) % 2:
+        print("Error: each of --page, --limit and --tail needs a number.")
+        return None
+    for name, value in zip(args[::2], args[1::2]):
+        name = name.lower()
+        if name not in ('--page', '--limit', '--tail'):
+            print(f"Error: unknown option '{name}'. Use --page, --limit or --tail.")
+            return None
+        if not value.isdigit() or int(value) == 0:
+            print(f"Error: '{name}' must be a positive whole number.")
+            return None
+        options[name[2:]] = int(value)
+    if 'tail' in options and len(options) > 1:
+        print("Error: --tail cannot be combined with --page or --limit.")
+        return None
+    return options
+
+def order_from_record(record):
+    """An order dict from a decoded JSON order object; ValueError if it is not one.
+
+    ``timestamp`` may be given as ISO text and defaults to ``time.time_ns()``; tickers are
+    upper-cased and account IDs read as text. The fields are checked when
+    the order is added to the book.
+    """
+    if not isinstance(record, dict):
+        raise ValueError('not an object')
+    order = dict(record)
+    if order.get('timestamp') is None:
+        order['timestamp'] = time.time_ns()
+    elif isinstance(order['timestamp'], str):
+        order['timestamp'] = datetime.fromisoformat(order['timestamp'])
+    if isinstance(order.get('ticker'), str):
+        order['ticker'] = order['ticker'].upper()
+    if order.get('account_id') is not None:
+        order['account_id'] = str(order['account_id'])
+    return order
+
+def read_order_batch(filename):
+    """Read orders from a JSON Lines file, one order object per line; None if the file cannot be used.
+
+    Each line is read with order_from_record.
+    """
+    orders = []
+    try:
+        with open(filename) as f:
+            for line_number, line in enumerate(f, 1):
+                if not line.strip():
+                    continue
+                try:
+                    orders.append(order_from_record(json.loads(line)))
+                except ValueError:
+                    print(f"Error: line {line_number} of {filename} is not a valid order.")
+                    return None
+    except OSError as e:
+        print(f"Error: cannot read {filename}: {e.strerror}.")
+        return None
+    return orders
+
+# Predefined default accounts configuration for resetting:
+DEFAULT_ACCOUNTS = {
+    account_id: {
+        "balance": 50000 * CASH_SCALE,
+        "positions": {"AAPL": 200, "TSLA": 200, "GOOG": 200, "AMZN": 200, "MSFT": 200}
+    }
+    for account_id in ("1", "2", "3", "999")
+}
+
+HELP_TEXT = """
+Available Commands:
+- buy <account_id> <ticker> <quantity> [order_type] [price]
+- sell <account_id> <ticker> <quantity> [order_type] [price]
+- stop buy <account_id> <ticker> <quantity> market <stop_price>
+- stop sell <account_id> <ticker> <quantity> market <stop_price>
+- stop buy <account_id> <ticker> <quantity> limit <stop_price> <limit_price>
+- stop sell <account_id> <ticker> <quantity> limit <stop_price> <limit_price>
+- cancel <account_id> <order_id>
+- cancel stop <account_id> <order_id>
+- batch <filename>
+- stats [on|off|reset]
+- profile <operations> [cpu|memory] [<filename>]
+- metrics
+- stock info [<ticker>]
+- account info <account_id>
+- order book
+- order stop book
+- executed trades display [--page <n>] [--limit <n>] [--tail <n>]
+- executed trades query [ticker=<ticker>] [account=<account_id>] [from=<time>] [to=<time>] [limit=<n>]
+- executed trades export <filename> [--format text|csv|jsonl]
+- executed trades delete <trade_id>
+- reset
+- exit
+"""
+
+class Session:
+    """The simulator's state as seen by the commands, with the counts reported by --summary."""
+
+    def __init__(self, stock_info, storage, account_manager, order_book):
+        self.stock_info = stock_info
+        self.storage = storage
+        self.account_manager = account_manager
+        self.order_book = order_book
+        self.commands = 0
+        self.orders = 0    # orders sent to the book
+        self.rejected = 0  # orders the book refused
+        self.stats = StageStats()
+        self.profiler = None  # OperationProfiler attached by the profile command
+        self.metrics_server = None  # MetricsServer started by --metrics-port
+
+    def submit(self, order):
+        self.orders += 1
+        if not self.order_book.add_order(order, self.account_manager):
+            self.rejected += 1
+
+    def close(self):
+        self.account_manager.sync()
+        self.storage.close()
+        self.order_book.events.close()
+        if self.metrics_server is not None:
+            self.metrics_server.close()
+
+def do_help(session, parts):
+    print(HELP_TEXT)
+
+def do_exit(session, parts):
+    print("Exiting the simulator.")
+    return False
+
+def do_stock(session, parts):
+    if len(parts) >= 2 and parts[1].lower() == 'info':
+        if len(parts) == 3:
+            ticker = parts[2].upper()
+            session.stock_info.display_stock_info(ticker, session.order_book)
+        else:
+            session.stock_info.display_stocks()
+    else:
+        print("Invalid command. Usage: stock info [<ticker>]")
+
+def do_account(session, parts):
+    if len(parts) == 3 and parts[1].lower() == 'info':
+        account_id = parts[2]
+        session.account_manager.display_account(account_id)
+    else:
+        print("Invalid command. Usage: account info <account_id>")
+
+def do_order(session, parts):
+    if len(parts) == 2 and parts[1].lower() == 'book':
+        session.order_book.display_order_book()
+    elif len(parts) == 3 and parts[1].lower() == 'stop' and parts[2].lower() == 'book':
+        session.order_book.display_stop_orders()
+    else:
+        print("Invalid command. Usage:")
+        print("  order book")
+        print("  order stop book")
+
+def do_executed(session, parts):
+    order_book = session.order_book
+    if len(parts) >= 3 and parts[1].lower() == 'trades':
+        subcommand = parts[2].lower()
+        if subcommand == 'display':
+            options = parse_display_options(parts[3:])
+            if options is not None:
+                order_book.display_executed_trades(**options)
+            return
+        if subcommand == 'export' and len(parts) == 4:
+            order_book.export_executed_trades(parts[3])
+            return
+        if subcommand == 'export' and len(parts) == 6 and parts[4].lower() == '--format':
+            order_book.export_executed_trades(parts[3], parts[5].lower())
+            return
+        if subcommand == 'delete' and len(parts) == 4:
+            order_book.delete_executed_trade(parts[3], session.account_manager)
+            return
+        if subcommand == 'query':
+            filters = parse_trade_query(parts[3:])
+            if filters is not None:
+                order_book.display_executed_trades(order_book.query_executed_trades(**filters))
+            return
+    print("Invalid command. Usage:")
+    print("  executed trades display [--page <n>] [--limit <n>] [--tail <n>]")
+    print("  executed trades query [ticker=<ticker>] [account=<account_id>] [from=<time>] [to=<time>] [limit=<n>]")
+    print("  executed trades export <filename> [--format text|csv|jsonl]")
+    print("  executed trades delete <trade_id>")
+
+def do_cancel(session, parts):
+    if len(parts) == 3:
+        account_id = parts[1]
+        order_id = parts[2]
+        session.order_book.cancel_order(account_id, order_id)
+    elif len(parts) == 4 and parts[1].lower() == 'stop':
+        account_id = parts[2]
+        order_id = parts[3]
+        session.order_book.cancel_stop_order(account_id, order_id)
+    else:
+        print("Invalid command. Usage:")
+        print("  cancel <account_id> <order_id>")
+        print("  cancel stop <account_id> <order_id>")
+
+def do_batch(session, parts):
+    if len(parts) != 2:
+        print("Invalid command. Usage: batch <filename>")
+        return
+    orders = read_order_batch(parts[1])
+    if orders is None:
+        return
+    results = session.order_book.add_orders(orders, session.account_manager)
+    accepted = sum(result['accepted'] for result in results)
+    session.orders += len(results)
+    session.rejected += len(results) - accepted
+    for line, result in enumerate(results, 1):
+        if not result['accepted']:
+            print(f"Order {line} rejected: {result['error']}")
+    print(f"Batch done: {accepted} of {len(results)} orders accepted.")
+
+def do_stats(session, parts):
+    stats = session.stats
+    option = parts[1].lower() if len(parts) == 2 else None
+    if len(parts) == 1:
+        if stats.recorded:
+            print(stats.report())
+        elif stats.enabled:
+            print("No stage timings yet.")
+        else:
+            print("Stage timing is off. Type 'stats on' to turn it on.")
+    elif option == 'on':
+        if not stats.enabled:
+            stats.instrument(session.order_book)
+            stats.instrument(session.account_manager)
+        print("Stage timing on.")
+    elif option == 'off':
+        stats.uninstrument()
+        print("Stage timing off.")
+    elif option == 'reset':
+        stats.reset()
+        print("Stage timings cleared.")
+    else:
+        print("Invalid command. Usage: stats [on|off|reset]")
+
+def do_profile(session, parts):
+    if not 2 <= len(parts) <= 4 or not parts[1].isdigit() or int(parts[1]) == 0:
+        print("Invalid command. Usage: profile <operations> [cpu|memory] [<filename>]")
+        return
+    kind = parts[2].lower() if len(parts) >= 3 else 'cpu'
+    if kind not in OperationProfiler.KINDS:
+        print("Error: the profile kind must be 'cpu' or 'memory'.")
+        return
+    output = parts[3] if len(parts) == 4 else None
+    if output and kind != 'cpu':
+        print("Error: only a cpu profile can be saved to a file.")
+        return
+    if session.profiler is not None:
+        session.profiler.detach()
+    session.profiler = OperationProfiler(session.order_book, int(parts[1]), kind, output=output)
+    print(f"Profiling the {kind} use of the next {parts[1]} operations.")
+
+def do_metrics(session, parts):
+    if len(parts) != 1:
+        print("Invalid command. Usage: metrics")
+        return
+    print(session.order_book.metrics.render(), end='')
+
+def do_stop(session, parts):
+    if len(parts) < 6:
+        print("Invalid command. Usage:")
+        print("  stop buy/sell <account_id> <ticker> <quantity> market <stop_price>")
+        print("  stop buy/sell <account_id> <ticker> <quantity> limit <stop_price> <limit_price>")
+        return
+    action = parts[1].lower()
+    if action not in ['buy', 'sell']:
+        print("Error: Action must be 'buy' or 'sell'.")
+        return
+    account_id = parts[2]
+    ticker = parts[3].upper()
+    if not session.stock_info.is_valid_ticker(ticker):
+        print(f"Error: {ticker} is not a valid ticker.")
+        return
+    try:
+        quantity = float(parts[4])
+        if quantity <= 0:
+            print("Error: Quantity must be positive.")
+            return
+    except ValueError:
+        print("Error: Quantity must be a number.")
+        return
+    order_subtype = parts[5].lower()
+    if order_subtype == 'market':
+        if len(parts) != 7:
+            print("Usage: stop buy/sell <account_id> <ticker> <quantity> market <stop_price>")
+            return
+        try:
+            stop_price = float(parts[6])
+            if stop_price <= 0:
+                print("Error: Stop price must be positive.")
+                return
+        except ValueError:
+            print("Error: Stop price must be a number.")
+            return
+        order_type = 'stop_market'
+        price = None
+    elif order_subtype == 'limit':
+        if len(parts) != 8:
+            print("Usage: stop buy/sell <account_id> <ticker> <quantity> limit <stop_price> <limit_price>")
+            return
+        try:
+            stop_price = float(parts[6])
+            limit_price = float(parts[7])
+            if stop_price <= 0 or limit_price <= 0:
+                print("Error: Prices must be positive.")
+                return
+        except ValueError:
+            print("Error: Prices must be numbers.")
+            return
+        order_type = 'stop_limit'
+        price = limit_price
+    else:
+        print("Error: Order type must be 'market' or 'limit'.")
+        return
+    # Create stop order
+    session.submit({
+        'action': action,
+        'account_id': account_id,
+        'ticker': ticker,
+        'quantity': quantity,
+        'order_type': order_type,
+        'price': price,  # For stop_limit orders
+        'stop_price': stop_price,
+        'timestamp': time.time_ns()
+    })
+
+def do_buy_sell(session, parts):
+    if len(parts) < 4:
+        print("Invalid command. Usage: buy/sell <account_id> <ticker> <quantity> [order_type] [price]")
+        return
+    action = parts[0].lower()
+    account_id = parts[1]
+    ticker = parts[2].upper()
+    if not session.stock_info.is_valid_ticker(ticker):
+        print(f"Error: {ticker} is not a valid ticker.")
+        return
+    try:
+        quantity = float(parts[3])
+        if quantity <= 0:
+            print("Error: Quantity must be a positive number.")
+            return
+    except ValueError:
+        print("Error: Quantity must be a number.")
+        return
+
+    order_type = 'market'
+    price = None
+
+    if len(parts) >= 5:
+        order_type = parts[4].lower()
+        if order_type not in ['market', 'limit']:
+            print("Error: Order type must be 'market' or 'limit'.")
+            return
+    if len(parts) == 6:
+        try:
+            price = float(parts[5])
+            if price <= 0:
+                print("Error: Price must be a positive number.")
+                return
+        except ValueError:
+            print("Error: Price must be a number.")
+            return
+
+    # Validate order
+    if order_type == 'limit' and price is None:
+        print("Error: Limit orders require a price.")
+        return
+    if order_type == 'market' and price is not None:
+        print("Error: Market orders should not have a price.")
+        return
+
+    # Add order to order book; it is matched as soon as it is added
+    session.submit({
+        'action': action,
+        'account_id': account_id,
+        'ticker': ticker,
+        'quantity': quantity,
+        'order_type': order_type,
+        'price': price,
+        'timestamp': time.time_ns()
+    })
+
+def do_reset(session, parts):
+    if len(parts) != 1:
+        print("Invalid command. Usage: reset")
+        return
+    # Clear the order book and executed trades, in memory and on disk
+    session.order_book.reset()
+
+    # Reset the accounts to the default configuration
+    session.account_manager.reset_accounts(DEFAULT_ACCOUNTS)
+
+    print("All trades cleared and accounts reset to default!")
+
+# Command word -> handler(session, parts). A handler returns False to end the session.
+COMMANDS = {
+    'help': do_help,
+    'exit': do_exit,
+    'stock': do_stock,
+    'account': do_account,
+    'order': do_order,
+    'executed': do_executed,
+    'cancel': do_cancel,
+    'batch': do_batch,
+    'stats': do_stats,
+    'profile': do_profile,
+    'metrics': do_metrics,
+    'stop': do_stop,
+    'buy': do_buy_sell,
+    'sell': do_buy_sell,
+    'reset': do_reset,
+}
+
+def prompt_lines():
+    """Commands typed at the prompt, until end of input."""
+    while True:
+        try:
+            yield input("Enter a command: ")
+        except EOFError:
+            return
+
+def run_commands(session, lines, interactive=True):
+    """Run each command line through COMMANDS until the input ends or a command ends the session.
+
+    Outside interactive mode blank lines and ``#`` comments are skipped quietly.
+    """
+    for line in lines:
+        parts = line.split()
+        if not parts or (not interactive and parts[0].startswith('#')):
+            if interactive:
+                print("Please enter a command. Type 'help' to see available commands.")
+            continue
+        session.commands += 1
+        handler = COMMANDS.get(parts[0].lower())
+        if handler is None:
+            print("Unknown command. Type 'help' to see available commands.")
+        elif handler(session, parts) is False:
+            break
+
+def print_summary(session, elapsed):
+    order_book = session.order_book
+    rate = session.orders / elapsed if elapsed > 0 else 0.0
+    print(f"Summary: {session.commands} commands, {session.orders} orders "
+          f"({session.orders - session.rejected} accepted, {session.rejected} rejected), "
+          f"{order_book.fill_count} fills in {elapsed:.3f} s ({rate:.0f} orders/s).")
+
+def main(storage_kind='json', db_path=None, trade_log='jsonl', script=None, quiet=False, summary=False,
+         event_log=None, stats=False, metrics_port=None):
+    """Run the simulator on commands from ``script`` (a file name, or '-' for stdin) or the prompt.
+
+    Commands are read from stdin without a prompt when it is not a terminal.
+    ``quiet`` leaves out the per-order messages, ``summary`` prints the
+    counts and throughput of the session when it ends, and ``event_log``
+    names a JSON Lines file that every engine event is appended to.
+    ``stats`` turns stage timing on from the start, and ``metrics_port``
+    serves the engine's metrics at http://127.0.0.1:<port>/metrics.
+    """
+    stock_info = StockInfo()
+    storage = open_storage(storage_kind, db_path, trade_log)
+    metrics = MetricsRegistry()
+    account_manager = AccountManager(storage=storage, metrics=metrics)
+    events = EventSink([ConsolePrinter(quiet=quiet)])
+    if event_log is not None:
+        events.subscribe(EventFileWriter(event_log))
+    order_book = OrderBook(stock_info, storage=storage, events=events, metrics=metrics)  # Pass stock_info to OrderBook
+    session = Session(stock_info, storage, account_manager, order_book)
+    if metrics_port is not None:
+        session.metrics_server = MetricsServer(metrics, metrics_port)
+        print(f"Serving metrics at {session.metrics_server.url}")
+    if stats:
+        session.stats.instrument(order_book)
+        session.stats.instrument(account_manager)
+
+    if script is None and sys.stdin.isatty():
+        print("Welcome to the Stock Trading Simulator!")
+        print("Type 'help' to see available commands.")
+
+    started = time.perf_counter()
+    try:
+        if script is None and sys.stdin.isatty():
+            run_commands(session, prompt_lines())
+        elif script is None or script == '-':
+            run_commands(session, sys.stdin, interactive=False)
+        else:
+            with open(script) as f:
+                run_commands(session, f, interactive=False)
+    finally:
+        elapsed = time.perf_counter() - started
+        session.close()
+    if summary:
+        print_summary(session, elapsed)
+        if session.stats.recorded:
+            print(session.stats.report())
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Stock Trading Simulator")
+    parser.add_argument('--storage', choices=('json', 'sqlite', 'memory'), default='json',
+                        help="where orders, trades and accounts are kept (default: json files)")
+    parser.add_argument('--db', help="database file for --storage sqlite (default: trading.db)")
+    parser.add_argument('--trade-log', choices=('jsonl', 'binary'), default='jsonl',
+                        help="format of the executed trades file for --storage json (default: jsonl)")
+    parser.add_argument('--script', metavar='FILE',
+                        help="run the commands in FILE ('-' for stdin) instead of prompting for them")
+    parser.add_argument('--quiet', action='store_true',
+                        help="do not print a message for every order, fill and stop trigger")
+    parser.add_argument('--summary', action='store_true',
+                        help="print the number of commands, orders, rejects and fills and the throughput at the end")
+    parser.add_argument('--event-log', metavar='FILE',
+                        help="also append every order, fill, trigger and cancel event to FILE as JSON Lines")
+    parser.add_argument('--stats', action='store_true',
+                        help="time each stage of order processing from the start (see the stats command)")
+    parser.add_argument('--metrics-port', type=int, metavar='PORT',
+                        help="serve the engine's metrics for Prometheus at http://127.0.0.1:PORT/metrics")
+    args = parser.parse_args()
+    main(args.storage, args.db, args.trade_log, args.script, args.quiet, args.summary, args.event_log, args.stats,
+         args.metrics_port)
@@ -0,0 +1,223 @@
+import threading
+from bisect import bisect_left
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+# Upper bounds, in seconds, of the latency histogram buckets: journal
+# flushes take microseconds, checkpoints and database commits milliseconds.
+LATENCY_BUCKETS = (0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005,
+                   0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _labels(names, values, extra=''):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _number(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metric:
+    """A named family of samples, one per tuple of label values."""
+
+    TYPE = None
+    SUFFIX = ''  # added to the name to make the family name exposed
+
+    def __init__(self, name, help, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+
+    def samples(self):
+        """(suffix, label values, extra label text, value) for every sample to expose."""
+        raise NotImplementedError
+
+    def render(self):
+        family = self.name + self.SUFFIX
+        lines = [f"# HELP {family} {self.help}", f"# TYPE {family} {self.TYPE}"]
+        for suffix, values, extra, value in self.samples():
+            lines.append(f"{family}{suffix}{_labels(self.labelnames, values, extra)} {_number(value)}")
+        return lines
+
+
+class Counter(Metric):
+    """A total that only goes up, such as orders or fills.
+
+    ``inc`` is a dict update, cheap enough to call for every order. It is
+    exposed as the ``<name>_total`` family, as Prometheus clients do, so the
+    TYPE line names the samples.
+    """
+
+    TYPE = 'counter'
+    SUFFIX = '_total'
+
+    def __init__(self, name, help, labelnames=()):
+        super().__init__(name, help, labelnames)
+        self.values = {}  # {label values: total}
+
+    def inc(self, labels=(), amount=1):
+        values = self.values
+        values[labels] = values.get(labels, 0) + amount
+
+    def value(self, labels=()):
+        return self.values.get(labels, 0)
+
+    def samples(self):
+        values = sorted(list(self.values.items())) or ([((), 0)] if not self.labelnames else [])
+        return [('', labels, '', value) for labels, value in values]
+
+
+class Gauge(Metric):
+    """A value that goes up and down.
+
+    It is either set by the engine or, with ``collect``, read when the
+    metrics are rendered: ``collect()`` returns {label values: value}, which
+    suits state the engine already keeps, such as the size of the book.
+    """
+
+    TYPE = 'gauge'
+
+    def __init__(self, name, help, labelnames=(), collect=None):
+        super().__init__(name, help, labelnames)
+        self.values = {}
+        self.collect = collect
+
+    def set(self, value, labels=()):
+        self.values[labels] = value
+
+    def value(self, labels=()):
+        values = self.collect() if self.collect is not None else self.values
+        return values.get(labels, 0)
+
+    def samples(self):
+        values = self.collect() if self.collect is not None else self.values
+        return [('', labels, '', value) for labels, value in sorted(list(values.items()))]
+
+
+class Histogram(Metric):
+    """Counts of observations in fixed buckets, with their sum, like Prometheus client histograms.
+
+    ``buckets`` are the ascending upper bounds; the +Inf bucket is added.
+    """
+
+    TYPE = 'histogram'
+
+    def __init__(self, name, help, labelnames=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(buckets)
+        self.series = {}  # {label values: [counts per bucket and +Inf, sum]}
+
+    def observe(self, value, labels=()):
+        series = self.series.get(labels)
+        if series is None:
+            series = self.series[labels] = [0] * (len(self.buckets) + 2)
+        series[bisect_left(self.buckets, value)] += 1
+        series[-1] += value
+
+    def count(self, labels=()):
+        series = self.series.get(labels)
+        return sum(series[:-1]) if series else 0
+
+    def samples(self):
+        samples = []
+        for labels, series in sorted(list(self.series.items())):
+            series = list(series)
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), series):
+                cumulative += count
+                samples.append(('_bucket', labels, f'le="{_number(float(bound))}"', cumulative))
+            samples.append(('_sum', labels, '', series[-1]))
+            samples.append(('_count', labels, '', cumulative))
+        return samples
+
+
+class MetricsRegistry:
+    """The engine's metrics, rendered together in the Prometheus text exposition format.
+
+    ``counter``, ``gauge`` and ``histogram`` return the metric of that name,
+    creating it the first time, so a book and an account manager (or a book
+    made again after a reset) can share one registry.
+    """
+
+    def __init__(self):
+        self.metrics = {}  # {name: Metric}, in the order they were created
+        self._lock = threading.Lock()
+
+    def _get(self, cls, name, *args, **kwargs):
+        with self._lock:
+            metric = self.metrics.get(name)
+            if metric is None:
+                metric = self.metrics[name] = cls(name, *args, **kwargs)
+            elif not isinstance(metric, cls):
+                raise ValueError(f"Metric {name} is already registered as a {metric.TYPE}")
+            return metric
+
+    def counter(self, name, help, labelnames=()):
+        return self._get(Counter, name, help, labelnames)
+
+    def gauge(self, name, help, labelnames=(), collect=None):
+        gauge = self._get(Gauge, name, help, labelnames)
+        if collect is not None:
+            gauge.collect = collect
+        return gauge
+
+    def histogram(self, name, help, labelnames=(), buckets=LATENCY_BUCKETS):
+        return self._get(Histogram, name, help, labelnames, buckets)
+
+    def render(self):
+        with self._lock:
+            metrics = list(self.metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split('?')[0] not in ('/', '/metrics'):
+            self.send_error(404)
+            return
+        body = self.server.registry.render().encode()
+        self.send_response(200)
+        self.send_header('Content-Type', CONTENT_TYPE)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass  # scrapes would otherwise be logged to the console
+
+
+class MetricsServer:
+    """Serves a registry at http://host:port/metrics from a background thread.
+
+    It listens on localhost by default; port 0 picks a free port, which is
+    then in ``port``.
+    """
+
+    def __init__(self, registry, port=9108, host='127.0.0.1'):
+        self._server = ThreadingHTTPServer((host, port), _MetricsHandler)
+        self._server.daemon_threads = True
+        self._server.registry = registry
+        self.host, self.port = self._server.server_address[:2]
+        self._thread = threading.Thread(target=self._server.serve_forever, name='metrics-server', daemon=True)
+        self._thread.start()
+
+    @property
+    def url(self):
+        return f"http://{self.host}:{self.port}/metrics"
+
+    def close(self):
+        self._server.shutdown()
+        self._server.server_close()
+        self._thread.join()
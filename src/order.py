@@ -0,0 +1,151 @@
+from enum import IntEnum
+from trade_index import format_timestamp, to_ns
+
+
+class Side(IntEnum):
+    BUY = 0
+    SELL = 1
+
+
+class OrderType(IntEnum):
+    MARKET = 0
+    LIMIT = 1
+    STOP_MARKET = 2
+    STOP_LIMIT = 3
+
+
+SIDE_NAMES = ('buy', 'sell')
+ORDER_TYPE_NAMES = ('market', 'limit', 'stop_market', 'stop_limit')
+SIDES = {name: Side(value) for value, name in enumerate(SIDE_NAMES)}
+ORDER_TYPES = {name: OrderType(value) for value, name in enumerate(ORDER_TYPE_NAMES)}
+
+# Keys of the dict form of an order that map straight onto Order attributes
+_ATTRIBUTE_KEYS = ('order_id', 'account_id', 'ticker', 'quantity', 'price', 'stop_price', 'timestamp')
+
+
+class Order:
+    """Compact record for an order held by the OrderBook.
+
+    Orders arrive and are persisted as dicts; inside the book they are kept
+    as slotted objects with small-int enums for the side and order type.
+    ``from_dict`` and ``to_dict`` convert at the edges, and item access
+    (``order['price']``, ``order.get('action')``) is supported so code that
+    reads orders as dicts keeps working. Keys that are not part of the
+    record are kept in ``extra`` and written back out unchanged.
+
+    ``price`` and ``stop_price`` are in currency units, as the order came
+    in. The book sets ``price_ticks`` and ``stop_ticks``, the same prices
+    as whole numbers of ticks, and matches on those. ``timestamp`` is in
+    nanoseconds since 1970 (``time.time_ns()``); dicts may give it as a
+    datetime or ISO text, and ``to_dict`` writes ISO text in local time.
+    """
+    __slots__ = ('order_id', 'account_id', 'ticker', 'side', 'order_type',
+                 'quantity', 'price', 'stop_price', 'timestamp', 'extra',
+                 'price_ticks', 'stop_ticks')
+
+    def __init__(self, order_id, account_id, ticker, side, order_type, quantity,
+                 price=None, stop_price=None, timestamp=None, extra=None,
+                 price_ticks=None, stop_ticks=None):
+        self.order_id = order_id
+        self.account_id = account_id
+        self.ticker = ticker
+        self.side = side
+        self.order_type = order_type
+        self.quantity = quantity
+        self.price = price
+        self.stop_price = stop_price
+        self.timestamp = timestamp
+        self.extra = extra
+        self.price_ticks = price_ticks
+        self.stop_ticks = stop_ticks
+
+    @classmethod
+    def from_dict(cls, data):
+        timestamp = data.get('timestamp')
+        if timestamp is not None:
+            timestamp = to_ns(timestamp)
+        known = ('action', 'order_type') + _ATTRIBUTE_KEYS
+        extra = {key: value for key, value in data.items() if key not in known}
+        return cls(
+            order_id=data.get('order_id'),
+            account_id=data.get('account_id'),
+            ticker=data.get('ticker'),
+            side=SIDES[data['action']],
+            order_type=ORDER_TYPES[data['order_type']],
+            quantity=data.get('quantity'),
+            price=data.get('price'),
+            stop_price=data.get('stop_price'),
+            timestamp=timestamp,
+            extra=extra or None
+        )
+
+    def to_dict(self):
+        """JSON-ready dict in the format used by unmatched_orders.json."""
+        data = {
+            'action': SIDE_NAMES[self.side],
+            'account_id': self.account_id,
+            'ticker': self.ticker,
+            'quantity': self.quantity,
+            'order_type': ORDER_TYPE_NAMES[self.order_type],
+            'price': self.price,
+        }
+        if self.stop_price is not None:
+            data['stop_price'] = self.stop_price
+        data['timestamp'] = format_timestamp(self.timestamp)
+        data['order_id'] = self.order_id
+        if self.extra:
+            data.update(self.extra)
+        return data
+
+    @property
+    def action(self):
+        return SIDE_NAMES[self.side]
+
+    @property
+    def type_name(self):
+        return ORDER_TYPE_NAMES[self.order_type]
+
+    def triggered(self):
+        """The market or limit order a triggered stop order turns into."""
+        if self.order_type == OrderType.STOP_MARKET:
+            order_type, price, price_ticks = OrderType.MARKET, None, None
+        else:
+            order_type, price, price_ticks = OrderType.LIMIT, self.price, self.price_ticks
+        return Order(self.order_id, self.account_id, self.ticker, self.side, order_type,
+                     self.quantity, price, self.stop_price, self.timestamp,
+                     dict(self.extra) if self.extra else None, price_ticks, self.stop_ticks)
+
+    def __getitem__(self, key):
+        if key == 'action':
+            return SIDE_NAMES[self.side]
+        if key == 'order_type':
+            return ORDER_TYPE_NAMES[self.order_type]
+        if key in _ATTRIBUTE_KEYS:
+            return getattr(self, key)
+        if self.extra and key in self.extra:
+            return self.extra[key]
+        raise KeyError(key)
+
+    def __setitem__(self, key, value):
+        if key == 'action':
+            self.side = SIDES[value]
+        elif key == 'order_type':
+            self.order_type = ORDER_TYPES[value]
+        elif key in _ATTRIBUTE_KEYS:
+            setattr(self, key, value)
+        else:
+            if self.extra is None:
+                self.extra = {}
+            self.extra[key] = value
+
+    def __contains__(self, key):
+        return key in ('action', 'order_type') or key in _ATTRIBUTE_KEYS or bool(self.extra and key in self.extra)
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def __repr__(self):
+        return f"Order({self.to_dict()!r})"
@@ -1,120 +1,395 @@
-from collections import deque
+import csv
+import itertools
 import json
-import os
+import time
+from collections import deque
 from datetime import datetime
-import uuid  # For generating unique trade IDs
+from account import CASH_SCALE
+from book_side import BookSide
+from events import ACCEPTED, CANCELLED, CASCADE, FILLED, REJECTED, TRIGGERED, ConsolePrinter, EventSink
+from metrics import MetricsRegistry
+from order import Order, OrderType
+from sequence import IdSequence
+from stop_book import StopOrders
+from storage import JsonStorage
+from trade_index import format_timestamp, to_ns
 
 class OrderBook:
+    PAGE_SIZE = 20
+    EXPORT_FORMATS = ('text', 'csv', 'jsonl')
+    EXPORT_FIELDS = ('trade_id', 'timestamp', 'ticker', 'price', 'quantity', 'buy_account_id', 'sell_account_id')
+    EXPORT_CHUNK = 1000  # trades formatted per write
+    # Methods timed by instrumentation.StageStats, as {method name: stage}.
+    # submit covers validate, place, match and persist; match covers the
+    # find_match, settle, trade_save and stops stages of each fill.
+    STAGES = {
+        'add_order': 'submit',
+        'add_orders': 'submit_batch',
+        '_validate_order': 'validate',
+        '_place_order': 'place',
+        '_run_cascade': 'match',
+        '_find_match': 'find_match',
+        '_settle': 'settle',
+        'save_executed_trade': 'trade_save',
+        '_trigger_stops': 'stops',
+        '_persist_changes': 'persist',
+        '_checkpoint_ticker': 'checkpoint',
+        'cancel_order': 'cancel',
+        'cancel_stop_order': 'cancel',
+    }
+
     def __init__(self, stock_info, unmatched_orders_file='unmatched_orders.json',
-                 executed_trades_file='executed_trades.json'):
+                 executed_trades_file='executed_trades.jsonl', checkpoint_every=1000,
+                 checkpoint_interval=60.0, storage=None, events=None, metrics=None):
         self.stock_info = stock_info
-        self.buy_orders = {}   # {ticker: deque of buy orders}
-        self.sell_orders = {}  # {ticker: deque of sell orders}
-        self.stop_buy_orders = {}   # {ticker: list of stop buy orders}
-        self.stop_sell_orders = {}  # {ticker: list of stop sell orders}
-        self.last_trade_price = {}  # {ticker: last execution price}
+        # Orders accepted and rejected, fills, stop triggers and cancels are
+        # reported as events; by default they are printed to the console.
+        self.events = events if events is not None else EventSink([ConsolePrinter()])
+        # They are also counted in metrics, with the persistence latency and
+        # the size of the book; see _register_metrics.
+        self.metrics = metrics if metrics is not None else MetricsRegistry()
+        self.fill_count = 0  # fills executed since the book was created
+        self.buy_orders = {}   # {ticker: BookSide of buy orders}
+        self.sell_orders = {}  # {ticker: BookSide of sell orders}
+        self.stop_buy_orders = {}   # {ticker: StopOrders of stop buy orders}
+        self.stop_sell_orders = {}  # {ticker: StopOrders of stop sell orders}
+        # The book compares and keys prices as whole numbers of ticks (see
+        # StockInfo.to_ticks); they are converted from and to currency units
+        # where orders, trades and prices enter or leave it.
+        self.last_trade_ticks = {}  # {ticker: last execution price in ticks}
+        # {order_id: (side, ticker, location)} for every resting and stop order.
+        # side is 'buy', 'sell', 'stop_buy' or 'stop_sell'; location is the
+        # order's BookSide node for resting orders and its StopOrders entry for stops.
+        self.order_index = {}
+        self.cascade_stats = deque(maxlen=100)  # metrics of recent stop cascades
         self.unmatched_orders_file = unmatched_orders_file
         self.executed_trades_file = executed_trades_file
-
+        if storage is None:
+            storage = JsonStorage(unmatched_orders_file, executed_trades_file,
+                                  checkpoint_every=checkpoint_every, checkpoint_interval=checkpoint_interval)
+        self.storage = storage
+        self.order_journal = storage.orders
+        self.trade_journal = storage.trades
+        # Generated order IDs and all trade IDs come from one increasing sequence
+        self.sequence = IdSequence(storage.sequence)
+
+        self._register_metrics()
         self.load_unmatched_orders()
 
+    def _register_metrics(self):
+        metrics = self.metrics
+        self._orders_total = metrics.counter('engine_orders', "Orders accepted", ('order_type',))
+        self._rejects_total = metrics.counter('engine_rejects', "Orders and cancels rejected",
+                                              ('request', 'reason'))
+        self._cancels_total = metrics.counter('engine_cancels', "Orders cancelled", ('reason',))
+        self._fills_total = metrics.counter('engine_fills', "Fills executed")
+        self._triggers_total = metrics.counter('engine_stop_triggers', "Stop orders triggered", ('side',))
+        self._persist_seconds = metrics.histogram('engine_persist_seconds',
+                                                  "Time to write changes to storage", ('target',))
+        # The book gauges are read when the metrics are rendered, so keeping them costs nothing
+        metrics.gauge('engine_book_orders', "Orders resting on the book", ('ticker', 'side'),
+                      lambda: self._book_sizes(self.buy_orders, self.sell_orders))
+        metrics.gauge('engine_book_levels', "Price levels on the book", ('ticker', 'side'),
+                      lambda: self._book_sizes(self.buy_orders, self.sell_orders, lambda book: len(book.levels)))
+        metrics.gauge('engine_stop_orders', "Stop orders waiting to trigger", ('ticker', 'side'),
+                      lambda: self._book_sizes(self.stop_buy_orders, self.stop_sell_orders))
+
+    @staticmethod
+    def _book_sizes(buy_books, sell_books, size=len):
+        """{(ticker, side): size(book)} of the books in {ticker: book} dicts of either side."""
+        sizes = {}
+        for side, books in (('buy', buy_books), ('sell', sell_books)):
+            # Copied first: the metrics server reads this from its own thread
+            for ticker, book in list(books.items()):
+                sizes[(ticker, side)] = size(book)
+        return sizes
+
+    @property
+    def last_trade_price(self):
+        """{ticker: last execution price}, in currency units."""
+        return {ticker: self.stock_info.from_ticks(ticker, ticks) for ticker, ticks in self.last_trade_ticks.items()}
+
+    @last_trade_price.setter
+    def last_trade_price(self, prices):
+        self.last_trade_ticks = {ticker: self.stock_info.to_ticks(ticker, price) for ticker, price in prices.items()}
+
     def load_unmatched_orders(self):
-        if os.path.exists(self.unmatched_orders_file):
-            with open(self.unmatched_orders_file, 'r') as f:
-                data = json.load(f)
-                self.buy_orders = {}
-                self.sell_orders = {}
-                self.stop_buy_orders = {}
-                self.stop_sell_orders = {}
-                for ticker, orders in data.get('buy_orders', {}).items():
-                    self.buy_orders[ticker] = deque()
-                    for order in orders:
-                        order['timestamp'] = datetime.fromisoformat(order['timestamp'])
-                        if 'order_id' not in order:
-                            order_id = f"{order['account_id']}_{ticker}_{int(order['timestamp'].timestamp())}"
-                            order['order_id'] = order_id
-                        self.buy_orders[ticker].append(order)
-                for ticker, orders in data.get('sell_orders', {}).items():
-                    self.sell_orders[ticker] = deque()
-                    for order in orders:
-                        order['timestamp'] = datetime.fromisoformat(order['timestamp'])
-                        if 'order_id' not in order:
-                            order_id = f"{order['account_id']}_{ticker}_{int(order['timestamp'].timestamp())}"
-                            order['order_id'] = order_id
-                        self.sell_orders[ticker].append(order)
-                # Load stop buy orders
-                for ticker, orders in data.get('stop_buy_orders', {}).items():
-                    self.stop_buy_orders[ticker] = []
-                    for order in orders:
-                        order['timestamp'] = datetime.fromisoformat(order['timestamp'])
-                        if 'order_id' not in order:
-                            order_id = f"{order['account_id']}_{ticker}_{int(order['timestamp'].timestamp())}"
-                            order['order_id'] = order_id
-                        self.stop_buy_orders[ticker].append(order)
-                # Load stop sell orders
-                for ticker, orders in data.get('stop_sell_orders', {}).items():
-                    self.stop_sell_orders[ticker] = []
-                    for order in orders:
-                        order['timestamp'] = datetime.fromisoformat(order['timestamp'])
-                        if 'order_id' not in order:
-                            order_id = f"{order['account_id']}_{ticker}_{int(order['timestamp'].timestamp())}"
-                            order['order_id'] = order_id
-                        self.stop_sell_orders[ticker].append(order)
-                self.save_unmatched_orders()
+        """Forget the in-memory book; each stored ticker is read back on first use."""
+        self.buy_orders = {}
+        self.sell_orders = {}
+        self.stop_buy_orders = {}
+        self.stop_sell_orders = {}
+        self.order_index = {}
+        # Stored tickers whose orders have not been read yet
+        self.unloaded_tickers = self.order_journal.tickers()
+
+    def load_ticker(self, ticker):
+        """Read a ticker's stored orders into the book the first time it is used."""
+        if ticker not in self.unloaded_tickers:
+            return
+        self.unloaded_tickers.discard(ticker)
+        data, events = self.order_journal.load(ticker)
+        if data is not None:
+            for order in data.get('buy_orders', ()):
+                self._rest_order(self._load_order(order, ticker), ticker)
+            for order in data.get('sell_orders', ()):
+                self._rest_order(self._load_order(order, ticker), ticker)
+            for order in data.get('stop_buy_orders', ()):
+                self._add_stop_order(self._load_order(order, ticker), ticker)
+            for order in data.get('stop_sell_orders', ()):
+                self._add_stop_order(self._load_order(order, ticker), ticker)
+        # Replay the changes made since the snapshot was written
+        for event in events:
+            self._apply_event(event)
+
+    def load_all_tickers(self):
+        for ticker in list(self.unloaded_tickers):
+            self.load_ticker(ticker)
+
+    def _apply_event(self, event):
+        kind = event['event']
+        if kind == 'add':
+            ticker = event['order']['ticker']
+            order = self._load_order(event['order'], ticker)
+            if order.order_type in (OrderType.STOP_MARKET, OrderType.STOP_LIMIT):
+                self._add_stop_order(order, ticker)
+            else:
+                self._rest_order(order, ticker)
+        elif kind == 'fill':
+            entry = self.order_index.get(event['order_id'])
+            if entry is not None and entry[0] in ('buy', 'sell'):
+                side, ticker, node = entry
+                book_side = (self.buy_orders if side == 'buy' else self.sell_orders)[ticker]
+                order = node.order
+                book_side.reduce(order, event['quantity'])
+                if order.quantity == 0:
+                    book_side.remove_node(node)
+                    del self.order_index[order.order_id]
+        elif kind == 'cancel':
+            self._remove_indexed(event['order_id'])
+        elif kind == 'trigger':
+            entry = self.order_index.get(event['order_id'])
+            if entry is not None and entry[0] in ('stop_buy', 'stop_sell'):
+                side, ticker, stop_entry = entry
+                order = stop_entry[2]
+                stops = self.stop_buy_orders if side == 'stop_buy' else self.stop_sell_orders
+                if order is not None and stops[ticker].remove_entry(stop_entry):
+                    self._trigger_stop_order(order, ticker)
+
+    def _remove_indexed(self, order_id):
+        """Take whatever order_id points at off the book or the stop orders; return it or None."""
+        entry = self.order_index.get(order_id)
+        if entry is None:
+            return None
+        side, ticker, location = entry
+        if side in ('buy', 'sell'):
+            book_side = (self.buy_orders if side == 'buy' else self.sell_orders).get(ticker)
+            if book_side is None or not book_side.contains(location):
+                return None
+            order = location.order
+            book_side.remove_node(location)
         else:
-            self.buy_orders = {}
-            self.sell_orders = {}
-            self.stop_buy_orders = {}
-            self.stop_sell_orders = {}
+            stop_orders = (self.stop_buy_orders if side == 'stop_buy' else self.stop_sell_orders).get(ticker)
+            order = location[2]
+            if order is None or stop_orders is None or not stop_orders.remove_entry(location):
+                return None
+        del self.order_index[order_id]
+        return order
+
+    @staticmethod
+    def _load_order(order, ticker):
+        order = Order.from_dict(order)
+        if order.order_id is None:
+            order.order_id = f"{order.account_id}_{ticker}_{order.timestamp // 10 ** 9}"
+        return order
+
+    def _set_ticks(self, order, ticker):
+        # Orders get their prices in ticks as they enter the book
+        if order.price is not None and order.price_ticks is None:
+            order.price_ticks = self.stock_info.to_ticks(ticker, order.price)
+        if order.stop_price is not None and order.stop_ticks is None:
+            order.stop_ticks = self.stock_info.to_ticks(ticker, order.stop_price)
+
+    def _rest_order(self, order, ticker):
+        """Put a market or limit order on its book side and index it."""
+        self._set_ticks(order, ticker)
+        side = order.action
+        books = self.buy_orders if side == 'buy' else self.sell_orders
+        if ticker not in books:
+            books[ticker] = BookSide(side)
+        node = books[ticker].append(order)
+        self.order_index[order.order_id] = (side, ticker, node)
+
+    def _add_stop_order(self, order, ticker):
+        self._set_ticks(order, ticker)
+        side = 'stop_' + order.action
+        stops = self.stop_buy_orders if side == 'stop_buy' else self.stop_sell_orders
+        if ticker not in stops:
+            stops[ticker] = StopOrders(order.action)
+        entry = stops[ticker].append(order)
+        self.order_index[order.order_id] = (side, ticker, entry)
+
+    def _unindex_order(self, order):
+        # Only drop the entry if it still points at this order; a newer order
+        # may have been given the same order_id.
+        entry = self.order_index.get(order.order_id)
+        if entry is not None:
+            location = entry[2]
+            indexed = location.order if entry[0] in ('buy', 'sell') else location[2]
+            if indexed is order:
+                del self.order_index[order.order_id]
+
+    def _checkpoint_ticker(self, ticker):
+        self.order_journal.checkpoint(ticker, {
+            'buy_orders': [order.to_dict() for order in self.buy_orders.get(ticker, ())],
+            'sell_orders': [order.to_dict() for order in self.sell_orders.get(ticker, ())],
+            'stop_buy_orders': [order.to_dict() for order in self.stop_buy_orders.get(ticker, ())],
+            'stop_sell_orders': [order.to_dict() for order in self.stop_sell_orders.get(ticker, ())],
+        })
 
     def save_unmatched_orders(self):
-        def serialize_order(order):
-            order_copy = order.copy()
-            order_copy['timestamp'] = order_copy['timestamp'].isoformat()
-            return order_copy
-
-        data = {
-            'buy_orders': {ticker: [serialize_order(order) for order in orders]
-                           for ticker, orders in self.buy_orders.items()},
-            'sell_orders': {ticker: [serialize_order(order) for order in orders]
-                            for ticker, orders in self.sell_orders.items()},
-            'stop_buy_orders': {ticker: [serialize_order(order) for order in orders]
-                                for ticker, orders in self.stop_buy_orders.items()},
-            'stop_sell_orders': {ticker: [serialize_order(order) for order in orders]
-                                 for ticker, orders in self.stop_sell_orders.items()},
-        }
-        with open(self.unmatched_orders_file, 'w') as f:
-            json.dump(data, f, indent=4)
+        """Write a checkpoint of every loaded ticker; their journals restart empty."""
+        tickers = set(self.buy_orders) | set(self.sell_orders) | set(self.stop_buy_orders) | set(self.stop_sell_orders)
+        for ticker in tickers - self.unloaded_tickers:
+            self._checkpoint_ticker(ticker)
+
+    def _persist_changes(self, ticker):
+        # Changes are already in the journal; write a checkpoint only when one is due
+        started = time.perf_counter()
+        if self.order_journal.checkpoint_due(ticker):
+            self._checkpoint_ticker(ticker)
+            self._persist_seconds.observe(time.perf_counter() - started, ('checkpoint',))
+        else:
+            self.order_journal.flush()
+            self._persist_seconds.observe(time.perf_counter() - started, ('journal',))
+
+    def reset(self):
+        """Clear all orders, trades and last trade prices, in memory and on disk."""
+        self.buy_orders = {}
+        self.sell_orders = {}
+        self.stop_buy_orders = {}
+        self.stop_sell_orders = {}
+        self.order_index = {}
+        self.last_trade_ticks = {}
+        self.unloaded_tickers = set()
+        self.order_journal.clear()
+        self.trade_journal.clear()
 
     def save_executed_trade(self, trade_info):
         # Assign a unique trade_id
-        trade_info['trade_id'] = str(uuid.uuid4())
-        try:
-            with open(self.executed_trades_file, 'r') as f:
-                executed_trades = json.load(f)
-        except (FileNotFoundError, json.JSONDecodeError):
-            executed_trades = []
-
-        executed_trades.append(trade_info)
-        with open(self.executed_trades_file, 'w') as f:
-            json.dump(executed_trades, f, indent=4)
+        trade_info['trade_id'] = str(self.sequence.next())
+        self.trade_journal.append(trade_info)
 
     def get_best_price(self, action, ticker):
+        ticks = self._best_ticks(action, ticker)
+        return self.stock_info.from_ticks(ticker, ticks) if ticks is not None else None
+
+    def _best_ticks(self, action, ticker):
+        self.load_ticker(ticker)
         if action == 'buy':
             # Best price is the lowest price from sell limit orders
             if ticker in self.sell_orders:
-                limit_orders = [o for o in self.sell_orders[ticker] if o['order_type'] == 'limit']
-                if limit_orders:
-                    return min(o['price'] for o in limit_orders)
+                best_price = self.sell_orders[ticker].best_price()
+                if best_price is not None:
+                    return best_price
         elif action == 'sell':
             # Best price is the highest price from buy limit orders
             if ticker in self.buy_orders:
-                limit_orders = [o for o in self.buy_orders[ticker] if o['order_type'] == 'limit']
-                if limit_orders:
-                    return max(o['price'] for o in limit_orders)
-        return self.last_trade_price.get(ticker, self.stock_info.get_initial_price(ticker))
+                best_price = self.buy_orders[ticker].best_price()
+                if best_price is not None:
+                    return best_price
+        if ticker in self.last_trade_ticks:
+            return self.last_trade_ticks[ticker]
+        initial_price = self.stock_info.get_initial_price(ticker)
+        return self.stock_info.to_ticks(ticker, initial_price) if initial_price is not None else None
+
+    def _cash_units(self, ticker, quantity, ticks):
+        """Cash, in minor units, for a quantity of shares at a price in ticks."""
+        return round(quantity * ticks * CASH_SCALE / self.stock_info.ticks_per_unit[ticker])
 
     def add_order(self, order, account_manager):
+        rejected = self._validate_order(order, account_manager)
+        if rejected is not None:
+            reason, error = rejected
+            self._rejects_total.inc(('order', reason))
+            if self.events.subscribers:
+                self._emit_rejected(order, reason, error)
+            return False
+        ticker = order['ticker']
+        book_order = self._place_order(order, ticker)
+        self._orders_total.inc((order['order_type'],))
+        is_stop = book_order.order_type in (OrderType.STOP_MARKET, OrderType.STOP_LIMIT)
+        if self.events.subscribers:
+            self._emit_accepted(order, is_stop)
+        self._persist_changes(ticker)
+        if not is_stop:
+            # Try to match orders immediately
+            self.match_orders(ticker, account_manager)
+        return True
+
+    def add_orders(self, orders, account_manager):
+        """Add many orders at once; return one result dict per order, in order.
+
+        Every order is validated and put on the book first, then each ticker
+        that got a market or limit order is matched once and the book is saved
+        once, instead of matching and saving after every order. Orders in a
+        batch therefore trade against each other as if they all arrived before
+        the first match, and balance checks see the balances from before the
+        batch. Each result holds the order_id, whether the order was accepted,
+        and the error if not. The orders' accepted and rejected events are
+        emitted as add_order emits them, marked with ``batch``, so the console
+        printer leaves them to the caller's report of the results.
+        """
+        results = []
+        to_match = {}  # {ticker: whether a market or limit order was added}, in first-seen order
+        for order in orders:
+            rejected = self._validate_order(order, account_manager)
+            if rejected is not None:
+                reason, error = rejected
+                self._rejects_total.inc(('order', reason))
+                if self.events.subscribers:
+                    self._emit_rejected(order, reason, error, batch=True)
+                results.append({'order_id': order.get('order_id'), 'accepted': False, 'error': error})
+                continue
+            ticker = order['ticker']
+            book_order = self._place_order(order, ticker)
+            self._orders_total.inc((order['order_type'],))
+            resting = book_order.order_type not in (OrderType.STOP_MARKET, OrderType.STOP_LIMIT)
+            if self.events.subscribers:
+                self._emit_accepted(order, not resting, batch=True)
+            to_match[ticker] = to_match.get(ticker, False) or resting
+            results.append({'order_id': order['order_id'], 'accepted': True, 'error': None})
+
+        for ticker, resting in to_match.items():
+            if resting:
+                self._run_cascade(ticker, account_manager)
+            if self.order_journal.checkpoint_due(ticker):
+                started = time.perf_counter()
+                self._checkpoint_ticker(ticker)
+                self._persist_seconds.observe(time.perf_counter() - started, ('checkpoint',))
+        if to_match:
+            started = time.perf_counter()
+            self.order_journal.flush()
+            self._persist_seconds.observe(time.perf_counter() - started, ('journal',))
+        return results
+
+    def _emit_accepted(self, order, is_stop, **extra):
+        self.events.emit({'event': ACCEPTED, 'order_id': order['order_id'], 'ticker': order['ticker'],
+                          'account_id': order['account_id'], 'action': order['action'],
+                          'order_type': order['order_type'], 'quantity': order['quantity'],
+                          'price': order.get('price'), 'stop_price': order.get('stop_price'), 'stop': is_stop,
+                          **extra})
+
+    def _emit_rejected(self, order, reason, error, **extra):
+        self.events.emit({'event': REJECTED, 'request': 'order', 'account_id': order.get('account_id'),
+                          'order_id': order.get('order_id'), 'reason': reason, 'error': error, **extra})
+
+    def _validate_order(self, order, account_manager):
+        """Check and normalize an order dict in place; return (reason, error message), or None if it is valid.
+
+        The reason is a short code such as 'invalid_price' that labels the
+        rejects metric and the rejected event.
+        """
         ticker = order.get('ticker')
         account_id = order.get('account_id')
         order_type = order.get('order_type')
@@ -124,51 +399,48 @@ class OrderBook:
         required_fields = ['action', 'account_id', 'ticker', 'quantity', 'order_type', 'timestamp']
         for field in required_fields:
             if field not in order:
-                print(f"Error: Missing required field '{field}'.")
-                return False
+                return 'missing_field', f"Missing required field '{field}'."
 
         # Validate action
         if action.lower() not in ['buy', 'sell']:
-            print("Error: Action must be 'buy' or 'sell'.")
-            return False
+            return 'invalid_action', "Action must be 'buy' or 'sell'."
         else:
             order['action'] = action.lower()
 
         # Validate ticker
         if not self.stock_info.is_valid_ticker(ticker):
-            print(f"Error: {ticker} is not a valid ticker.")
-            return False
+            return 'invalid_ticker', f"{ticker} is not a valid ticker."
+
+        # The checks below and the order itself need this ticker's stored book
+        self.load_ticker(ticker)
 
         # Validate order_type
         if order_type not in ['market', 'limit', 'stop_market', 'stop_limit']:
-            print("Error: Invalid order type.")
-            return False
+            return 'invalid_order_type', "Invalid order type."
 
-        # Validate timestamp
+        # Validate timestamp: time.time_ns(), or a datetime from callers
+        # written before orders were stamped in nanoseconds
         timestamp = order.get('timestamp')
-        if not isinstance(timestamp, datetime):
-            print("Error: 'timestamp' must be a datetime object.")
-            return False
-        if timestamp > datetime.now():
-            print("Error: 'timestamp' cannot be in the future.")
-            return False
+        if isinstance(timestamp, datetime):
+            timestamp = order['timestamp'] = to_ns(timestamp)
+        if type(timestamp) is not int:
+            return 'invalid_timestamp', "'timestamp' must be nanoseconds since 1970 or a datetime object."
+        if timestamp > time.time_ns():
+            return 'invalid_timestamp', "'timestamp' cannot be in the future."
 
         # Validate account existence and fetch account
         account = account_manager.get_account(account_id)
         if not account:
-            print(f"Error: Account {account_id} does not exist.")
-            return False
+            return 'unknown_account', f"Account {account_id} does not exist."
 
         # Validate quantity type
         try:
             quantity = float(order['quantity'])
         except (ValueError, TypeError):
-            print("Error: Quantity must be a number.")
-            return False
+            return 'invalid_quantity', "Quantity must be a number."
 
         if quantity <= 0:
-            print("Error: Quantity must be positive.")
-            return False
+            return 'invalid_quantity', "Quantity must be positive."
 
         order['quantity'] = quantity
 
@@ -176,408 +448,510 @@ class OrderBook:
         price_required = (order_type == 'limit' or order_type == 'stop_limit')
         if price_required:
             if 'price' not in order or order['price'] is None:
-                print("Error: Limit or stop_limit orders require a price.")
-                return False
+                return 'invalid_price', "Limit or stop_limit orders require a price."
             try:
                 price = float(order['price'])
             except (ValueError, TypeError):
-                print("Error: Price must be a number.")
-                return False
+                return 'invalid_price', "Price must be a number."
             if price <= 0:
-                print("Error: Limit orders require a positive price.")
-                return False
+                return 'invalid_price', "Limit orders require a positive price."
+            if not self.stock_info.on_tick(ticker, price):
+                return 'invalid_price', f"Price must be a multiple of the tick size {self.stock_info.tick_size(ticker)}."
             order['price'] = price
         else:
             if order_type == 'market' and 'price' in order and order['price'] is not None:
-                print("Error: Market orders should not have a price.")
-                return False
+                return 'invalid_price', "Market orders should not have a price."
 
         # Validate stop_price if stop order
         if order_type in ['stop_market', 'stop_limit']:
             if 'stop_price' not in order:
-                print("Error: Stop orders require a stop_price.")
-                return False
+                return 'invalid_stop_price', "Stop orders require a stop_price."
             try:
                 stop_price = float(order['stop_price'])
             except (ValueError, TypeError):
-                print("Error: Stop price must be a number.")
-                return False
+                return 'invalid_stop_price', "Stop price must be a number."
             if stop_price <= 0:
-                print("Error: Stop orders require a positive stop price.")
-                return False
+                return 'invalid_stop_price', "Stop orders require a positive stop price."
+            if not self.stock_info.on_tick(ticker, stop_price):
+                return 'invalid_stop_price', f"Stop price must be a multiple of the tick size {self.stock_info.tick_size(ticker)}."
             order['stop_price'] = stop_price
 
         # For sell orders, verify that the account has enough shares
         if order['action'] == 'sell':
             positions = account['positions']
             if positions.get(ticker, 0) < quantity:
-                print(f"Error: Account {account_id} does not have enough shares to sell.")
-                return False
+                return 'insufficient_shares', f"Account {account_id} does not have enough shares to sell."
 
         # For buy orders, verify that the account has enough funds
         if order['action'] == 'buy':
+            balance = account['balance']
             if order_type in ['limit', 'stop_limit']:
-                total_cost = quantity * price
-                if account['balance'] < total_cost:
-                    print(f"Error: Account {account_id} does not have enough balance to place this buy order.")
-                    return False
+                total_cost = self._cash_units(ticker, quantity, self.stock_info.to_ticks(ticker, price))
+                if balance < total_cost:
+                    return 'insufficient_balance', f"Account {account_id} does not have enough balance to place this buy order."
             elif order_type == 'market':
-                best_ask_price = self.get_best_price('buy', ticker)
-                if best_ask_price is not None:
-                    total_cost = quantity * best_ask_price
-                    if account['balance'] < total_cost:
-                        print(f"Error: Account {account_id} does not have enough balance to place this market order.")
-                        return False
-
+                best_ask_ticks = self._best_ticks('buy', ticker)
+                if best_ask_ticks is not None:
+                    total_cost = self._cash_units(ticker, quantity, best_ask_ticks)
+                    if balance < total_cost:
+                        return 'insufficient_balance', f"Account {account_id} does not have enough balance to place this market order."
+        return None
+
+    def _place_order(self, order, ticker):
+        """Put a validated order on the book or the stop orders and journal it; return the book Order."""
         # Assign a unique order ID if not already assigned
         if 'order_id' not in order:
-            order_id = f"{order['account_id']}_{ticker}_{int(timestamp.timestamp())}"
-            order['order_id'] = order_id
+            order['order_id'] = str(self.sequence.next())
 
-        # Add order to the appropriate order list
-        if order_type in ['stop_market', 'stop_limit']:
-            # Add to stop orders
-            if order['action'] == 'buy':
-                if ticker not in self.stop_buy_orders:
-                    self.stop_buy_orders[ticker] = []
-                self.stop_buy_orders[ticker].append(order)
-            else:
-                if ticker not in self.stop_sell_orders:
-                    self.stop_sell_orders[ticker] = []
-                self.stop_sell_orders[ticker].append(order)
-            print(f"Stop order added with Order ID: {order['order_id']}")
-            self.save_unmatched_orders()
-            return True
+        book_order = Order.from_dict(order)
+        if book_order.order_type in (OrderType.STOP_MARKET, OrderType.STOP_LIMIT):
+            self._add_stop_order(book_order, ticker)
         else:
-            # Market or Limit order
-            if order['action'] == 'buy':
-                if ticker not in self.buy_orders:
-                    self.buy_orders[ticker] = deque()
-                self.buy_orders[ticker].append(order)
-            else:
-                if ticker not in self.sell_orders:
-                    self.sell_orders[ticker] = deque()
-                self.sell_orders[ticker].append(order)
-            print(f"Order added to the order book with Order ID: {order['order_id']}")
-            self.save_unmatched_orders()
-
-            # Try to match orders immediately
-            self.match_orders(ticker, account_manager)
-            return True
+            self._rest_order(book_order, ticker)
+        self.order_journal.record(ticker, 'add', order=book_order.to_dict())
+        return book_order
 
     def cancel_order(self, account_id, order_id):
         found = False
-        # Search in buy orders
-        for ticker, orders in self.buy_orders.items():
-            for ord in list(orders):
-                if ord['order_id'] == order_id and ord['account_id'] == account_id:
-                    orders.remove(ord)
-                    found = True
-                    print(f"Order {order_id} canceled.")
-                    break
-            if found:
-                break
+        entry = self._indexed(order_id)
+        if entry is not None and entry[0] in ('buy', 'sell') and entry[2].order.account_id == account_id:
+            ticker = entry[1]
+            if self._remove_indexed(order_id) is not None:
+                self.order_journal.record(ticker, 'cancel', order_id=order_id)
+                self._persist_changes(ticker)
+                found = True
+                self._emit_cancel(order_id, ticker, account_id, False)
 
-        # Search in sell orders if not found in buy orders
         if not found:
-            for ticker, orders in self.sell_orders.items():
-                for ord in list(orders):
-                    if ord['order_id'] == order_id and ord['account_id'] == account_id:
-                        orders.remove(ord)
-                        found = True
-                        print(f"Order {order_id} canceled.")
-                        break
-                if found:
-                    break
-
-        if not found:
-            print(f"Order ID {order_id} not found for Account {account_id}.")
-
-        self.save_unmatched_orders()
+            self._rejects_total.inc(('cancel', 'not_found'))
+        if not found and self.events.subscribers:
+            self.events.emit({'event': REJECTED, 'request': 'cancel', 'account_id': account_id,
+                              'order_id': order_id, 'reason': 'not_found', 'error': 'not found'})
         return found
 
     def cancel_stop_order(self, account_id, order_id):
         found = False
-        for ticker, orders in self.stop_buy_orders.items():
-            for ord in list(orders):
-                if ord['order_id'] == order_id and ord['account_id'] == account_id:
-                    orders.remove(ord)
-                    found = True
-                    print(f"Stop order {order_id} canceled.")
-                    break
-            if found:
-                break
-        if not found:
-            for ticker, orders in self.stop_sell_orders.items():
-                for ord in list(orders):
-                    if ord['order_id'] == order_id and ord['account_id'] == account_id:
-                        orders.remove(ord)
-                        found = True
-                        print(f"Stop order {order_id} canceled.")
-                        break
-                if found:
-                    break
+        entry = self._indexed(order_id)
+        if entry is not None and entry[0] in ('stop_buy', 'stop_sell'):
+            order = entry[2][2]
+            ticker = entry[1]
+            if order is not None and order.account_id == account_id and self._remove_indexed(order_id) is not None:
+                self.order_journal.record(ticker, 'cancel', order_id=order_id)
+                self._persist_changes(ticker)
+                found = True
+                self._emit_cancel(order_id, ticker, account_id, True)
         if not found:
-            print(f"Stop Order ID {order_id} not found for Account {account_id}.")
-        self.save_unmatched_orders()
+            self._rejects_total.inc(('cancel_stop', 'not_found'))
+        if not found and self.events.subscribers:
+            self.events.emit({'event': REJECTED, 'request': 'cancel_stop', 'account_id': account_id,
+                              'order_id': order_id, 'reason': 'not_found', 'error': 'not found'})
         return found
 
+    def _emit_cancel(self, order_id, ticker, account_id, stop, reason='request'):
+        self._cancels_total.inc((reason,))
+        if self.events.subscribers:
+            self.events.emit({'event': CANCELLED, 'order_id': order_id, 'ticker': ticker,
+                              'account_id': account_id, 'stop': stop, 'reason': reason})
+
+    def _indexed(self, order_id):
+        """Index entry of order_id, reading the tickers not loaded yet if it is not found."""
+        entry = self.order_index.get(order_id)
+        if entry is None and self.unloaded_tickers:
+            self.load_all_tickers()
+            entry = self.order_index.get(order_id)
+        return entry
+
     def match_orders(self, ticker, account_manager):
-        old_price = self.last_trade_price.get(ticker, self.stock_info.get_initial_price(ticker))
-
-        buy_orders = self.buy_orders.get(ticker, deque())
-        sell_orders = self.sell_orders.get(ticker, deque())
-
-        # Sort buy orders
-        buy_orders = deque(sorted(buy_orders, key=lambda o: (
-            o['order_type'] != 'market',
-            -o.get('price', float('inf')) if o.get('price') else float('inf'),
-            o['timestamp']
-        )))
-        # Sort sell orders
-        sell_orders = deque(sorted(sell_orders, key=lambda o: (
-            o['order_type'] != 'market',
-            o.get('price', 0) if o.get('price') else 0,
-            o['timestamp']
-        )))
-
-        trade_executed = False
-        while buy_orders and sell_orders:
-            matched = False
-            for buy_order in list(buy_orders):
-                for sell_order in list(sell_orders):
-                    if buy_order['account_id'] == sell_order['account_id']:
-                        continue  # skip same-account trades
-
-                    execution_price = None
-
-                    if buy_order['order_type'] == 'market' and sell_order['order_type'] == 'market':
-                        execution_price = self.last_trade_price.get(ticker)
-                        if execution_price is None:
-                            continue
-                    elif buy_order['order_type'] == 'market' and sell_order['order_type'] == 'limit':
-                        execution_price = sell_order['price']
-                    elif buy_order['order_type'] == 'limit' and sell_order['order_type'] == 'market':
-                        execution_price = buy_order['price']
-                    elif buy_order['order_type'] == 'limit' and sell_order['order_type'] == 'limit':
-                        if buy_order['price'] >= sell_order['price']:
-                            execution_price = sell_order['price']
-                        else:
+        self.load_ticker(ticker)
+        self._run_cascade(ticker, account_manager)
+
+    def _run_cascade(self, ticker, account_manager, triggered=0):
+        """Match a ticker's book and process the stop orders it triggers until it settles.
+
+        A matching pass that trades can trigger stop orders, and those need
+        another pass, which can trigger more. The passes are taken from a work
+        queue instead of recursing, and the book is saved once at the end.
+        """
+        started = time.perf_counter()
+        depth = 1 if triggered else 0
+        fills = 0
+        changed = triggered > 0
+        pending = deque([ticker])
+        while pending:
+            ticker = pending.popleft()
+            pass_fills, dropped = self._match_pass(ticker, account_manager)
+            fills += pass_fills
+            changed = changed or pass_fills > 0 or dropped > 0
+            if not pass_fills:
+                continue
+            newly_triggered = self._trigger_stops(ticker, self.last_trade_ticks[ticker])
+            if newly_triggered:
+                depth += 1
+                triggered += newly_triggered
+                pending.append(ticker)
+
+        if changed:
+            self._persist_changes(ticker)
+
+        if triggered:
+            elapsed_ms = (time.perf_counter() - started) * 1000
+            stats = {
+                'ticker': ticker,
+                'depth': depth,
+                'triggered': triggered,
+                'fills': fills,
+                'elapsed_ms': elapsed_ms
+            }
+            self.cascade_stats.append(stats)
+            if self.events.subscribers:
+                self.events.emit(dict(stats, event=CASCADE))
+
+    def _match_pass(self, ticker, account_manager):
+        """Fill crossing orders on one ticker; return (fills, orders dropped)."""
+        # Both sides are kept in price-time priority as orders come and go,
+        # so they can be walked in order without sorting them here.
+        if ticker not in self.buy_orders:
+            self.buy_orders[ticker] = BookSide('buy')
+        if ticker not in self.sell_orders:
+            self.sell_orders[ticker] = BookSide('sell')
+        buy_orders = self.buy_orders[ticker]
+        sell_orders = self.sell_orders[ticker]
+
+        fills = 0
+        dropped = 0
+        cursor = [None, None, None]
+        while True:
+            match = self._find_match(ticker, buy_orders, sell_orders, cursor)
+            if match is None:
+                break
+            buy_node, sell_node, execution_ticks = match
+            buy_order, sell_order = buy_node.order, sell_node.order
+
+            exec_quantity = min(buy_order.quantity, sell_order.quantity)
+
+            total_cost = self._cash_units(ticker, exec_quantity, execution_ticks)
+            if not self._settle(ticker, buy_order.account_id, sell_order.account_id, exec_quantity, total_cost,
+                                account_manager):
+                self._emit_cancel(buy_order.order_id, ticker, buy_order.account_id, False, 'insufficient_balance')
+                buy_orders.remove_node(buy_node)
+                self._unindex_order(buy_order)
+                self.order_journal.record(ticker, 'cancel', order_id=buy_order.order_id)
+                dropped += 1
+                continue
+
+            # Update order quantities
+            buy_orders.reduce(buy_order, exec_quantity)
+            sell_orders.reduce(sell_order, exec_quantity)
+            self.order_journal.record(ticker, 'fill', order_id=buy_order.order_id, quantity=exec_quantity)
+            self.order_journal.record(ticker, 'fill', order_id=sell_order.order_id, quantity=exec_quantity)
+
+            # Update last trade price
+            self.last_trade_ticks[ticker] = execution_ticks
+            execution_price = self.stock_info.from_ticks(ticker, execution_ticks)
+
+            trade_info = {
+                'trade_id': '',
+                'ticker': ticker,
+                'price': execution_price,
+                'quantity': exec_quantity,
+                'buy_account_id': buy_order.account_id,
+                'sell_account_id': sell_order.account_id,
+                'timestamp': time.time_ns()  # formatted when the trade is shown or exported
+            }
+            self.save_executed_trade(trade_info)
+            if self.events.subscribers:
+                self.events.emit({'event': FILLED, **trade_info, 'buy_order_id': buy_order.order_id,
+                                  'sell_order_id': sell_order.order_id})
+
+            fills += 1
+
+            if buy_order.quantity == 0:
+                buy_orders.remove_node(buy_node)
+                self._unindex_order(buy_order)
+            if sell_order.quantity == 0:
+                sell_orders.remove_node(sell_node)
+                self._unindex_order(sell_order)
+
+        if fills:
+            self.fill_count += fills
+            self._fills_total.inc(amount=fills)
+        return fills, dropped
+
+    def _settle(self, ticker, buyer_id, seller_id, quantity, total_cost, account_manager):
+        """Move the cash (in minor units) and shares of a fill between accounts; False if the buyer cannot pay."""
+        # Update buyer's account
+        buyer_account = account_manager.get_account(buyer_id)
+        if buyer_account['balance'] < total_cost:
+            return False
+        buyer_account['balance'] -= total_cost
+        buyer_positions = buyer_account['positions']
+        buyer_positions[ticker] = buyer_positions.get(ticker, 0) + quantity
+        account_manager.update_account(buyer_id, buyer_account)
+
+        # Update seller's account
+        seller_account = account_manager.get_account(seller_id)
+        seller_positions = seller_account['positions']
+        seller_positions[ticker] = seller_positions.get(ticker, 0) - quantity
+        seller_account['balance'] += total_cost
+        if seller_positions.get(ticker, 0) == 0:
+            del seller_positions[ticker]
+        account_manager.update_account(seller_id, seller_account)
+        return True
+
+    def _find_match(self, ticker, buy_orders, sell_orders, cursor):
+        """Return the next (buy node, sell node, execution price in ticks) to fill, or None.
+
+        Both sides are walked from the top in priority order. The walk over
+        the sell side stops at the first limit order that no longer crosses
+        the bid, and the walk over the buy side stops once the best remaining
+        bid is below the best ask, so only the crossing part of the book is
+        visited. Same-account pairs are stepped over in place.
+
+        ``cursor`` is [buy node, buy order, sell node] kept by the matching
+        pass: the last buy order found to have nothing to fill against (None
+        for the top of the book), and the last same-account sell order
+        stepped over for the given buy order. Orders only leave the book
+        during a pass, so what was stepped over once is not walked again on
+        the next fill.
+        """
+        last_price = self.last_trade_ticks.get(ticker)
+        best_ask = sell_orders.best_price()
+        has_market_sells = bool(sell_orders.market_orders)
+        buy_after, sells_for, sell_after = cursor
+        buys_settled = True  # every buy order walked so far can no longer fill in this pass
+
+        for buy_node in buy_orders.nodes_after(buy_after):
+            buy_order = buy_node.order
+            buy_is_market = buy_order.order_type == OrderType.MARKET
+            if not buy_is_market and not has_market_sells:
+                if best_ask is None or buy_order.price_ticks < best_ask:
+                    return None  # best bid and best ask no longer cross
+
+            if buy_order is not sells_for:
+                sell_after = None
+            sells_settled = buys_settled
+            for sell_node in sell_orders.nodes_after(sell_after):
+                sell_order = sell_node.order
+                if buy_order.account_id == sell_order.account_id:
+                    if sells_settled:
+                        sell_after = sell_node
+                    continue  # skip same-account trades
+
+                if sell_order.order_type == OrderType.MARKET:
+                    if buy_is_market:
+                        if last_price is None:
+                            # The pair can fill once a trade sets a last price,
+                            # so it is stepped over without moving the cursor
+                            sells_settled = False
                             continue
+                        execution_ticks = last_price
                     else:
-                        continue
-
-                    exec_quantity = min(buy_order['quantity'], sell_order['quantity'])
-
-                    # Update buyer's account
-                    buyer_account = account_manager.get_account(buy_order['account_id'])
-                    total_cost = exec_quantity * execution_price
-                    if buyer_account['balance'] >= total_cost:
-                        buyer_account['balance'] -= total_cost
-                        buyer_positions = buyer_account['positions']
-                        buyer_positions[ticker] = buyer_positions.get(ticker, 0) + exec_quantity
-                        account_manager.update_account(buy_order['account_id'], buyer_account)
-                    else:
-                        print(f"Account {buy_order['account_id']} has insufficient balance.")
-                        buy_orders.remove(buy_order)
-                        matched = True
-                        break
-
-                    # Update seller's account
-                    seller_account = account_manager.get_account(sell_order['account_id'])
-                    seller_positions = seller_account['positions']
-                    seller_positions[ticker] = seller_positions.get(ticker, 0) - exec_quantity
-                    seller_account['balance'] += total_cost
-                    if seller_positions.get(ticker, 0) == 0:
-                        del seller_positions[ticker]
-                    account_manager.update_account(sell_order['account_id'], seller_account)
-
-                    # Update order quantities
-                    buy_order['quantity'] -= exec_quantity
-                    sell_order['quantity'] -= exec_quantity
-
-                    # Update last trade price
-                    self.last_trade_price[ticker] = execution_price
-
-                    print(f"Executed {exec_quantity} shares of {ticker} at {execution_price} between Account {buy_order['account_id']} (buy) and Account {sell_order['account_id']} (sell).")
-
-                    trade_info = {
-                        'trade_id': '',
-                        'ticker': ticker,
-                        'price': execution_price,
-                        'quantity': exec_quantity,
-                        'buy_account_id': buy_order['account_id'],
-                        'sell_account_id': sell_order['account_id'],
-                        'timestamp': datetime.now().isoformat()
-                    }
-                    self.save_executed_trade(trade_info)
-
-                    trade_executed = True
-
-                    if buy_order['quantity'] == 0:
-                        buy_orders.remove(buy_order)
-                    if sell_order['quantity'] == 0:
-                        sell_orders.remove(sell_order)
-
-                    matched = True
-                    break
-
-                if matched:
-                    break
-
-            if not matched:
-                break
-
-        self.buy_orders[ticker] = buy_orders
-        self.sell_orders[ticker] = sell_orders
-        self.save_unmatched_orders()
-
-        if trade_executed:
-            current_price = self.last_trade_price.get(ticker, old_price)
-            self.check_stop_orders(ticker, current_price, account_manager)
+                        execution_ticks = buy_order.price_ticks
+                elif buy_is_market or buy_order.price_ticks >= sell_order.price_ticks:
+                    execution_ticks = sell_order.price_ticks
+                else:
+                    break  # remaining sell orders are priced even higher
+                if buys_settled:
+                    cursor[:] = buy_after, buy_order, sell_after
+                return buy_node, sell_node, execution_ticks
+
+            if buys_settled and sells_settled:
+                buy_after = buy_node
+                cursor[:] = buy_after, None, None
+            else:
+                buys_settled = False
+            sell_after = None
+        return None
 
     def check_stop_orders(self, ticker, current_price, account_manager):
+        self.load_ticker(ticker)
+        triggered = self._trigger_stops(ticker, self.stock_info.to_ticks(ticker, current_price))
+        if triggered:
+            # Attempt to immediately match triggered orders
+            self._run_cascade(ticker, account_manager, triggered)
+        return triggered
+
+    def _trigger_stops(self, ticker, current_price):
+        """Move the stop orders triggered at current_price (in ticks) onto the book; return how many."""
         # Trigger Stop Buy Orders if current_price >= stop_price
         triggered_buy_orders = []
-        for order in self.stop_buy_orders.get(ticker, []):
-            if current_price >= order['stop_price']:
-                triggered_buy_orders.append(order)
+        if ticker in self.stop_buy_orders:
+            triggered_buy_orders = self.stop_buy_orders[ticker].pop_triggered(current_price)
 
         for order in triggered_buy_orders:
-            self.stop_buy_orders[ticker].remove(order)
-            new_order = order.copy()
-            if order['order_type'] == 'stop_market':
-                new_order['order_type'] = 'market'
-                new_order['price'] = None
-            elif order['order_type'] == 'stop_limit':
-                new_order['order_type'] = 'limit'
-
-            if new_order['action'] == 'buy':
-                if ticker not in self.buy_orders:
-                    self.buy_orders[ticker] = deque()
-                self.buy_orders[ticker].append(new_order)
-            else:
-                if ticker not in self.sell_orders:
-                    self.sell_orders[ticker] = deque()
-                self.sell_orders[ticker].append(new_order)
-            print(f"Stop buy order {order['order_id']} triggered.")
+            self._trigger_stop_order(order, ticker)
+            self.order_journal.record(ticker, 'trigger', order_id=order.order_id)
+            if self.events.subscribers:
+                self.events.emit({'event': TRIGGERED, 'order_id': order.order_id, 'ticker': ticker, 'action': 'buy'})
 
         # Trigger Stop Sell Orders if current_price <= stop_price
         triggered_sell_orders = []
-        for order in self.stop_sell_orders.get(ticker, []):
-            if current_price <= order['stop_price']:
-                triggered_sell_orders.append(order)
+        if ticker in self.stop_sell_orders:
+            triggered_sell_orders = self.stop_sell_orders[ticker].pop_triggered(current_price)
 
         for order in triggered_sell_orders:
-            self.stop_sell_orders[ticker].remove(order)
-            new_order = order.copy()
-            if order['order_type'] == 'stop_market':
-                new_order['order_type'] = 'market'
-                new_order['price'] = None
-            elif order['order_type'] == 'stop_limit':
-                new_order['order_type'] = 'limit'
-
-            if new_order['action'] == 'sell':
-                if ticker not in self.sell_orders:
-                    self.sell_orders[ticker] = deque()
-                self.sell_orders[ticker].append(new_order)
-            else:
-                if ticker not in self.buy_orders:
-                    self.buy_orders[ticker] = deque()
-                self.buy_orders[ticker].append(new_order)
-            print(f"Stop sell order {order['order_id']} triggered.")
+            self._trigger_stop_order(order, ticker)
+            self.order_journal.record(ticker, 'trigger', order_id=order.order_id)
+            if self.events.subscribers:
+                self.events.emit({'event': TRIGGERED, 'order_id': order.order_id, 'ticker': ticker, 'action': 'sell'})
 
-        self.save_unmatched_orders()
+        if triggered_buy_orders:
+            self._triggers_total.inc(('buy',), len(triggered_buy_orders))
+        if triggered_sell_orders:
+            self._triggers_total.inc(('sell',), len(triggered_sell_orders))
+        return len(triggered_buy_orders) + len(triggered_sell_orders)
 
-        # Attempt to immediately match triggered orders
-        self.match_orders(ticker, account_manager)
+    def _trigger_stop_order(self, order, ticker):
+        self._unindex_order(order)
+        self._rest_order(order.triggered(), ticker)
 
     def update_market_price(self, ticker, price, account_manager):
         """Update the market price and trigger stop orders if conditions met."""
-        self.last_trade_price[ticker] = price
-        self.check_stop_orders(ticker, price, account_manager)
+        self.load_ticker(ticker)
+        self.last_trade_ticks[ticker] = self.stock_info.to_ticks(ticker, price)
+        if not self.check_stop_orders(ticker, price, account_manager):
+            # A new last price can still let market orders on both sides trade
+            self.match_orders(ticker, account_manager)
 
     def display_order_book(self):
+        self.load_all_tickers()
         print("Order Book:")
         for ticker in set(self.buy_orders.keys()).union(self.sell_orders.keys()):
             print(f"\nTicker: {ticker}")
             print("Buy Orders:")
             for order in self.buy_orders.get(ticker, []):
-                price_display = 'Market' if order['order_type'] == 'market' else order['price']
-                print(f"  Order ID: {order['order_id']} | Account {order['account_id']} wants to buy {order['quantity']} at {price_display}")
+                price_display = 'Market' if order.order_type == OrderType.MARKET else order.price
+                print(f"  Order ID: {order.order_id} | Account {order.account_id} wants to buy {order.quantity} at {price_display}")
             print("Sell Orders:")
             for order in self.sell_orders.get(ticker, []):
-                price_display = 'Market' if order['order_type'] == 'market' else order['price']
-                print(f"  Order ID: {order['order_id']} | Account {order['account_id']} wants to sell {order['quantity']} at {price_display}")
+                price_display = 'Market' if order.order_type == OrderType.MARKET else order.price
+                print(f"  Order ID: {order.order_id} | Account {order.account_id} wants to sell {order.quantity} at {price_display}")
 
     def display_stop_orders(self):
+        self.load_all_tickers()
         print("Stop Orders:")
         for ticker in set(self.stop_buy_orders.keys()).union(self.stop_sell_orders.keys()):
             print(f"\nTicker: {ticker}")
             print("Stop Buy Orders:")
             for order in self.stop_buy_orders.get(ticker, []):
-                limit_price_display = f" Limit Price: {order['price']}" if order['order_type'] == 'stop_limit' else ''
-                print(f"  Order ID: {order['order_id']} | Account {order['account_id']} wants to buy {order['quantity']} at Stop Price: {order['stop_price']}{limit_price_display}")
+                limit_price_display = f" Limit Price: {order.price}" if order.order_type == OrderType.STOP_LIMIT else ''
+                print(f"  Order ID: {order.order_id} | Account {order.account_id} wants to buy {order.quantity} at Stop Price: {order.stop_price}{limit_price_display}")
             print("Stop Sell Orders:")
             for order in self.stop_sell_orders.get(ticker, []):
-                limit_price_display = f" Limit Price: {order['price']}" if order['order_type'] == 'stop_limit' else ''
-                print(f"  Order ID: {order['order_id']} | Account {order['account_id']} wants to sell {order['quantity']} at Stop Price: {order['stop_price']}{limit_price_display}")
-
-    def display_executed_trades(self):
-        try:
-            with open(self.executed_trades_file, 'r') as f:
-                executed_trades = json.load(f)
-                if not executed_trades:
-                    print("No executed trades found.")
-                    return
+                limit_price_display = f" Limit Price: {order.price}" if order.order_type == OrderType.STOP_LIMIT else ''
+                print(f"  Order ID: {order.order_id} | Account {order.account_id} wants to sell {order.quantity} at Stop Price: {order.stop_price}{limit_price_display}")
+
+    def query_executed_trades(self, ticker=None, account_id=None, start=None, end=None, limit=None):
+        """Lazily yield the executed trades matching every given filter, oldest first.
+
+        ``account_id`` matches the buyer or the seller; ``start`` is
+        inclusive and ``end`` exclusive (datetimes or ISO text).
+        """
+        return self.trade_journal.query(ticker=ticker, account_id=account_id, start=start, end=end, limit=limit)
+
+    def display_executed_trades(self, trades=None, page=None, limit=None, tail=None):
+        """Print executed trades (all of them, or ``trades``), streaming them from the store.
+
+        ``tail`` shows only the last ``tail`` trades. ``page`` shows one page
+        of ``limit`` trades (PAGE_SIZE by default); ``limit`` on its own
+        shows the first ``limit`` trades.
+        """
+        trades = iter(self.trade_journal if trades is None else trades)
+        first = 1
+        more = False
+        if tail is not None:
+            # Only the last ``tail`` trades are ever held in memory
+            window = deque(maxlen=tail)
+            count = 0
+            for trade in trades:
+                window.append(trade)
+                count += 1
+            first = count - len(window) + 1
+            trades = iter(window)
+        elif page is not None or limit is not None:
+            size = limit if limit is not None else self.PAGE_SIZE
+            skip = (page - 1) * size if page is not None else 0
+            first = skip + 1
+            trades = itertools.islice(trades, skip, None)
+            shown = itertools.islice(trades, size)
+            if page is not None:
+                shown = list(shown)
+                more = next(trades, None) is not None
+            trades = iter(shown)
+        found = 0
+        for trade in trades:
+            if not found:
                 print("Executed Trades:")
-                for trade in executed_trades:
-                    print(f"Trade ID: {trade.get('trade_id', 'N/A')}")
-                    print(f"  Timestamp: {trade.get('timestamp', 'N/A')}")
-                    print(f"  Ticker: {trade.get('ticker', 'N/A')}")
-                    print(f"  Price: {trade.get('price', 'N/A')}")
-                    print(f"  Quantity: {trade.get('quantity', 'N/A')}")
-                    print(f"  Buyer Account ID: {trade.get('buy_account_id', 'N/A')}")
-                    print(f"  Seller Account ID: {trade.get('sell_account_id', 'N/A')}")
-                    print()
-        except (FileNotFoundError, json.JSONDecodeError):
-            print("No executed trades found.")
-
-    def export_executed_trades(self, filename):
+            found += 1
+            for line in self._trade_lines(trade):
+                print(line)
+            print()
+        if not found:
+            if page is not None and page > 1:
+                print(f"No executed trades on page {page}.")
+            else:
+                print("No executed trades found.")
+        elif page is not None:
+            print(f"Page {page}: trades {first}-{first + found - 1}.")
+            if more:
+                print(f"Type 'executed trades display --page {page + 1}' to see more.")
+
+    @staticmethod
+    def _trade_lines(trade):
+        return (
+            f"Trade ID: {trade.get('trade_id', 'N/A')}",
+            f"  Timestamp: {format_timestamp(trade.get('timestamp', 'N/A'))}",
+            f"  Ticker: {trade.get('ticker', 'N/A')}",
+            f"  Price: {trade.get('price', 'N/A')}",
+            f"  Quantity: {trade.get('quantity', 'N/A')}",
+            f"  Buyer Account ID: {trade.get('buy_account_id', 'N/A')}",
+            f"  Seller Account ID: {trade.get('sell_account_id', 'N/A')}",
+        )
+
+    def export_executed_trades(self, filename, fmt='text'):
+        """Write the executed trades to a file as ``text``, ``csv`` or ``jsonl``.
+
+        Trades are streamed from the store and written EXPORT_CHUNK at a
+        time through a buffered file, so memory use does not grow with the
+        number of trades.
+        """
+        if fmt not in self.EXPORT_FORMATS:
+            print(f"Error: unknown export format '{fmt}'. Use one of: {', '.join(self.EXPORT_FORMATS)}.")
+            return
+        trades = iter(self.trade_journal)
+        first_trade = next(trades, None)
+        if first_trade is None:
+            print("No executed trades to export.")
+            return
+        trades = itertools.chain([first_trade], trades)
         try:
-            with open(self.executed_trades_file, 'r') as f:
-                executed_trades = json.load(f)
-                if not executed_trades:
-                    print("No executed trades to export.")
-                    return
-                with open(filename, 'w') as out_file:
-                    for trade in executed_trades:
-                        out_file.write(f"Trade ID: {trade.get('trade_id', 'N/A')}\n")
-                        out_file.write(f"  Timestamp: {trade.get('timestamp', 'N/A')}\n")
-                        out_file.write(f"  Ticker: {trade.get('ticker', 'N/A')}\n")
-                        out_file.write(f"  Price: {trade.get('price', 'N/A')}\n")
-                        out_file.write(f"  Quantity: {trade.get('quantity', 'N/A')}\n")
-                        out_file.write(f"  Buyer Account ID: {trade.get('buy_account_id', 'N/A')}\n")
-                        out_file.write(f"  Seller Account ID: {trade.get('sell_account_id', 'N/A')}\n")
-                        out_file.write("\n")
-                print(f"Executed trades exported to {filename}.")
-        except (FileNotFoundError, json.JSONDecodeError):
-            print("No executed trades found.")
+            with open(filename, 'w', newline='' if fmt == 'csv' else None, buffering=1 << 20) as out_file:
+                if fmt == 'csv':
+                    writer = csv.DictWriter(out_file, fieldnames=self.EXPORT_FIELDS, extrasaction='ignore')
+                    writer.writeheader()
+                while True:
+                    chunk = list(itertools.islice(trades, self.EXPORT_CHUNK))
+                    if not chunk:
+                        break
+                    if fmt != 'text':
+                        chunk = [dict(trade, timestamp=format_timestamp(trade.get('timestamp'))) for trade in chunk]
+                    if fmt == 'csv':
+                        writer.writerows(chunk)
+                    elif fmt == 'jsonl':
+                        out_file.write(''.join(json.dumps(trade, separators=(',', ':')) + '\n' for trade in chunk))
+                    else:
+                        out_file.write(''.join('\n'.join(self._trade_lines(trade)) + '\n\n' for trade in chunk))
+        except OSError as e:
+            print(f"Error: cannot write {filename}: {e.strerror}.")
+            return
+        print(f"Executed trades exported to {filename}.")
 
     def delete_executed_trade(self, trade_id, account_manager):
-        try:
-            with open(self.executed_trades_file, 'r') as f:
-                executed_trades = json.load(f)
-        except (FileNotFoundError, json.JSONDecodeError):
+        trade_to_delete = self.trade_journal.find(trade_id)
+        if trade_to_delete is None and next(iter(self.trade_journal), None) is None:
             print("No executed trades found.")
             return
 
-        trade_to_delete = None
-        for trade in executed_trades:
-            if trade.get('trade_id') == trade_id:
-                trade_to_delete = trade
-                break
-
         if not trade_to_delete:
             print(f"Trade ID {trade_id} not found.")
             return
@@ -592,7 +966,7 @@ class OrderBook:
         buyer_account = account_manager.get_account(buy_account_id)
         seller_account = account_manager.get_account(sell_account_id)
 
-        total_cost = price * quantity
+        total_cost = self._cash_units(ticker, quantity, self.stock_info.to_ticks(ticker, price))
         # Reverse buyer
         buyer_account['balance'] += total_cost
         buyer_positions = buyer_account['positions']
@@ -616,22 +990,49 @@ class OrderBook:
         account_manager.update_account(buy_account_id, buyer_account)
         account_manager.update_account(sell_account_id, seller_account)
 
-        executed_trades.remove(trade_to_delete)
-        with open(self.executed_trades_file, 'w') as f:
-            json.dump(executed_trades, f, indent=4)
+        self.trade_journal.delete(trade_id)
 
         print(f"Trade ID {trade_id} has been deleted and accounts have been updated.")
 
+    def get_top_of_book(self, ticker):
+        """Best bid and ask of a ticker with the open quantity and order count at each.
+
+        Returns {'bid': (price, quantity, orders) or None, 'ask': ...}. The
+        book sides keep these figures up to date as orders come and go, so
+        this does not look at individual orders.
+        """
+        self.load_ticker(ticker)
+        bid = self.buy_orders[ticker].top() if ticker in self.buy_orders else None
+        ask = self.sell_orders[ticker].top() if ticker in self.sell_orders else None
+        from_ticks = self.stock_info.from_ticks
+        return {'bid': (from_ticks(ticker, bid[0]),) + bid[1:] if bid else None,
+                'ask': (from_ticks(ticker, ask[0]),) + ask[1:] if ask else None}
+
+    def get_depth(self, ticker, levels=10):
+        """The best ``levels`` price levels of each side of a ticker's book, best first.
+
+        Returns {'bids': [(price, quantity, orders), ...], 'asks': [...]}.
+        Market orders waiting on the book have no price and are not included.
+        """
+        self.load_ticker(ticker)
+        from_ticks = self.stock_info.from_ticks
+        depth = {}
+        for key, sides in (('bids', self.buy_orders), ('asks', self.sell_orders)):
+            side = sides.get(ticker)
+            depth[key] = [] if side is None else [
+                (from_ticks(ticker, price), side.levels[price].quantity, side.levels[price].size)
+                for price in itertools.islice(side.level_prices(), levels)]
+        return depth
+
     def get_best_bid_ask(self, ticker):
+        self.load_ticker(ticker)
         best_bid = None
         best_ask = None
 
         if ticker in self.buy_orders:
-            limit_buy_orders = [o for o in self.buy_orders[ticker] if o['order_type'] == 'limit']
-            if limit_buy_orders:
-                best_bid = max(o['price'] for o in limit_buy_orders)
+            best_bid = self.buy_orders[ticker].best_price()
         if ticker in self.sell_orders:
-            limit_sell_orders = [o for o in self.sell_orders[ticker] if o['order_type'] == 'limit']
-            if limit_sell_orders:
-                best_ask = min(o['price'] for o in limit_sell_orders)
-        return best_bid, best_ask
+            best_ask = self.sell_orders[ticker].best_price()
+        from_ticks = self.stock_info.from_ticks
+        return (from_ticks(ticker, best_bid) if best_bid is not None else None,
+                from_ticks(ticker, best_ask) if best_ask is not None else None)
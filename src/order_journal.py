@@ -0,0 +1,208 @@
+import json
+import os
+import time
+from urllib.parse import quote, unquote
+
+
+class OrderJournal:
+    """Write-ahead log of order book changes with periodic snapshots.
+
+    Every change to the book (an order added, filled, cancelled or a stop
+    triggered) is appended to the journal as one JSON line carrying a
+    sequence number. Every ``checkpoint_every`` events or
+    ``checkpoint_interval`` seconds the whole book is written to the snapshot
+    file (``unmatched_orders.json``, same format as before plus the sequence
+    number it covers) and the journal is truncated. On startup the snapshot
+    is loaded and the journal events after its sequence number are replayed.
+
+    The snapshot is written before the journal is truncated, and events the
+    snapshot already covers are skipped on replay, so a crash between the
+    two steps does not apply an event twice. A journal without a snapshot
+    belongs to a book that has been reset and is discarded.
+    """
+
+    def __init__(self, snapshot_path, checkpoint_every=1000, checkpoint_interval=60.0):
+        self.snapshot_path = snapshot_path
+        self.path = os.path.splitext(snapshot_path)[0] + '.journal.jsonl'
+        self.checkpoint_every = checkpoint_every
+        self.checkpoint_interval = checkpoint_interval
+        self.sequence = 0
+        self.events_since_checkpoint = 0
+        self.last_checkpoint = time.monotonic()
+        self._file = None
+
+    def load(self):
+        """Return the snapshot dict (or None) and an iterator over the events to replay."""
+        if not os.path.exists(self.snapshot_path):
+            self.close()
+            if os.path.exists(self.path):
+                os.remove(self.path)
+            return None, iter(())
+        with open(self.snapshot_path, 'r') as f:
+            snapshot = json.load(f)
+        self.sequence = snapshot.get('sequence', 0)
+        return snapshot, self._replay_events(self.sequence)
+
+    def _replay_events(self, after_sequence):
+        try:
+            with open(self.path, 'r') as f:
+                for line in f:
+                    if not line.strip():
+                        continue
+                    try:
+                        event = json.loads(line)
+                    except json.JSONDecodeError:
+                        # A torn last line from an interrupted write
+                        continue
+                    if event['seq'] <= after_sequence:
+                        continue
+                    self.sequence = event['seq']
+                    self.events_since_checkpoint += 1
+                    yield event
+        except FileNotFoundError:
+            return
+
+    def record(self, event, **fields):
+        self.sequence += 1
+        fields['seq'] = self.sequence
+        fields['event'] = event
+        if self._file is None:
+            self._file = open(self.path, 'a')
+        self._file.write(json.dumps(fields, separators=(',', ':')) + '\n')
+        self.events_since_checkpoint += 1
+
+    def checkpoint_due(self):
+        if not self.events_since_checkpoint:
+            return False
+        return (self.events_since_checkpoint >= self.checkpoint_every
+                or time.monotonic() - self.last_checkpoint >= self.checkpoint_interval)
+
+    def flush(self):
+        if self._file is not None:
+            self._file.flush()
+
+    def checkpoint(self, data):
+        """Write the full book as the new snapshot and start an empty journal."""
+        data['sequence'] = self.sequence
+        tmp_path = self.snapshot_path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(data, f, indent=4)
+        os.replace(tmp_path, self.snapshot_path)
+        self.close()
+        with open(self.path, 'w'):
+            pass
+        self.events_since_checkpoint = 0
+        self.last_checkpoint = time.monotonic()
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+_SHARD_GROUPS = ('buy_orders', 'sell_orders', 'stop_buy_orders', 'stop_sell_orders')
+
+
+class ShardedOrderJournal:
+    """One OrderJournal per ticker, kept in a directory of shards.
+
+    ``<directory>/<ticker>.json`` is the ticker's snapshot (its four order
+    lists) and ``<ticker>.journal.jsonl`` its journal. Opening the store
+    only lists the directory; a ticker's shard is read when the OrderBook
+    asks for it. A shard's empty snapshot is written the first time the
+    ticker gets an order, so its journal is never discarded on load.
+
+    A book saved as one ``unmatched_orders.json`` (with its journal) by an
+    older version is split into shards once, the first time the store is
+    opened.
+    """
+
+    def __init__(self, directory, checkpoint_every=1000, checkpoint_interval=60.0, legacy_snapshot_path=None):
+        self.directory = directory
+        self.checkpoint_every = checkpoint_every
+        self.checkpoint_interval = checkpoint_interval
+        self.shards = {}  # {ticker: OrderJournal} for the shards opened so far
+        self.migrate_legacy(legacy_snapshot_path)
+        os.makedirs(directory, exist_ok=True)
+        self.known = set()  # tickers that have a snapshot on disk
+        for name in os.listdir(directory):
+            if name.endswith('.json'):
+                self.known.add(unquote(name[:-len('.json')]))
+
+    def shard(self, ticker):
+        journal = self.shards.get(ticker)
+        if journal is None:
+            path = os.path.join(self.directory, quote(ticker, safe='') + '.json')
+            journal = OrderJournal(path, self.checkpoint_every, self.checkpoint_interval)
+            self.shards[ticker] = journal
+        return journal
+
+    def tickers(self):
+        return set(self.known)
+
+    def load(self, ticker):
+        if ticker not in self.known:
+            return None, iter(())
+        return self.shard(ticker).load()
+
+    def record(self, ticker, event, **fields):
+        if ticker not in self.known:
+            self.checkpoint(ticker, {group: [] for group in _SHARD_GROUPS})
+        self.shard(ticker).record(event, **fields)
+
+    def checkpoint_due(self, ticker):
+        journal = self.shards.get(ticker)
+        return journal is not None and journal.checkpoint_due()
+
+    def checkpoint(self, ticker, data):
+        self.shard(ticker).checkpoint(data)
+        self.known.add(ticker)
+
+    def flush(self):
+        for journal in self.shards.values():
+            journal.flush()
+
+    def clear(self):
+        """Delete every shard."""
+        self.close()
+        self.shards = {}
+        self.known = set()
+        for name in os.listdir(self.directory):
+            if name.endswith('.json') or name.endswith('.journal.jsonl'):
+                os.remove(os.path.join(self.directory, name))
+
+    def close(self):
+        for journal in self.shards.values():
+            journal.close()
+
+    def migrate_legacy(self, snapshot_path):
+        if not snapshot_path or os.path.exists(self.directory) or not os.path.exists(snapshot_path):
+            return
+        legacy = OrderJournal(snapshot_path)
+        snapshot, events = legacy.load()
+        shards = {}
+        owners = {}  # {order_id: ticker}, to route fills, cancels and triggers
+        for group in _SHARD_GROUPS:
+            for ticker, orders in snapshot.get(group, {}).items():
+                shards.setdefault(ticker, {g: [] for g in _SHARD_GROUPS})[group] = orders
+                for order in orders:
+                    owners[order.get('order_id')] = ticker
+        os.makedirs(self.directory)
+        self.known = set()
+        for ticker, data in shards.items():
+            self.checkpoint(ticker, data)
+        for event in events:
+            if event['event'] == 'add':
+                ticker = event['order']['ticker']
+                owners[event['order'].get('order_id')] = ticker
+            else:
+                ticker = owners.get(event.get('order_id'))
+                if ticker is None:
+                    continue
+            fields = {key: value for key, value in event.items() if key not in ('seq', 'event')}
+            self.record(ticker, event['event'], **fields)
+        self.close()
+        # Keep the old files around, but out of the way of the next startup
+        os.replace(snapshot_path, snapshot_path + '.migrated')
+        if os.path.exists(legacy.path):
+            os.remove(legacy.path)
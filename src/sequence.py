@@ -0,0 +1,21 @@
+class IdSequence:
+    """Monotonic integer ids for one engine, shared by its orders and trades.
+
+    Ids are handed out from blocks reserved in a sequence store: the store
+    only records the highest reserved id, and is written once per ``block``
+    ids. After a restart numbering continues above the last reserved block,
+    so ids never repeat; a crash at most skips the unused rest of a block.
+    """
+
+    def __init__(self, store, block=1000):
+        self.store = store
+        self.block = block
+        self.last = store.load()  # the last id handed out
+        self.reserved = self.last  # ids up to this one are reserved in the store
+
+    def next(self):
+        self.last += 1
+        if self.last > self.reserved:
+            self.reserved = self.last + self.block - 1
+            self.store.save(self.reserved)
+        return self.last
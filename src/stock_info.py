@@ -1,35 +1,65 @@
-class StockInfo:
-    def __init__(self):
-        self.stocks = ['AAPL', 'MSFT', 'GOOG', 'AMZN', 'TSLA']
-        self.initial_prices = {
-            'AAPL': 150.0,
-            'MSFT': 200.0,
-            'GOOG': 2500.0,
-            'AMZN': 3300.0,
-            'TSLA': 700.0
-        }
-
-    def is_valid_ticker(self, ticker):
-        return ticker in self.stocks
-
-    def get_initial_price(self, ticker):
-        return self.initial_prices.get(ticker)
-
-    def display_stocks(self):
-        print("Available Stocks:")
-        for stock in self.stocks:
-            print(f"- {stock}")
-
-    def display_stock_info(self, ticker, order_book):
-        if not self.is_valid_ticker(ticker):
-            print(f"{ticker} is not a valid ticker.")
-            return
-        print(f"Stock Info for {ticker}:")
-        last_price = order_book.last_trade_price.get(ticker, self.get_initial_price(ticker))
-        print(f"  Last Trade Price: {last_price if last_price is not None else 'N/A'}")
-        best_bid, best_ask = order_book.get_best_bid_ask(ticker)
-        if best_bid is not None or best_ask is not None:
-            print(f"  Best Bid (Buy Price): {best_bid if best_bid is not None else 'N/A'}")
-            print(f"  Best Ask (Sell Price): {best_ask if best_ask is not None else 'N/A'}")
-        else:
-            print("  No orders available for this stock.")
+DEFAULT_TICKS_PER_UNIT = 100  # a tick of 0.01
+
+
+class StockInfo:
+    def __init__(self):
+        self.stocks = ['AAPL', 'MSFT', 'GOOG', 'AMZN', 'TSLA']
+        self.initial_prices = {
+            'AAPL': 150.0,
+            'MSFT': 200.0,
+            'GOOG': 2500.0,
+            'AMZN': 3300.0,
+            'TSLA': 700.0
+        }
+        # Prices move in whole ticks of 1 / ticks_per_unit; the order book
+        # keeps every price as an integer number of ticks
+        self.ticks_per_unit = {ticker: DEFAULT_TICKS_PER_UNIT for ticker in self.stocks}
+
+    def is_valid_ticker(self, ticker):
+        return ticker in self.stocks
+
+    def get_initial_price(self, ticker):
+        return self.initial_prices.get(ticker)
+
+    def tick_size(self, ticker):
+        return 1 / self.ticks_per_unit.get(ticker, DEFAULT_TICKS_PER_UNIT)
+
+    def to_ticks(self, ticker, price):
+        """A price in currency units as the nearest whole number of ticks."""
+        return round(price * self.ticks_per_unit.get(ticker, DEFAULT_TICKS_PER_UNIT))
+
+    def from_ticks(self, ticker, ticks):
+        return ticks / self.ticks_per_unit.get(ticker, DEFAULT_TICKS_PER_UNIT)
+
+    def on_tick(self, ticker, price):
+        """Whether a price is a whole number of ticks."""
+        scaled = price * self.ticks_per_unit.get(ticker, DEFAULT_TICKS_PER_UNIT)
+        return abs(scaled - round(scaled)) < 1e-6
+
+    def display_stocks(self):
+        print("Available Stocks:")
+        for stock in self.stocks:
+            print(f"- {stock}")
+
+    def display_stock_info(self, ticker, order_book):
+        if not self.is_valid_ticker(ticker):
+            print(f"{ticker} is not a valid ticker.")
+            return
+        print(f"Stock Info for {ticker}:")
+        last_price = order_book.last_trade_price.get(ticker, self.get_initial_price(ticker))
+        print(f"  Last Trade Price: {last_price if last_price is not None else 'N/A'}")
+        top_of_book = order_book.get_top_of_book(ticker)
+        bid = top_of_book['bid']
+        ask = top_of_book['ask']
+        if bid is not None or ask is not None:
+            print(f"  Best Bid (Buy Price): {self._format_top(bid)}")
+            print(f"  Best Ask (Sell Price): {self._format_top(ask)}")
+        else:
+            print("  No orders available for this stock.")
+
+    @staticmethod
+    def _format_top(top):
+        if top is None:
+            return 'N/A'
+        price, quantity, orders = top
+        return f"{price} | Size: {quantity} | Orders: {orders}"
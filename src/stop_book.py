@@ -0,0 +1,67 @@
+import heapq
+from itertools import count
+
+
+class StopOrders:
+    """Resting stop orders for one ticker and one action, keyed by stop price.
+
+    Stop buys trigger when the price rises to their stop price, so they are
+    kept in a min-heap on ``stop_ticks`` (the stop price in ticks); stop sells trigger when the price
+    falls to it and are kept in a max-heap (the key is negated). After a
+    trade only the triggered prefix of the heap is popped, so a trade that
+    triggers nothing only looks at the top entry.
+
+    Each heap entry is a list ``[key, seq, order]``. Cancelling an order sets
+    its ``order`` slot to None (a tombstone) instead of searching the heap;
+    tombstones are discarded when they reach the top or when they outnumber
+    the live orders. ``orders`` keeps the live entries in arrival order for
+    display and persistence.
+    """
+
+    def __init__(self, action):
+        self.action = action  # 'buy' or 'sell'
+        self.heap = []
+        self.orders = {}  # {seq: entry} for live orders, oldest first
+        self._seq = count()
+
+    def _key(self, price):
+        return price if self.action == 'buy' else -price
+
+    def append(self, order):
+        """Add a stop order and return its heap entry."""
+        seq = next(self._seq)
+        entry = [self._key(order.stop_ticks), seq, order]
+        heapq.heappush(self.heap, entry)
+        self.orders[seq] = entry
+        return entry
+
+    def remove_entry(self, entry):
+        if entry[2] is None or self.orders.get(entry[1]) is not entry:
+            return False
+        del self.orders[entry[1]]
+        entry[2] = None
+        if len(self.heap) > 2 * len(self.orders) + 64:
+            self.heap = [e for e in self.heap if e[2] is not None]
+            heapq.heapify(self.heap)
+        return True
+
+    def pop_triggered(self, current_price):
+        """Remove and return the orders whose stop price has been reached."""
+        bound = self._key(current_price)
+        heap = self.heap
+        triggered = []
+        while heap and heap[0][0] <= bound:
+            entry = heapq.heappop(heap)
+            order = entry[2]
+            if order is None:
+                continue
+            del self.orders[entry[1]]
+            triggered.append(order)
+        return triggered
+
+    def __iter__(self):
+        for entry in list(self.orders.values()):
+            yield entry[2]
+
+    def __len__(self):
+        return len(self.orders)
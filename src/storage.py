@@ -0,0 +1,495 @@
+import copy
+import json
+import os
+import sqlite3
+from contextlib import contextmanager
+from order import Order, OrderType
+from order_journal import ShardedOrderJournal
+from trade_index import as_datetime, format_timestamp, limited, matches, to_seconds
+from trade_journal import TradeJournal
+from trade_log import BinaryTradeLog
+
+# Every backend bundles three stores with the same methods:
+#   orders:   tickers(), load(ticker) -> (snapshot or None, events),
+#             record(ticker, event, **fields), checkpoint_due(ticker),
+#             checkpoint(ticker, data), flush(), clear(), close()
+#             A snapshot holds one ticker's four order lists.
+#   trades:   append(trade), iteration, find(trade_id), delete(trade_id) -> bool,
+#             rewrite(trades), clear(),
+#             query(ticker, account_id, start, end, limit) -> lazy iterator, oldest first
+#   accounts: load() -> {account_id: account}, save(accounts, changed), replace(accounts)
+#             Balances are whole cents; see CASH_SCALE.
+#   sequence: load() -> highest reserved id (0 at first), save(value); see IdSequence
+# OrderBook and AccountManager only talk to these methods.
+
+_BOOK_GROUPS = ('buy_orders', 'sell_orders', 'stop_buy_orders', 'stop_sell_orders')
+# Account balances are kept in memory as whole minor units (cents) and
+# written to files and rows in currency units, so the account stores that
+# persist them convert as they read and write.
+CASH_SCALE = 100
+
+
+def _book_group(order):
+    stop = order['order_type'] in ('stop_market', 'stop_limit')
+    return ('stop_' if stop else '') + order['action'] + '_orders'
+
+
+def _empty_shard():
+    return {group: [] for group in _BOOK_GROUPS}
+
+
+def _stored_account(account):
+    return dict(account, balance=account['balance'] / CASH_SCALE)
+
+
+def _loaded_account(account):
+    return dict(account, balance=round(account['balance'] * CASH_SCALE))
+
+
+class JsonAccountStore:
+    def __init__(self, path):
+        self.path = path
+
+    def load(self):
+        try:
+            with open(self.path, 'r') as file:
+                accounts = json.load(file)
+        except FileNotFoundError:
+            return {}
+        return {account_id: _loaded_account(account) for account_id, account in accounts.items()}
+
+    def save(self, accounts, changed):
+        # One JSON document: every save writes all accounts
+        self.replace(accounts)
+
+    def replace(self, accounts):
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w') as file:
+            json.dump({account_id: _stored_account(account) for account_id, account in accounts.items()},
+                      file, indent=4)
+        os.replace(tmp_path, self.path)
+
+
+class JsonSequenceStore:
+    def __init__(self, path):
+        self.path = path
+
+    def load(self):
+        try:
+            with open(self.path, 'r') as file:
+                return json.load(file)['reserved']
+        except FileNotFoundError:
+            return 0
+
+    def save(self, value):
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w') as file:
+            json.dump({'reserved': value}, file)
+        os.replace(tmp_path, self.path)
+
+
+class JsonStorage:
+    """The default backend: the order journal and checkpoint, the trades
+    JSON-Lines file and accounts.json.
+
+    With ``trade_log='binary'`` trades go to a fixed-width binary log
+    (``executed_trades.bin``) instead of the JSON-Lines file. The id
+    sequence is kept in ``sequence.json`` next to the order files.
+    """
+
+    def __init__(self, unmatched_orders_file='unmatched_orders.json', executed_trades_file='executed_trades.jsonl',
+                 account_file='accounts.json', checkpoint_every=1000, checkpoint_interval=60.0, trade_log='jsonl',
+                 sequence_file=None):
+        # unmatched_orders.json -> one shard per ticker in unmatched_orders/
+        self.orders = ShardedOrderJournal(os.path.splitext(unmatched_orders_file)[0], checkpoint_every,
+                                          checkpoint_interval, legacy_snapshot_path=unmatched_orders_file)
+        if trade_log == 'binary':
+            self.trades = BinaryTradeLog(os.path.splitext(executed_trades_file)[0] + '.bin')
+        elif trade_log == 'jsonl':
+            # Trades used to be kept as one JSON array in executed_trades.json
+            legacy_trades_file = executed_trades_file[:-1] if executed_trades_file.endswith('.jsonl') else None
+            self.trades = TradeJournal(executed_trades_file, legacy_trades_file)
+        else:
+            raise ValueError(f"Unknown trade log format: {trade_log}")
+        self.accounts = JsonAccountStore(account_file)
+        if sequence_file is None:
+            sequence_file = os.path.join(os.path.dirname(unmatched_orders_file), 'sequence.json')
+        self.sequence = JsonSequenceStore(sequence_file)
+
+    def close(self):
+        self.orders.close()
+
+
+class MemoryOrderStore:
+    def __init__(self, checkpoint_every=1000):
+        self.checkpoint_every = checkpoint_every
+        self.snapshots = {}  # {ticker: snapshot}
+        self.events = {}     # {ticker: [events since the snapshot]}
+
+    def tickers(self):
+        return set(self.snapshots)
+
+    def load(self, ticker):
+        if ticker not in self.snapshots:
+            return None, iter(())
+        return copy.deepcopy(self.snapshots[ticker]), iter(copy.deepcopy(self.events[ticker]))
+
+    def record(self, ticker, event, **fields):
+        if ticker not in self.snapshots:
+            self.checkpoint(ticker, _empty_shard())
+        fields['event'] = event
+        self.events[ticker].append(fields)
+
+    def checkpoint_due(self, ticker):
+        return len(self.events.get(ticker, ())) >= self.checkpoint_every
+
+    def checkpoint(self, ticker, data):
+        self.snapshots[ticker] = copy.deepcopy(data)
+        self.events[ticker] = []
+
+    def flush(self):
+        pass
+
+    def clear(self):
+        self.snapshots = {}
+        self.events = {}
+
+    def close(self):
+        pass
+
+
+class MemoryTradeStore:
+    def __init__(self):
+        self.trades = {}  # {trade_id: trade}, oldest first
+
+    def append(self, trade):
+        self.trades[trade.get('trade_id')] = dict(trade)
+
+    def __iter__(self):
+        return iter(list(self.trades.values()))
+
+    def find(self, trade_id):
+        return self.trades.get(trade_id)
+
+    def delete(self, trade_id):
+        return self.trades.pop(trade_id, None) is not None
+
+    def query(self, ticker=None, account_id=None, start=None, end=None, limit=None):
+        account_id = None if account_id is None else str(account_id)
+        start = None if start is None else to_seconds(start)
+        end = None if end is None else to_seconds(end)
+        return limited((trade for trade in self if matches(trade, ticker, account_id, start, end)), limit)
+
+    def rewrite(self, trades):
+        self.trades = {}
+        for trade in trades:
+            self.append(trade)
+
+    def clear(self):
+        self.trades = {}
+
+
+class MemoryAccountStore:
+    def __init__(self):
+        self.accounts = {}
+
+    def load(self):
+        return copy.deepcopy(self.accounts)
+
+    def save(self, accounts, changed):
+        for account_id in changed:
+            self.accounts[account_id] = copy.deepcopy(accounts[account_id])
+
+    def replace(self, accounts):
+        self.accounts = copy.deepcopy(accounts)
+
+
+class MemorySequenceStore:
+    def __init__(self):
+        self.value = 0
+
+    def load(self):
+        return self.value
+
+    def save(self, value):
+        self.value = value
+
+
+class MemoryStorage:
+    """Keeps everything in this process; for tests and throwaway sessions.
+
+    Two OrderBooks built on the same MemoryStorage behave like a restart.
+    """
+
+    def __init__(self, checkpoint_every=1000):
+        self.orders = MemoryOrderStore(checkpoint_every)
+        self.trades = MemoryTradeStore()
+        self.accounts = MemoryAccountStore()
+        self.sequence = MemorySequenceStore()
+
+    def close(self):
+        pass
+
+
+class SqliteOrderStore:
+    """Resting and stop orders as rows of the ``orders`` table.
+
+    Each event updates the table directly, so there is nothing to replay
+    and no checkpoint to take. ``seq`` is the arrival order the book is
+    rebuilt in; a triggered stop order gets a new one, as it joins the back
+    of its price level.
+    """
+
+    def __init__(self, db):
+        self.db = db
+        row = db.conn.execute('SELECT MAX(seq) FROM orders').fetchone()
+        self.sequence = row[0] or 0
+
+    def tickers(self):
+        return {ticker for (ticker,) in self.db.conn.execute('SELECT DISTINCT ticker FROM orders')}
+
+    def load(self, ticker):
+        data = _empty_shard()
+        for quantity, order_json in self.db.conn.execute(
+                'SELECT quantity, data FROM orders WHERE ticker = ? ORDER BY seq', (ticker,)):
+            order = json.loads(order_json)
+            order['quantity'] = quantity
+            data[_book_group(order)].append(order)
+        return data, iter(())
+
+    def _latest(self, order_id):
+        # A reused order_id refers to the newest order, as in the book's index
+        return self.db.conn.execute(
+            'SELECT seq, quantity, data FROM orders WHERE order_id = ? ORDER BY seq DESC LIMIT 1',
+            (order_id,)).fetchone()
+
+    def _insert(self, order):
+        self.sequence += 1
+        self.db.conn.execute(
+            'INSERT INTO orders (seq, order_id, ticker, quantity, data) VALUES (?, ?, ?, ?, ?)',
+            (self.sequence, order['order_id'], order['ticker'], order['quantity'],
+             json.dumps(order, separators=(',', ':'))))
+
+    def record(self, ticker, event, **fields):
+        self.db.begin()
+        conn = self.db.conn
+        if event == 'add':
+            self._insert(fields['order'])
+            return
+        row = self._latest(fields['order_id'])
+        if row is None:
+            return
+        seq, quantity, order_json = row
+        if event == 'fill':
+            quantity -= fields['quantity']
+            if quantity > 0:
+                conn.execute('UPDATE orders SET quantity = ? WHERE seq = ?', (quantity, seq))
+            else:
+                conn.execute('DELETE FROM orders WHERE seq = ?', (seq,))
+        elif event == 'cancel':
+            conn.execute('DELETE FROM orders WHERE seq = ?', (seq,))
+        elif event == 'trigger':
+            order = Order.from_dict(json.loads(order_json))
+            if order.order_type in (OrderType.STOP_MARKET, OrderType.STOP_LIMIT):
+                conn.execute('DELETE FROM orders WHERE seq = ?', (seq,))
+                order.quantity = quantity
+                self._insert(order.triggered().to_dict())
+
+    def checkpoint_due(self, ticker):
+        return False
+
+    def checkpoint(self, ticker, data):
+        """Replace the stored orders of ``ticker`` with ``data``."""
+        with self.db.write():
+            self.db.conn.execute('DELETE FROM orders WHERE ticker = ?', (ticker,))
+            for group in _BOOK_GROUPS:
+                for order in data.get(group, ()):
+                    self._insert(order)
+
+    def flush(self):
+        self.db.commit()
+
+    def clear(self):
+        with self.db.write():
+            self.db.conn.execute('DELETE FROM orders')
+
+    def close(self):
+        self.db.commit()
+
+
+class SqliteTradeStore:
+    def __init__(self, db):
+        self.db = db
+
+    def append(self, trade):
+        self.db.begin()
+        # The timestamp column is ISO text in local time, like the bounds of a query
+        self.db.conn.execute(
+            'INSERT INTO trades (trade_id, ticker, timestamp, data) VALUES (?, ?, ?, ?)',
+            (trade.get('trade_id'), trade.get('ticker'), format_timestamp(trade.get('timestamp')),
+             json.dumps(trade, separators=(',', ':'))))
+
+    def __iter__(self):
+        for (trade_json,) in self.db.conn.execute('SELECT data FROM trades ORDER BY seq'):
+            yield json.loads(trade_json)
+
+    def find(self, trade_id):
+        row = self.db.conn.execute('SELECT data FROM trades WHERE trade_id = ?', (trade_id,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def delete(self, trade_id):
+        with self.db.write():
+            return self.db.conn.execute('DELETE FROM trades WHERE trade_id = ?', (trade_id,)).rowcount > 0
+
+    def query(self, ticker=None, account_id=None, start=None, end=None, limit=None):
+        conditions, params = [], []
+        if ticker is not None:
+            conditions.append('ticker = ?')
+            params.append(ticker)
+        if account_id is not None:
+            # Both sides have an expression index, which SQLite combines for the OR
+            conditions.append("(json_extract(data, '$.buy_account_id') = ?"
+                              " OR json_extract(data, '$.sell_account_id') = ?)")
+            params += [str(account_id), str(account_id)]
+        # Timestamps are ISO text, so they compare in time order
+        if start is not None:
+            conditions.append('timestamp >= ?')
+            params.append(as_datetime(start).isoformat())
+        if end is not None:
+            conditions.append('timestamp < ?')
+            params.append(as_datetime(end).isoformat())
+        sql = 'SELECT data FROM trades'
+        if conditions:
+            sql += ' WHERE ' + ' AND '.join(conditions)
+        sql += ' ORDER BY seq'
+        if limit is not None:
+            sql += ' LIMIT ?'
+            params.append(limit)
+        for (trade_json,) in self.db.conn.execute(sql, params):
+            yield json.loads(trade_json)
+
+    def rewrite(self, trades):
+        trades = list(trades)  # the trades may be read from this table
+        with self.db.write():
+            self.db.conn.execute('DELETE FROM trades')
+            for trade in trades:
+                self.append(trade)
+
+    def clear(self):
+        self.rewrite([])
+
+
+class SqliteAccountStore:
+    def __init__(self, db):
+        self.db = db
+
+    def load(self):
+        return {account_id: _loaded_account(json.loads(account_json))
+                for account_id, account_json in self.db.conn.execute('SELECT account_id, data FROM accounts')}
+
+    def save(self, accounts, changed):
+        with self.db.write():
+            self.db.conn.executemany(
+                'INSERT OR REPLACE INTO accounts (account_id, data) VALUES (?, ?)',
+                [(account_id, json.dumps(_stored_account(accounts[account_id]))) for account_id in changed])
+
+    def replace(self, accounts):
+        with self.db.write():
+            self.db.conn.execute('DELETE FROM accounts')
+            self.save(accounts, list(accounts))
+
+
+class SqliteSequenceStore:
+    def __init__(self, db):
+        self.db = db
+
+    def load(self):
+        row = self.db.conn.execute("SELECT value FROM sequence WHERE name = 'ids'").fetchone()
+        return row[0] if row else 0
+
+    def save(self, value):
+        # Joins the open transaction, so it is committed with the ids it covers
+        self.db.begin()
+        self.db.conn.execute("INSERT OR REPLACE INTO sequence (name, value) VALUES ('ids', ?)", (value,))
+
+
+class SqliteStorage:
+    """Orders, trades and accounts in one SQLite database in WAL mode.
+
+    The order and trade writes of one add, cancel or matching run share a
+    transaction that is committed when the OrderBook saves its changes, so
+    a fill costs a few indexed row writes whatever the size of the history.
+    Statements use fixed SQL text, which sqlite3 keeps prepared in its
+    statement cache.
+    """
+
+    SCHEMA = (
+        'CREATE TABLE IF NOT EXISTS orders ('
+        ' seq INTEGER PRIMARY KEY, order_id TEXT, ticker TEXT NOT NULL,'
+        ' quantity REAL NOT NULL, data TEXT NOT NULL)',
+        'CREATE INDEX IF NOT EXISTS orders_order_id ON orders (order_id)',
+        'CREATE INDEX IF NOT EXISTS orders_ticker ON orders (ticker, seq)',
+        'CREATE TABLE IF NOT EXISTS trades ('
+        ' seq INTEGER PRIMARY KEY AUTOINCREMENT, trade_id TEXT, ticker TEXT,'
+        ' timestamp TEXT, data TEXT NOT NULL)',
+        'CREATE INDEX IF NOT EXISTS trades_trade_id ON trades (trade_id)',
+        'CREATE INDEX IF NOT EXISTS trades_ticker ON trades (ticker, seq)',
+        "CREATE INDEX IF NOT EXISTS trades_buyer ON trades (json_extract(data, '$.buy_account_id'), seq)",
+        "CREATE INDEX IF NOT EXISTS trades_seller ON trades (json_extract(data, '$.sell_account_id'), seq)",
+        'CREATE INDEX IF NOT EXISTS trades_timestamp ON trades (timestamp)',
+        'CREATE TABLE IF NOT EXISTS accounts (account_id TEXT PRIMARY KEY, data TEXT NOT NULL)',
+        'CREATE TABLE IF NOT EXISTS sequence (name TEXT PRIMARY KEY, value INTEGER NOT NULL)',
+    )
+
+    def __init__(self, path='trading.db'):
+        self.path = path
+        # Transactions are started and committed explicitly
+        self.conn = sqlite3.connect(path, isolation_level=None)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        for statement in self.SCHEMA:
+            self.conn.execute(statement)
+        self.orders = SqliteOrderStore(self)
+        self.trades = SqliteTradeStore(self)
+        self.accounts = SqliteAccountStore(self)
+        self.sequence = SqliteSequenceStore(self)
+
+    def begin(self):
+        if not self.conn.in_transaction:
+            self.conn.execute('BEGIN')
+
+    def commit(self):
+        if self.conn.in_transaction:
+            self.conn.execute('COMMIT')
+
+    @contextmanager
+    def write(self):
+        """Run the block in the open transaction, or in one of its own."""
+        if self.conn.in_transaction:
+            yield
+            return
+        self.conn.execute('BEGIN')
+        try:
+            yield
+        except BaseException:
+            self.conn.execute('ROLLBACK')
+            raise
+        self.conn.execute('COMMIT')
+
+    def close(self):
+        self.commit()
+        self.conn.close()
+
+
+def open_storage(kind='json', path=None, trade_log='jsonl'):
+    """Build the storage backend called ``kind``: 'json', 'sqlite' or 'memory'.
+
+    ``trade_log`` picks the trades file format of the json backend.
+    """
+    if kind == 'json':
+        return JsonStorage(trade_log=trade_log)
+    if kind == 'sqlite':
+        return SqliteStorage(path or 'trading.db')
+    if kind == 'memory':
+        return MemoryStorage()
+    raise ValueError(f"Unknown storage backend: {kind}")
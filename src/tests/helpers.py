@@ -0,0 +1,41 @@
+"""Helpers shared by the tests; import them with ``from helpers import make_book, make_trade, order``."""
+import time
+from account import AccountManager, to_minor_units
+from order_execution import OrderBook
+from stock_info import StockInfo
+from storage import MemoryStorage
+
+DEFAULT_POSITIONS = {'1': {}, '2': {'AAPL': 100, 'TSLA': 100}}
+
+
+def make_book(positions=None, storage=None, balance=100000.0, **options):
+    """An OrderBook and its AccountManager on one storage, in memory unless one is given.
+
+    Accounts '1' and '2' start with ``balance`` in cash and the shares in
+    ``positions`` ({account_id: {ticker: shares}}); by default '2' holds 100
+    AAPL and 100 TSLA and '1' holds none. Accounts already in the storage
+    are kept. ``options`` (events, metrics) go to the OrderBook, and a
+    metrics registry is shared with the AccountManager.
+    """
+    storage = storage if storage is not None else MemoryStorage()
+    account_manager = AccountManager(storage=storage, metrics=options.get('metrics'))
+    if not account_manager.accounts:
+        positions = DEFAULT_POSITIONS if positions is None else positions
+        account_manager.reset_accounts({
+            account_id: {'balance': to_minor_units(balance), 'positions': dict(positions.get(account_id, {}))}
+            for account_id in ('1', '2')
+        })
+    return OrderBook(StockInfo(), storage=storage, **options), account_manager
+
+
+def order(action, account_id, quantity, price, order_type='limit', **extra):
+    """An AAPL order stamped now; ``extra`` adds fields or overrides these (ticker, timestamp, ...)."""
+    return dict({'action': action, 'ticker': 'AAPL', 'quantity': quantity, 'price': price,
+                 'account_id': account_id, 'order_type': order_type, 'timestamp': time.time_ns()}, **extra)
+
+
+def make_trade(trade_id, ticker='AAPL', price=150.0, quantity=10.0, buyer='1', seller='2',
+               timestamp='2024-12-01T10:30:00'):
+    """An executed trade as the trade stores keep it; ``timestamp`` may also be ``time.time_ns()``."""
+    return {'trade_id': trade_id, 'ticker': ticker, 'price': price, 'quantity': quantity,
+            'buy_account_id': buyer, 'sell_account_id': seller, 'timestamp': timestamp}
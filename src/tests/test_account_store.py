@@ -0,0 +1,107 @@
+"""
+Scenarios for the write-behind account store:
+1. Updates are kept in memory until enough accounts are dirty.
+2. sync() writes pending changes, balances in currency units, and a new manager reads them back in cents.
+3. An elapsed flush interval writes on the next update, or when flush_if_due() is called while idle.
+4. Fills no longer rewrite accounts.json once per side.
+5. A manager that is garbage collected with unsaved changes writes them first, even when its metrics
+   registry lives on.
+"""
+import gc
+import json
+import os
+import time
+from datetime import datetime
+from account import AccountManager
+from metrics import MetricsRegistry
+from order_execution import OrderBook
+from stock_info import StockInfo
+
+
+def read_accounts(path):
+    with open(path) as f:
+        return json.load(f)
+
+
+def test_updates_flushed_at_dirty_count(tmp_path):
+    path = str(tmp_path / 'accounts.json')
+    account_manager = AccountManager(path, flush_every=3, flush_interval=3600)
+    account_manager.update_account('1', {'balance': 100, 'positions': {}})
+    account_manager.get_account('2')
+    assert not os.path.exists(path)
+    assert account_manager.dirty == {'1', '2'}
+
+    account_manager.update_account('3', {'balance': 300, 'positions': {}})
+    assert set(read_accounts(path)) == {'1', '2', '3'}
+    assert not account_manager.dirty
+
+
+def test_sync_writes_pending_changes(tmp_path):
+    path = str(tmp_path / 'accounts.json')
+    account_manager = AccountManager(path, flush_interval=3600)
+    account_manager.update_account('1', {'balance': 4250, 'positions': {'AAPL': 5}})
+    account_manager.sync()
+    assert read_accounts(path) == {'1': {'balance': 42.5, 'positions': {'AAPL': 5}}}
+    assert AccountManager(path).get_account('1') == {'balance': 4250, 'positions': {'AAPL': 5}}
+
+
+def test_flush_interval(tmp_path):
+    path = str(tmp_path / 'accounts.json')
+    account_manager = AccountManager(path, flush_interval=0)
+    account_manager.update_account('1', {'balance': 100, 'positions': {}})
+    assert read_accounts(path) == {'1': {'balance': 1.0, 'positions': {}}}
+
+    account_manager = AccountManager(path, flush_interval=0.05)
+    account_manager.update_account('2', {'balance': 200, 'positions': {}})
+    account_manager.flush_if_due()
+    assert set(read_accounts(path)) == {'1'}
+    time.sleep(0.06)
+    account_manager.flush_if_due()
+    assert set(read_accounts(path)) == {'1', '2'}
+    assert not account_manager.dirty
+
+
+def test_fills_do_not_rewrite_accounts(tmp_path, monkeypatch):
+    account_manager = AccountManager(str(tmp_path / 'accounts.json'), flush_interval=3600)
+    account_manager.accounts = {
+        '1': {'balance': 10000000, 'positions': {}},
+        '2': {'balance': 0, 'positions': {'AAPL': 100}},
+    }
+    saves = []
+    monkeypatch.setattr(account_manager, 'save_accounts', lambda: saves.append(1))
+    order_book = OrderBook(StockInfo(), unmatched_orders_file=str(tmp_path / 'unmatched_orders.json'),
+                           executed_trades_file=str(tmp_path / 'executed_trades.jsonl'))
+    for i in range(10):
+        for action, account_id in (('sell', '2'), ('buy', '1')):
+            order_book.add_order({'action': action, 'ticker': 'AAPL', 'quantity': 1, 'price': 150.0,
+                                  'account_id': account_id, 'order_type': 'limit', 'timestamp': datetime.now(),
+                                  'order_id': f'{action}{i}'}, account_manager)
+            order_book.match_orders('AAPL', account_manager)
+
+    assert account_manager.accounts['1']['positions']['AAPL'] == 10
+    assert saves == []
+    assert account_manager.dirty == {'1', '2'}
+
+
+def test_collected_manager_writes_changes(tmp_path):
+    path = str(tmp_path / 'accounts.json')
+    account_manager = AccountManager(path, flush_interval=3600)
+    account_manager.accounts = {'1': {'balance': 500, 'positions': {}}}
+    account_manager.update_account('2', {'balance': 700, 'positions': {'AAPL': 1}})
+    assert not os.path.exists(path)
+    del account_manager
+    gc.collect()
+    assert read_accounts(path) == {'1': {'balance': 5.0, 'positions': {}},
+                                   '2': {'balance': 7.0, 'positions': {'AAPL': 1}}}
+
+
+def test_collected_manager_with_shared_registry(tmp_path):
+    path = str(tmp_path / 'accounts.json')
+    registry = MetricsRegistry()
+    account_manager = AccountManager(path, flush_interval=3600, metrics=registry)
+    account_manager.update_account('1', {'balance': 500, 'positions': {}})
+    assert registry.metrics['engine_dirty_accounts'].value() == 1
+    del account_manager
+    gc.collect()
+    assert read_accounts(path) == {'1': {'balance': 5.0, 'positions': {}}}
+    assert registry.metrics['engine_accounts'].value() == 1
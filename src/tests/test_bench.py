@@ -0,0 +1,83 @@
+"""
+Scenarios for the benchmark suite:
+1. The order flow follows the seed, the mix, the ticker skew and the book depth, and cancels earlier orders.
+2. Percentiles use nearest rank and summaries report ops/sec, p50/p99/p999 and p50 per phase.
+3. A short run on each backend times every engine operation and its results can be saved as JSON.
+4. Comparing with a baseline flags slower runs, skips thin percentiles, and the command exits 1 on a regression.
+"""
+import json
+from collections import Counter
+import pytest
+from bench.__main__ import main as bench_main
+from bench.runner import compare, percentile, run, summarize
+from bench.workload import generate, parse_mix
+from stock_info import StockInfo
+
+
+def test_order_flow():
+    steps = list(generate(StockInfo(), 2000, seed=7))
+    again = list(generate(StockInfo(), 2000, seed=7))
+    for operation, args in steps + again:
+        if operation == 'add_order':
+            del args[0]['timestamp']
+    assert steps == again
+    kinds = Counter(operation for operation, _ in steps)
+    assert kinds['add_order'] > kinds['cancel_order'] + kinds['cancel_stop_order'] > kinds['update_market_price'] > 0
+
+    placed = {args[0]['order_id'] for operation, args in steps if operation == 'add_order'}
+    assert all(args[1] in placed for operation, args in steps if operation.startswith('cancel'))
+
+    only_limits = list(generate(StockInfo(), 500, mix=parse_mix('limit=1'), depth=3))
+    prices = {args[0]['price'] for _, args in only_limits if args[0]['ticker'] == 'AAPL'}
+    assert {args[0]['order_type'] for _, args in only_limits} == {'limit'}
+    assert prices <= {150.0 + tick / 100 for tick in range(-3, 4)}
+
+    stock_info = StockInfo()
+    skewed = Counter(args[0]['ticker'] for _, args in generate(stock_info, 2000, parse_mix('limit=1'), 8, skew=3.0))
+    assert len(stock_info.stocks) == 8 and skewed.most_common(1)[0][0] == 'AAPL'
+    assert skewed['AAPL'] > 0.7 * 2000
+
+    with pytest.raises(ValueError):
+        parse_mix('limit=1,iceberg=2')
+
+
+def test_percentiles_and_summary():
+    ordered = list(range(1, 1001))
+    assert [percentile(ordered, pct) for pct in (50, 99, 99.9, 100)] == [500, 990, 999, 1000]
+    assert percentile([], 50) is None
+    stats = summarize([2000] * 500 + [4000] * 500)
+    assert stats['count'] == 1000 and stats['ops_per_sec'] == pytest.approx(1e6 / 3)
+    assert (stats['p50_us'], stats['p99_us'], stats['p999_us']) == (2.0, 4.0, 4.0)
+    assert stats['p50_by_phase_us'] == [2.0] * 5 + [4.0] * 5
+
+
+@pytest.mark.parametrize('storage', ['json', 'binary', 'sqlite', 'memory'])
+def test_run(storage):
+    results = run(count=400, storage=storage, seed=3)
+    operations = results['operations']
+    assert {'add_order', 'match_orders', 'cancel_order', 'save_executed_trade'} <= set(operations)
+    assert operations['save_executed_trade']['count'] == results['fills'] > 0
+    assert all(stats['p50_us'] <= stats['p99_us'] <= stats['p999_us'] for stats in operations.values())
+    assert json.loads(json.dumps(results)) == results
+
+
+def fake_results(count, p99_us, ops_per_sec=1000.0):
+    return {'config': {}, 'operations': {'add_order': {
+        'count': count, 'ops_per_sec': ops_per_sec, 'p50_us': 10.0, 'p99_us': p99_us, 'p999_us': p99_us}}}
+
+
+def test_compare_with_baseline(tmp_path, capsys):
+    rows = compare(fake_results(20000, 130.0, 850.0), fake_results(20000, 100.0), threshold=0.10)
+    regressed = {metric for _, metric, _, _, _, flag in rows if flag}
+    assert regressed == {'ops_per_sec', 'p99_us', 'p999_us'}
+    rows = compare(fake_results(500, 130.0), fake_results(20000, 100.0))
+    assert [metric for _, metric, *_ in rows] == ['ops_per_sec', 'p50_us']
+
+    baseline = tmp_path / 'baseline.json'
+    assert bench_main(['--count', '300', '--storage', 'memory', '--save', str(baseline)]) == 0
+    saved = json.loads(baseline.read_text())
+    for stats in saved['operations'].values():
+        stats['ops_per_sec'] *= 100
+    baseline.write_text(json.dumps(saved))
+    assert bench_main(['--count', '300', '--storage', 'memory', '--baseline', str(baseline)]) == 1
+    assert "REGRESSION" in capsys.readouterr().out
@@ -19,7 +19,7 @@ def test_console_based_order_book_update(capsys):
     # Add an account with sufficient balance and positions
     account_manager.accounts = {
         "account_1": {
-            "balance": 10000.0,
+            "balance": 1000000,
             "positions": {"AAPL": 10}  # Ensure enough shares for the sell order
         }
     }
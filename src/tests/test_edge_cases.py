@@ -5,15 +5,15 @@ from stock_info import StockInfo
 from datetime import datetime
 
 @pytest.fixture
-def setup_environment():
+def setup_environment(tmp_path):
     """Set up the environment with test accounts and stocks."""
-    account_manager = AccountManager()
+    account_manager = AccountManager(str(tmp_path / 'accounts.json'))
     account_manager.update_account("user1", {
-        "balance": 5000,
+        "balance": 500000,
         "positions": {"AAPL": 10}
     })
     account_manager.update_account("user2", {
-        "balance": 2000,
+        "balance": 200000,
         "positions": {"GOOGL": 5}
     })
 
@@ -42,7 +42,7 @@ def test_all_or_nothing_order(setup_environment):
 
     # Validate order remains pending due to insufficient shares
     assert success is False, "Order should fail due to insufficient shares."
-    assert account_manager.get_account("user1")["balance"] == 5000, "User1's balance should not change for failed orders."
+    assert account_manager.get_account("user1")["balance"] == 500000, "User1's balance should not change for failed orders."
 
 def test_insufficient_funds(setup_environment):
     """Test handling of insufficient funds."""
@@ -62,7 +62,7 @@ def test_insufficient_funds(setup_environment):
 
     # Validate order is rejected due to insufficient funds
     assert success is False, "Order should fail due to insufficient funds."
-    assert account_manager.get_account("user2")["balance"] == 2000, "User2's balance should not change for failed orders."
+    assert account_manager.get_account("user2")["balance"] == 200000, "User2's balance should not change for failed orders."
 
 def test_partial_order_execution(setup_environment):
     """Test partial execution of an order."""
@@ -117,5 +117,5 @@ def test_data_integrity_after_multiple_orders(setup_environment):
     user1_account = account_manager.get_account("user1")
     user2_account = account_manager.get_account("user2")
 
-    assert user1_account["balance"] <= 5000, "User1's balance should be updated."
+    assert user1_account["balance"] <= 500000, "User1's balance should be updated."
     assert user2_account["positions"].get("GOOGL", 0) <= 5, "User2's holdings should decrease."
@@ -0,0 +1,80 @@
+"""
+Scenarios for the engine's event output:
+1. Orders accepted and rejected, fills, stop triggers, cancels and cascades reach subscribers as typed events.
+2. The console printer keeps the old messages; quiet mode prints only rejections and cancellations.
+3. With the null sink nothing is printed and matching works the same.
+4. The file writer buffers events as JSON Lines until it is flushed or closed.
+"""
+import json
+from events import ConsolePrinter, EventFileWriter, EventSink, null_sink
+from helpers import make_book, order
+
+POSITIONS = {'1': {'AAPL': 100}, '2': {'AAPL': 100}}  # both accounts can sell
+
+
+def play(order_book, account_manager):
+    order_book.add_order(order('sell', '1', 5, 150.0), account_manager)
+    order_book.add_order(order('sell', '2', 1, None, 'stop_market', stop_price=149.0), account_manager)
+    order_book.add_order(order('buy', '2', 5, 148.0), account_manager)
+    order_book.add_order(order('sell', '1', 5, 148.0), account_manager)
+    order_book.add_order(order('buy', '1', 5, 1.0e9), account_manager)
+    order_book.cancel_order('1', '1')
+    order_book.cancel_order('1', 'nope')
+
+
+def test_typed_events():
+    seen = []
+    order_book, account_manager = make_book(POSITIONS, events=EventSink([seen.append]))
+    play(order_book, account_manager)
+    kinds = [event['event'] for event in seen]
+    assert kinds == ['accepted', 'accepted', 'accepted', 'accepted', 'filled', 'triggered', 'cascade',
+                     'rejected', 'cancelled', 'rejected']
+    fill = seen[4]
+    assert (fill['price'], fill['quantity'], fill['buy_account_id'], fill['sell_account_id']) == (148.0, 5.0, '2', '1')
+    assert fill['trade_id'] and fill['sell_order_id'] == seen[3]['order_id']
+    assert seen[5] == {'event': 'triggered', 'order_id': seen[1]['order_id'], 'ticker': 'AAPL', 'action': 'sell'}
+    assert seen[7]['request'] == 'order' and 'enough balance' in seen[7]['error']
+    assert seen[8] == {'event': 'cancelled', 'order_id': '1', 'ticker': 'AAPL', 'account_id': '1',
+                       'stop': False, 'reason': 'request'}
+    assert seen[9]['request'] == 'cancel' and seen[9]['order_id'] == 'nope'
+
+
+def test_console_printer(capsys):
+    order_book, account_manager = make_book(POSITIONS)
+    play(order_book, account_manager)
+    lines = capsys.readouterr().out.splitlines()
+    assert lines[:2] == ["Order added to the order book with Order ID: 1", "Stop order added with Order ID: 2"]
+    assert "Executed 5.0 shares of AAPL at 148.0 between Account 2 (buy) and Account 1 (sell)." in lines
+    assert "Stop sell order 2 triggered." in lines
+    assert any(line.startswith("Stop cascade on AAPL: depth 1, 1 stop orders triggered") for line in lines)
+    assert lines[-3:] == ["Error: Account 1 does not have enough balance to place this buy order.",
+                          "Order 1 canceled.", "Order ID nope not found for Account 1."]
+
+    order_book, account_manager = make_book(POSITIONS, events=EventSink([ConsolePrinter(quiet=True)]))
+    play(order_book, account_manager)
+    assert capsys.readouterr().out.splitlines() == lines[-3:]
+
+
+def test_null_sink(capsys):
+    order_book, account_manager = make_book(POSITIONS, events=null_sink())
+    play(order_book, account_manager)
+    assert capsys.readouterr().out == ""
+    assert order_book.fill_count == 1
+    assert account_manager.accounts['2']['positions'] == {'AAPL': 105.0}
+
+
+def test_file_writer(tmp_path):
+    path = tmp_path / 'events.jsonl'
+    writer = EventFileWriter(str(path))
+    sink = EventSink([writer])
+    order_book, account_manager = make_book(POSITIONS, events=sink)
+    order_book.add_order(order('sell', '1', 5, 150.0), account_manager)
+    assert path.read_text() == ""
+    writer.flush()
+    assert json.loads(path.read_text())['event'] == 'accepted'
+    order_book.add_order(order('buy', '2', 5, 150.0), account_manager)
+    sink.close()
+    assert [json.loads(line)['event'] for line in path.read_text().splitlines()] == ['accepted', 'accepted', 'filled']
+
+    sink.unsubscribe(writer)
+    assert sink.subscribers == []
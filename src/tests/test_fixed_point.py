@@ -0,0 +1,75 @@
+"""
+Scenarios for integer tick prices and whole-cent cash:
+1. StockInfo converts prices to and from ticks, with a per-ticker tick size.
+2. Prices off the tick grid are rejected; prices that differ only by float error share one level.
+3. Cash moved by many fills adds up exactly in whole cents, which are shown and stored in currency units.
+4. Prices leave the book in currency units: top of book, last trade price, trades and saved orders.
+"""
+import json
+from account import to_minor_units
+from helpers import make_book, order
+from stock_info import StockInfo
+from storage import JsonAccountStore
+
+
+def test_tick_conversion():
+    stock_info = StockInfo()
+    assert stock_info.to_ticks('AAPL', 150.25) == 15025
+    assert stock_info.from_ticks('AAPL', 15025) == 150.25
+    assert stock_info.to_ticks('AAPL', 0.1 + 0.2) == 30
+    stock_info.ticks_per_unit['TSLA'] = 20
+    assert stock_info.tick_size('TSLA') == 0.05
+    assert stock_info.on_tick('TSLA', 700.15) and not stock_info.on_tick('TSLA', 700.12)
+    assert stock_info.from_ticks('TSLA', stock_info.to_ticks('TSLA', 700.15)) == 700.15
+
+
+def test_off_tick_prices_and_exact_levels(capsys):
+    order_book, account_manager = make_book({'2': {'AAPL': 100000}})
+    assert order_book.add_order(order('buy', '1', 1, 150.005), account_manager) is False
+    assert "Price must be a multiple of the tick size 0.01." in capsys.readouterr().out
+    assert order_book.add_order(order('sell', '2', 1, None, 'stop_market', stop_price=149.999),
+                                account_manager) is False
+    assert "Stop price must be a multiple" in capsys.readouterr().out
+
+    order_book.add_order(order('buy', '1', 1, 0.3), account_manager)
+    order_book.add_order(order('buy', '1', 2, 0.1 + 0.2), account_manager)
+    buy_side = order_book.buy_orders['AAPL']
+    assert list(buy_side.prices) == [30]
+    assert buy_side.top() == (30, 3, 2)
+
+
+def test_cash_adds_up_exactly(tmp_path, capsys):
+    order_book, account_manager = make_book({'2': {'AAPL': 100000}})
+    for _ in range(300):
+        order_book.add_order(order('sell', '2', 3, 10.01), account_manager)
+        order_book.add_order(order('buy', '1', 3, 10.01), account_manager)
+    buyer, seller = account_manager.accounts['1'], account_manager.accounts['2']
+    assert buyer['balance'] == 10000000 - 900900
+    assert seller['balance'] == 10000000 + 900900
+    assert type(buyer['balance']) is int and type(seller['balance']) is int
+
+    account_manager.display_account('1')
+    assert "  Balance: 90991.0" in capsys.readouterr().out
+    path = str(tmp_path / 'accounts.json')
+    store = JsonAccountStore(path)
+    store.replace(account_manager.accounts)
+    with open(path) as f:
+        assert json.load(f)['2']['balance'] == 109009.0
+    assert store.load() == account_manager.accounts
+    assert to_minor_units(0.1 + 0.2) == 30
+
+
+def test_prices_leave_the_book_in_currency_units():
+    order_book, account_manager = make_book({'2': {'AAPL': 100000}})
+    order_book.add_order(order('sell', '2', 5, 150.25, order_id='a1'), account_manager)
+    order_book.add_order(order('sell', '2', 5, 150.5, order_id='a2'), account_manager)
+    order_book.add_order(order('buy', '1', 5, 150.25, order_id='b1'), account_manager)
+    assert order_book.get_top_of_book('AAPL') == {'bid': None, 'ask': (150.5, 5, 1)}
+    assert order_book.get_best_bid_ask('AAPL') == (None, 150.5)
+    assert order_book.last_trade_price == {'AAPL': 150.25}
+    assert next(iter(order_book.trade_journal))['price'] == 150.25
+    snapshot, events = order_book.order_journal.load('AAPL')
+    assert [event['order']['price'] for event in events if event['event'] == 'add'] == [150.25, 150.5, 150.25]
+
+    order_book.last_trade_price = {'AAPL': 151.0}
+    assert order_book.last_trade_ticks == {'AAPL': 15100}
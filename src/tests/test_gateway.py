@@ -0,0 +1,209 @@
+"""
+Scenarios for the TCP order gateway:
+1. Submit, cancel, book and account requests are answered in order, numbered by the engine, with errors for bad requests.
+2. Orders with fields of the wrong type, and requests the engine fails on, get an error and the engine goes on.
+3. Subscribers are sent the events of the tickers they chose until they unsubscribe.
+4. A client that sends far more than the queues hold gets every answer; a subscriber that falls behind is dropped.
+5. The load generator plays order flow over several connections and reports round-trip latency.
+6. Account changes are written once the flush interval passes, even when no more requests come in.
+"""
+import asyncio
+import json
+from account import AccountManager
+from events import EventSink
+from gateway.__main__ import funded_accounts
+from gateway.loadgen import run_load
+from gateway.server import Gateway
+from order_execution import OrderBook
+from stock_info import StockInfo
+from storage import MemoryStorage
+
+
+async def start_gateway(accounts=20, storage=None, flush_interval=5.0, **options):
+    stock_info = StockInfo()
+    storage = storage if storage is not None else MemoryStorage()
+    account_manager = AccountManager(storage=storage, flush_interval=flush_interval)
+    account_manager.reset_accounts(funded_accounts(accounts, stock_info))
+    order_book = OrderBook(stock_info, storage=storage, events=EventSink())
+    gateway = Gateway(order_book, account_manager, **options)
+    await gateway.start(port=0)
+    return gateway
+
+
+class Client:
+    async def connect(self, gateway):
+        self.reader, self.writer = await asyncio.open_connection(gateway.host, gateway.port)
+        return self
+
+    async def send(self, *requests):
+        for request in requests:
+            self.writer.write((request if isinstance(request, bytes) else json.dumps(request).encode()) + b'\n')
+        await self.writer.drain()
+
+    async def receive(self, count=1):
+        return [json.loads(await asyncio.wait_for(self.reader.readline(), 5)) for _ in range(count)]
+
+    async def call(self, *requests):
+        await self.send(*requests)
+        return await self.receive(len(requests))
+
+
+def limit(action, account_id, quantity, price, ticker='AAPL'):
+    return {'type': 'submit', 'order': {'action': action, 'account_id': account_id, 'ticker': ticker,
+                                        'quantity': quantity, 'order_type': 'limit', 'price': price}}
+
+
+def test_requests():
+    async def scenario():
+        gateway = await start_gateway()
+        client = await Client().connect(gateway)
+        responses = await client.call(
+            dict(limit('sell', '1', 5, 150.0), id='a'),
+            dict(limit('buy', '2', 2, 150.0), id='b'),
+            dict(limit('buy', '2', 1, 150.005), id='c'),
+            {'id': 'd', 'type': 'book', 'ticker': 'aapl'},
+            {'id': 'e', 'type': 'account', 'account_id': '2'},
+            {'id': 'f', 'type': 'cancel', 'account_id': '2', 'order_id': 'missing'},
+            b'not json',
+            {'id': 'h', 'type': 'quote'},
+            {'id': 'i', 'type': 'account', 'account_id': '77'},
+        )
+        sell_id = responses[0]['order_id']
+        responses += await client.call({'id': 'j', 'type': 'cancel', 'account_id': '1', 'order_id': sell_id})
+        await gateway.close()
+        return responses
+
+    responses = asyncio.run(scenario())
+    assert [response['id'] for response in responses] == ['a', 'b', 'c', 'd', 'e', 'f', None, 'h', 'i', 'j']
+    assert [response['seq'] for response in responses] == list(range(1, 11))
+    assert responses[0]['ok'] and responses[0]['fills'] == 0
+    assert responses[1]['ok'] and responses[1]['fills'] == 1
+    assert responses[2] == {'id': 'c', 'seq': 3, 'ok': False,
+                            'error': "Price must be a multiple of the tick size 0.01."}
+    assert responses[3]['ticker'] == 'AAPL' and responses[3]['asks'] == [[150.0, 3, 1]] and responses[3]['bids'] == []
+    assert responses[4]['balance'] == 1.0e12 - 300.0 and responses[4]['positions']['AAPL'] == 1.0e9 + 2
+    assert responses[5]['error'] == "Order ID missing not found for Account 2."
+    assert responses[6]['error'] == "Invalid JSON request."
+    assert responses[7]['error'] == "Unknown request type: quote"
+    assert responses[8]['error'] == "Account 77 does not exist."
+    assert responses[9]['ok']
+
+
+def test_bad_orders_do_not_stop_the_engine(monkeypatch):
+    async def scenario():
+        gateway = await start_gateway()
+        client = await Client().connect(gateway)
+        bad = [
+            {'type': 'submit', 'order': dict(limit('buy', '1', 1, 150.0)['order'], action=1)},
+            {'type': 'submit', 'order': dict(limit('buy', '1', 1, 150.0)['order'], quantity=True)},
+            {'type': 'submit', 'order': dict(limit('buy', '1', 1, 150.0)['order'], price='150')},
+            {'type': 'submit', 'order': dict(limit('buy', '1', 1, 150.0)['order'], timestamp='yesterday')},
+            {'type': 'submit', 'order': dict(limit('buy', '1', 1, 150.0)['order'],
+                                             timestamp='2020-01-01T00:00:00+00:00')},
+            {'type': ['submit']},
+        ]
+        responses = await client.call(*[dict(request, id=i) for i, request in enumerate(bad)])
+        monkeypatch.setattr(gateway.order_book, 'get_depth', lambda ticker, levels: 1 / 0)
+        responses += await client.call({'id': 'crash', 'type': 'book', 'ticker': 'AAPL'})
+        monkeypatch.undo()
+        responses += await client.call(dict(limit('buy', '1', 1, 150.0), id='good'))
+        await asyncio.wait_for(gateway.close(), 5)
+        return responses
+
+    responses = asyncio.run(scenario())
+    assert [response['id'] for response in responses] == [0, 1, 2, 3, 4, 5, 'crash', 'good']
+    assert [response['error'] for response in responses[:7]] == [
+        "'action' must be text.",
+        "'quantity' must be a number.",
+        "'price' must be a number.",
+        "'timestamp' must be ISO date and time text.",
+        "'timestamp' must be local time without a UTC offset.",
+        "Unknown request type: ['submit']",
+        "Request failed: ZeroDivisionError: division by zero",
+    ]
+    assert responses[7]['ok'] and responses[7]['seq'] == 8
+
+
+def test_subscriptions():
+    async def scenario():
+        gateway = await start_gateway()
+        watcher = await Client().connect(gateway)
+        trader = await Client().connect(gateway)
+        assert (await watcher.call({'id': 1, 'type': 'subscribe', 'tickers': ['aapl']}))[0]['ok']
+        await trader.call(limit('sell', '1', 5, 150.0), limit('buy', '2', 5, 150.0), limit('buy', '2', 5, 300.0, 'TSLA'))
+        events = await watcher.receive(3)
+        await watcher.call({'id': 2, 'type': 'unsubscribe'})
+        await trader.call(limit('sell', '1', 5, 150.0))
+        late = await trader.call({'type': 'book', 'ticker': 'AAPL'})
+        await gateway.close()
+        leftover = await watcher.reader.read()
+        return events, late, leftover
+
+    events, late, leftover = asyncio.run(scenario())
+    assert [event['event'] for event in events] == ['accepted', 'accepted', 'filled']
+    assert all(event['ticker'] == 'AAPL' for event in events)
+    assert events[2]['quantity'] == 5 and events[2]['seq'] == events[1]['seq']
+    assert late[0]['asks'] == [[150.0, 5, 1]]
+    assert leftover == b''
+
+
+def test_back_pressure():
+    async def scenario():
+        gateway = await start_gateway(queue_size=2, max_inflight=2, outbound_size=6)
+        flood = await Client().connect(gateway)
+        sender = asyncio.create_task(flood.send(*[dict(limit('buy', '1', 1, 100.0), id=i) for i in range(300)]))
+        await asyncio.sleep(0.1)
+        backlog = gateway.requests.qsize()
+        responses = await flood.receive(300)
+        await sender
+
+        watcher = await Client().connect(gateway)
+        await watcher.call({'type': 'subscribe'})
+        trader = await Client().connect(gateway)
+        sweep = await trader.call(limit('sell', '2', 300, 100.0))
+        dropped = gateway.dropped
+        leftover = await asyncio.wait_for(watcher.reader.read(), 5)
+        still_served = await trader.call({'type': 'account', 'account_id': '2'})
+        await gateway.close()
+        return backlog, responses, sweep, dropped, leftover, still_served
+
+    backlog, responses, sweep, dropped, leftover, still_served = asyncio.run(scenario())
+    assert backlog <= 2
+    assert [response['id'] for response in responses] == list(range(300))
+    assert all(response['ok'] for response in responses)
+    assert sweep[0]['fills'] == 300
+    assert dropped == 1 and len(leftover.splitlines()) < 300
+    assert still_served[0]['ok']
+
+
+def test_load_generator():
+    async def scenario():
+        gateway = await start_gateway()
+        results = await run_load(gateway.host, gateway.port, clients=3, count=300, window=8, seed=4)
+        handled = gateway.sequence
+        await gateway.close()
+        return results, handled
+
+    results, handled = asyncio.run(scenario())
+    assert results['requests'] == handled == 900
+    assert results['ok'] + results['failed'] == 900 and results['ok'] > results['failed']
+    rtt = results['rtt']
+    assert 0 < rtt['p50_us'] <= rtt['p99_us'] <= rtt['p999_us'] <= rtt['max_us']
+    assert results['requests_per_sec'] > 0
+
+
+def test_idle_gateway_writes_accounts():
+    async def scenario():
+        storage = MemoryStorage()
+        gateway = await start_gateway(storage=storage, flush_interval=0.2)
+        client = await Client().connect(gateway)
+        await client.call(limit('sell', '1', 5, 150.0), limit('buy', '2', 5, 150.0))
+        pending = set(gateway.account_manager.dirty)
+        await asyncio.sleep(0.5)
+        saved = storage.accounts.load()
+        await gateway.close()
+        return pending, saved
+
+    pending, saved = asyncio.run(scenario())
+    assert pending == {'1', '2'}
+    assert saved['1']['positions']['AAPL'] == 1.0e9 - 5 and saved['2']['positions']['AAPL'] == 1.0e9 + 5
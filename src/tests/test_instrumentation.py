@@ -0,0 +1,129 @@
+"""
+Scenarios for stage timing and profiling:
+1. The log-bucket histogram keeps every value within 12.5% and reports percentiles from its buckets.
+2. Stage timing records each stage of an order that trades, and turning it off restores the plain methods.
+3. A cpu or memory profile covers the next N operations, then reports and detaches, also when stage timing is on.
+   Stage timing and a profile can be turned off in either order without undoing each other.
+4. The stats and profile console commands turn timing on and off, dump it, and attach a profiler.
+"""
+import random
+import pytest
+from helpers import make_book, order
+from instrumentation import LatencyHistogram, OperationProfiler, StageStats
+from main import Session, run_commands
+
+
+def test_histogram():
+    rng = random.Random(5)
+    for value in list(range(300)) + [rng.getrandbits(rng.randint(9, 45)) for _ in range(2000)]:
+        index = LatencyHistogram.bucket(value)
+        high = LatencyHistogram.bucket_high(index)
+        assert value <= high <= value * 1.125 + 1
+        assert index == 0 or LatencyHistogram.bucket_high(index - 1) < value
+
+    histogram = LatencyHistogram()
+    for value in range(1, 1001):
+        histogram.record(value * 1000)
+    assert histogram.count == 1000 and histogram.mean() == 500500
+    assert 500000 <= histogram.percentile(50) <= 500000 * 1.125
+    assert 990000 <= histogram.percentile(99) <= 1000000 == histogram.percentile(100) == histogram.max
+    histogram.clear()
+    assert histogram.count == 0 and histogram.percentile(50) is None
+
+
+def test_stage_timing(capsys):
+    order_book, account_manager = make_book()
+    stats = StageStats()
+    stats.instrument(order_book)
+    stats.instrument(account_manager)
+    order_book.add_order(order('sell', '2', 5, 150.0), account_manager)
+    order_book.add_order(order('buy', '1', 5, 150.0), account_manager)
+    order_book.cancel_order('1', 'missing')
+    account_manager.sync()
+    counts = {stage: histogram.count for stage, histogram in stats.histograms.items()}
+    assert counts['submit'] == counts['validate'] == counts['place'] == counts['match'] == 2
+    assert counts['settle'] == counts['trade_save'] == 1
+    assert counts['account_update'] == 2 and counts['account_save'] == 1 and counts['cancel'] == 1
+    assert stats.histograms['submit'].max >= stats.histograms['validate'].max
+    report = stats.report().splitlines()
+    assert report[0].split() == ['stage', 'count', 'mean', 'us', 'p50', 'us', 'p99', 'us', 'p999', 'us', 'max', 'us']
+    assert any(line.startswith('settle ') for line in report)
+
+    stats.uninstrument()
+    assert not stats.enabled
+    assert 'add_order' not in vars(order_book) and 'update_account' not in vars(account_manager)
+    order_book.add_order(order('buy', '1', 1, 140.0), account_manager)
+    assert stats.histograms['submit'].count == 2
+    stats.reset()
+    assert stats.report().splitlines()[1:] == []
+
+
+@pytest.mark.parametrize('kind', ['cpu', 'memory'])
+def test_profile_next_operations(kind, tmp_path, capsys):
+    order_book, account_manager = make_book()
+    stats = StageStats()
+    stats.instrument(order_book)
+    output = str(tmp_path / 'profile.out') if kind == 'cpu' else None
+    profiler = OperationProfiler(order_book, 3, kind, output=output)
+    for price in (150.0, 151.0, 152.0):
+        assert profiler.active
+        order_book.add_order(order('sell', '2', 1, price), account_manager)
+    assert not profiler.active
+    out = capsys.readouterr().out
+    assert profiler.report in out
+    if kind == 'cpu':
+        assert profiler.report.startswith("CPU profile of 3 operations")
+        assert "_validate_order" in profiler.report and (tmp_path / 'profile.out').exists()
+    else:
+        assert profiler.report.startswith("Memory profile of 3 operations")
+
+    order_book.add_order(order('sell', '2', 1, 153.0), account_manager)
+    assert stats.histograms['submit'].count == 4
+    assert profiler.report not in capsys.readouterr().out
+
+    with pytest.raises(ValueError):
+        OperationProfiler(order_book, 3, 'disk')
+
+
+def test_stats_and_profile_interleaved(capsys):
+    order_book, account_manager = make_book()
+    stats = StageStats()
+    stats.instrument(order_book)
+    profiler = OperationProfiler(order_book, 2, 'memory')
+    stats.uninstrument()
+    order_book.add_order(order('sell', '2', 1, 150.0), account_manager)
+    assert profiler.active and stats.histograms['submit'].count == 0
+    order_book.add_order(order('sell', '2', 1, 151.0), account_manager)
+    assert not profiler.active and "Memory profile of 2 operations" in capsys.readouterr().out
+    assert 'add_order' not in vars(order_book)
+
+    profiler = OperationProfiler(order_book, 1, 'memory')
+    stats.instrument(order_book)
+    order_book.add_order(order('sell', '2', 1, 152.0), account_manager)
+    assert not profiler.active
+    order_book.add_order(order('sell', '2', 1, 153.0), account_manager)
+    assert stats.histograms['submit'].count == 2
+    stats.uninstrument()
+    assert 'add_order' not in vars(order_book) and '_validate_order' not in vars(order_book)
+
+
+def test_console_commands(capsys):
+    order_book, account_manager = make_book()
+    session = Session(order_book.stock_info, order_book.storage, account_manager, order_book)
+    run_commands(session, ["stats", "stats on", "stats", "sell 2 AAPL 5 limit 150", "buy 1 AAPL 5 limit 150",
+                           "stats"], interactive=False)
+    out = capsys.readouterr().out
+    assert "Stage timing is off." in out and "Stage timing on." in out and "No stage timings yet." in out
+    assert out.rstrip().splitlines()[-1].split()[0] in session.stats.histograms
+    assert "settle" in out
+
+    run_commands(session, ["stats reset", "stats off", "profile 1 memory", "sell 2 AAPL 1 limit 151",
+                           "profile 0", "profile 2 disk", "profile 2 memory out.prof"], interactive=False)
+    out = capsys.readouterr().out
+    assert "Stage timings cleared." in out and "Stage timing off." in out
+    assert "Profiling the memory use of the next 1 operations." in out
+    assert "Memory profile of 1 operations" in out
+    assert "Usage: profile <operations>" in out
+    assert "the profile kind must be 'cpu' or 'memory'" in out
+    assert "only a cpu profile can be saved" in out
+    assert not session.stats.enabled and 'add_order' not in vars(order_book)
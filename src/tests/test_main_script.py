@@ -0,0 +1,60 @@
+"""
+Scenarios for running the simulator from a script:
+1. Commands are dispatched through the command table; comments and blank lines are skipped and exit ends the run.
+2. --quiet leaves out the per-order messages but keeps errors, and --summary reports orders, rejects and fills.
+3. Commands piped on stdin run without a prompt.
+"""
+import io
+import sys
+import main
+from main import COMMANDS, run_commands
+
+SCRIPT = """reset
+# orders
+sell 1 AAPL 10 limit 150
+
+buy 2 AAPL 5 limit 150
+buy 2 NOPE 5
+buy 9 AAPL 1000000 limit 150
+"""
+
+
+def test_dispatch_table(capsys):
+    calls = []
+
+    class Recorder:
+        commands = 0
+
+    original = dict(COMMANDS)
+    try:
+        COMMANDS['stock'] = lambda session, parts: calls.append(parts)
+        run_commands(Recorder(), ["stock info AAPL", "# stock info", "", "bogus", "exit", "stock info"],
+                     interactive=False)
+    finally:
+        COMMANDS.clear()
+        COMMANDS.update(original)
+    assert calls == [['stock', 'info', 'AAPL']]
+    out = capsys.readouterr().out
+    assert "Unknown command" in out and "Exiting the simulator." in out
+    assert "Please enter a command" not in out
+    assert COMMANDS['buy'] is COMMANDS['sell']
+
+
+def test_quiet_script_with_summary(tmp_path, capsys):
+    script = tmp_path / 'orders.txt'
+    script.write_text(SCRIPT)
+    main.main('memory', script=str(script), quiet=True, summary=True)
+    out = capsys.readouterr().out
+    assert "Order added" not in out and "Executed" not in out and "Welcome" not in out
+    assert "Error: NOPE is not a valid ticker." in out
+    assert "Error: Account 9 does not have enough balance" in out
+    assert "Summary: 5 commands, 3 orders (2 accepted, 1 rejected), 1 fills in " in out
+
+
+def test_commands_from_stdin(monkeypatch, capsys):
+    monkeypatch.setattr(sys, 'stdin', io.StringIO(SCRIPT + "order book\n"))
+    main.main('memory')
+    out = capsys.readouterr().out
+    assert "Enter a command" not in out
+    assert "Executed 5.0 shares of AAPL at 150.0" in out
+    assert "Account 1 wants to sell 5.0 at 150.0" in out
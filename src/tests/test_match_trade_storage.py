@@ -18,23 +18,20 @@ from datetime import datetime
 from order_execution import OrderBook
 from stock_info import StockInfo
 from account import AccountManager
+from trade_index import format_timestamp
 
-def initialize_order_book_and_account_manager():
+def initialize_order_book_and_account_manager(tmp_path):
     stock_info = StockInfo()
-    account_manager = AccountManager()
+    account_manager = AccountManager(str(tmp_path / 'accounts.json'))
     order_book = OrderBook(stock_info)
     return order_book, account_manager
 
 @pytest.fixture
-def setup_resources():
-    order_book, account_manager = initialize_order_book_and_account_manager()
+def setup_resources(tmp_path):
+    order_book, account_manager = initialize_order_book_and_account_manager(tmp_path)
 
     # Remove any leftover unmatched and executed trades data
-    if os.path.exists(order_book.unmatched_orders_file):
-        os.remove(order_book.unmatched_orders_file)
-    if os.path.exists(order_book.executed_trades_file):
-        with open(order_book.executed_trades_file, 'w') as file:
-            json.dump([], file)
+    order_book.reset()
 
     # Reset in-memory order books
     order_book.buy_orders = {}
@@ -45,7 +42,7 @@ def setup_resources():
 
     # Set up accounts 1, 2 and 3 with sufficient balances and shares
     account_manager.update_account('1', {
-        'balance': 50000.0,
+        'balance': 5000000,
         'positions': {
             'AAPL': 200,
             'TSLA': 200,
@@ -55,7 +52,7 @@ def setup_resources():
         }
     })
     account_manager.update_account('2', {
-        'balance': 50000.0,
+        'balance': 5000000,
         'positions': {
             'AAPL': 200,
             'TSLA': 200,
@@ -65,7 +62,7 @@ def setup_resources():
         }
     })
     account_manager.update_account('3', {
-        'balance': 50000.0,
+        'balance': 5000000,
         'positions': {
             'AAPL': 200,  
             'TSLA': 200,
@@ -83,9 +80,10 @@ def setup_resources():
 
 
 def read_executed_trades_file(filepath):
+    # The trade journal is JSON Lines: one trade per line
     try:
         with open(filepath, 'r') as file:
-            return json.load(file)
+            return [json.loads(line) for line in file if line.strip()]
     except FileNotFoundError:
         return []
 
@@ -137,7 +135,7 @@ def test_full_match_integration(setup_resources):
     assert trade["quantity"] == 100
     assert trade["buy_account_id"] == "1"
     assert trade["sell_account_id"] == "2"
-    assert "timestamp" in trade and datetime.fromisoformat(trade["timestamp"])
+    assert "timestamp" in trade and datetime.fromisoformat(format_timestamp(trade["timestamp"]))
 
 # Test 2: Partial match
 def test_partial_match_integration(setup_resources):
@@ -178,7 +176,7 @@ def test_partial_match_integration(setup_resources):
     assert trade["price"] == 150.0
     assert trade["buy_account_id"] == "1"
     assert trade["sell_account_id"] == "2"
-    assert "timestamp" in trade and datetime.fromisoformat(trade["timestamp"])
+    assert "timestamp" in trade and datetime.fromisoformat(format_timestamp(trade["timestamp"]))
 
 # Test 3: Multiple orders
 def test_multiple_orders_integration(setup_resources):
@@ -201,7 +199,7 @@ def test_multiple_orders_integration(setup_resources):
     assert len(trades) >= 2, "Multiple trades should be recorded for multiple matching orders."
     for trade in trades:
         assert trade["ticker"] == "AAPL"
-        assert "timestamp" in trade and datetime.fromisoformat(trade["timestamp"])
+        assert "timestamp" in trade and datetime.fromisoformat(format_timestamp(trade["timestamp"]))
 
 # Test 4: No match
 def test_no_match_integration(setup_resources):
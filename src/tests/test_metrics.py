@@ -0,0 +1,141 @@
+"""
+Scenarios for the engine metrics:
+1. The registry renders counters, gauges and histograms in the Prometheus text format, every sample named
+   after the family of its TYPE line.
+2. The book and the account manager count orders, rejects by reason, fills, cancels and stop triggers,
+   time their writes to storage, and report the book depth, stop orders and accounts.
+3. The metrics server answers scrapes of /metrics on localhost.
+4. The metrics console command prints the same text.
+"""
+import re
+import urllib.error
+import urllib.request
+import pytest
+from helpers import make_book, order
+from main import Session, run_commands
+from metrics import CONTENT_TYPE, MetricsRegistry, MetricsServer
+
+POSITIONS = {'1': {'AAPL': 100}, '2': {'AAPL': 100}}  # both accounts can sell
+# Samples a family of each type may expose, by the suffix added to the family name
+SAMPLE_SUFFIXES = {'counter': ('',), 'gauge': ('',), 'histogram': ('_bucket', '_sum', '_count')}
+
+
+def check_families(text):
+    """Assert that every sample belongs to the family of the TYPE line before it, and return the families."""
+    families = {}
+    family = None
+    for line in text.splitlines():
+        if line.startswith('# TYPE '):
+            family, kind = line.split()[2:]
+            families[family] = kind
+        elif not line.startswith('#'):
+            name = re.match(r'[a-zA-Z_:][a-zA-Z0-9_:]*', line).group()
+            assert name in [family + suffix for suffix in SAMPLE_SUFFIXES[families[family]]], line
+    return families
+
+
+def test_text_format():
+    registry = MetricsRegistry()
+    orders = registry.counter('orders', "Orders", ('order_type',))
+    orders.inc(('limit',))
+    orders.inc(('limit',), 2)
+    orders.inc(('market',))
+    assert registry.counter('orders', "Orders", ('order_type',)) is orders
+    registry.counter('fills', "Fills")
+    registry.gauge('depth', "Depth", ('ticker',), lambda: {('A"B',): 4})
+    latency = registry.histogram('flush_seconds', "Flush time", buckets=(0.001, 0.01))
+    for seconds in (0.0005, 0.001, 0.005, 2.0):
+        latency.observe(seconds)
+    with pytest.raises(ValueError):
+        registry.gauge('orders', "Orders")
+
+    assert registry.render().splitlines() == [
+        '# HELP orders_total Orders',
+        '# TYPE orders_total counter',
+        'orders_total{order_type="limit"} 3',
+        'orders_total{order_type="market"} 1',
+        '# HELP fills_total Fills',
+        '# TYPE fills_total counter',
+        'fills_total 0',
+        '# HELP depth Depth',
+        '# TYPE depth gauge',
+        'depth{ticker="A\\"B"} 4',
+        '# HELP flush_seconds Flush time',
+        '# TYPE flush_seconds histogram',
+        'flush_seconds_bucket{le="0.001"} 2',
+        'flush_seconds_bucket{le="0.01"} 3',
+        'flush_seconds_bucket{le="+Inf"} 4',
+        'flush_seconds_sum 2.0065',
+        'flush_seconds_count 4',
+    ]
+    assert check_families(registry.render()) == {
+        'orders_total': 'counter', 'fills_total': 'counter', 'depth': 'gauge', 'flush_seconds': 'histogram'}
+
+
+def test_engine_metrics():
+    order_book, account_manager = make_book(POSITIONS, metrics=MetricsRegistry())
+    metrics = order_book.metrics
+    order_book.add_order(order('sell', '1', 5, 150.0), account_manager)
+    order_book.add_order(order('sell', '2', 1, None, 'stop_market', stop_price=149.0), account_manager)
+    order_book.add_order(order('buy', '2', 5, 148.0), account_manager)
+    order_book.add_order(order('sell', '1', 5, 148.0), account_manager)
+    order_book.add_order(order('buy', '1', 5, 1.0e9), account_manager)
+    order_book.add_order(order('buy', '1', 5, 150.005), account_manager)
+    order_book.add_order(order('sell', '2', 500, 150.0), account_manager)
+    order_book.cancel_order('1', '1')
+    order_book.cancel_order('1', 'nope')
+    order_book.add_orders([order('buy', '2', 1, 140.0), order('buy', '2', -1, 140.0)], account_manager)
+    account_manager.sync()
+
+    counters = {name: metric.values for name, metric in metrics.metrics.items() if metric.TYPE == 'counter'}
+    assert counters['engine_orders'] == {('limit',): 4, ('stop_market',): 1}
+    assert counters['engine_rejects'] == {
+        ('order', 'insufficient_balance'): 1, ('order', 'invalid_price'): 1, ('order', 'insufficient_shares'): 1,
+        ('order', 'invalid_quantity'): 1, ('cancel', 'not_found'): 1}
+    assert counters['engine_fills'] == {(): order_book.fill_count} == {(): 1}
+    assert counters['engine_cancels'] == {('request',): 1}
+    assert counters['engine_stop_triggers'] == {('sell',): 1}
+
+    persist = metrics.metrics['engine_persist_seconds']
+    assert persist.count(('journal',)) >= 7 and persist.count(('accounts',)) == 1
+    assert metrics.metrics['engine_book_orders'].value(('AAPL', 'sell')) == 1
+    assert metrics.metrics['engine_book_orders'].value(('AAPL', 'buy')) == 1
+    assert metrics.metrics['engine_book_levels'].value(('AAPL', 'buy')) == 1
+    assert metrics.metrics['engine_stop_orders'].value(('AAPL', 'sell')) == 0
+    assert metrics.metrics['engine_accounts'].value() == 2
+    assert metrics.metrics['engine_dirty_accounts'].value() == 0
+    families = check_families(metrics.render())
+    assert families['engine_orders_total'] == 'counter' and families['engine_persist_seconds'] == 'histogram'
+
+    order_book, account_manager = make_book(POSITIONS, metrics=MetricsRegistry())
+    order_book.add_order(order('sell', '1', 1, None, 'stop_market', stop_price=149.995), account_manager)
+    order_book.add_order(order('buy', '1', 1, None), account_manager)
+    assert order_book.metrics.metrics['engine_rejects'].values == {
+        ('order', 'invalid_stop_price'): 1, ('order', 'invalid_price'): 1}
+
+
+def test_metrics_server():
+    order_book, account_manager = make_book(POSITIONS, metrics=MetricsRegistry())
+    order_book.add_order(order('sell', '1', 5, 150.0), account_manager)
+    server = MetricsServer(order_book.metrics, port=0)
+    try:
+        with urllib.request.urlopen(server.url, timeout=5) as response:
+            assert response.headers['Content-Type'] == CONTENT_TYPE
+            body = response.read().decode()
+        assert 'engine_orders_total{order_type="limit"} 1' in body.splitlines()
+        assert body == order_book.metrics.render()
+        with pytest.raises(urllib.error.HTTPError):
+            urllib.request.urlopen(f"http://{server.host}:{server.port}/other", timeout=5)
+    finally:
+        server.close()
+
+
+def test_metrics_command(capsys):
+    order_book, account_manager = make_book(POSITIONS, metrics=MetricsRegistry())
+    session = Session(order_book.stock_info, order_book.storage, account_manager, order_book)
+    run_commands(session, ["sell 1 AAPL 5 limit 150", "metrics", "metrics now"], interactive=False)
+    out = capsys.readouterr().out
+    assert 'engine_orders_total{order_type="limit"} 1' in out
+    assert 'engine_book_orders{ticker="AAPL",side="sell"} 1' in out
+    assert "# TYPE engine_persist_seconds histogram" in out
+    assert out.rstrip().endswith("Invalid command. Usage: metrics")
@@ -0,0 +1,102 @@
+"""
+Scenarios for submitting orders in a batch:
+1. add_orders returns one result per order, in order, with the error of each rejected order and no per-order output.
+   Subscribers get each order's accepted or rejected event, in order, as add_order sends them.
+2. Each ticker is matched once and the book is saved once for the whole batch.
+3. A ticker that only got stop orders is not matched, and the stop orders are kept.
+4. Orders are read from a JSON Lines file, and bad lines or missing files are reported.
+"""
+import json
+from datetime import datetime
+from events import EventSink
+from helpers import make_book, order
+from main import read_order_batch
+
+
+def test_results_per_order(capsys):
+    order_book, account_manager = make_book()
+    results = order_book.add_orders([
+        order('sell', '2', 10, 150.0),
+        order('buy', '1', 10, 150.0, ticker='NOPE'),
+        order('sell', '1', 10, 150.0),
+        order('buy', '1', 4, 150.0),
+    ], account_manager)
+    assert [result['accepted'] for result in results] == [True, False, False, True]
+    assert results[1]['error'] == "NOPE is not a valid ticker."
+    assert results[2]['error'] == "Account 1 does not have enough shares to sell."
+    assert results[0]['order_id'] != results[3]['order_id']
+    out = capsys.readouterr().out
+    assert "Order added" not in out and "Error" not in out
+    assert account_manager.accounts['1']['positions'] == {'AAPL': 4}
+    assert order_book.get_top_of_book('AAPL')['ask'] == (150.0, 6, 1)
+
+
+def test_events_per_order():
+    seen = []
+    order_book, account_manager = make_book(events=EventSink([seen.append]))
+    order_book.add_orders([
+        order('sell', '2', 10, 150.0),
+        order('sell', '1', 10, 150.0),
+        order('sell', '2', 5, None, 'stop_market', stop_price=140.0),
+        order('buy', '1', 4, 150.0),
+    ], account_manager)
+    assert [event['event'] for event in seen] == ['accepted', 'rejected', 'accepted', 'accepted', 'filled']
+    assert all(event['batch'] for event in seen[:4]) and 'batch' not in seen[4]
+    assert seen[1]['reason'] == 'insufficient_shares' and seen[1]['error'].startswith("Account 1 does not have")
+    assert [event['stop'] for event in seen if event['event'] == 'accepted'] == [False, True, False]
+    assert seen[4]['sell_order_id'] == seen[0]['order_id'] and seen[4]['buy_order_id'] == seen[3]['order_id']
+
+
+def test_one_match_and_one_save_per_ticker():
+    order_book, account_manager = make_book()
+    matched, flushes = [], []
+    run_cascade = order_book._run_cascade
+    order_book._run_cascade = lambda ticker, *args: matched.append(ticker) or run_cascade(ticker, *args)
+    flush = order_book.order_journal.flush
+    order_book.order_journal.flush = lambda: flushes.append(1) or flush()
+
+    orders = []
+    for i in range(10):
+        orders.append(order('sell', '2', 1, 150.0 + i))
+        orders.append(order('sell', '2', 1, 700.0 + i, ticker='TSLA'))
+    orders.append(order('buy', '1', 10, 160.0))
+    results = order_book.add_orders(orders, account_manager)
+    assert all(result['accepted'] for result in results)
+    assert matched == ['AAPL', 'TSLA']
+    assert len(flushes) == 2  # once after the ticker that traded, and once at the end
+    assert sum(1 for _ in order_book.trade_journal) == 10
+    assert account_manager.accounts['1']['positions'] == {'AAPL': 10}
+
+
+def test_stop_only_ticker_is_not_matched():
+    order_book, account_manager = make_book()
+    matched = []
+    order_book._run_cascade = lambda ticker, *args: matched.append(ticker)
+    results = order_book.add_orders([order('sell', '2', 5, None, 'stop_market', ticker='TSLA', stop_price=650.0)],
+                                    account_manager)
+    assert results[0]['accepted'] and matched == []
+    assert order_book.order_index[results[0]['order_id']][0] == 'stop_sell'
+    snapshot, events = order_book.order_journal.load('TSLA')
+    assert [event['event'] for event in events] == ['add']
+
+
+def test_read_order_batch(tmp_path, capsys):
+    path = tmp_path / 'orders.jsonl'
+    path.write_text(
+        json.dumps({'action': 'sell', 'account_id': 2, 'ticker': 'aapl', 'quantity': 5, 'order_type': 'limit',
+                    'price': 150.0, 'timestamp': '2024-12-01T09:30:00'}) + '\n\n' +
+        json.dumps({'action': 'buy', 'account_id': '1', 'ticker': 'AAPL', 'quantity': 5, 'order_type': 'market'}) + '\n')
+    orders = read_order_batch(str(path))
+    assert [(o['account_id'], o['ticker']) for o in orders] == [('2', 'AAPL'), ('1', 'AAPL')]
+    assert orders[0]['timestamp'] == datetime(2024, 12, 1, 9, 30)
+    assert isinstance(orders[1]['timestamp'], int)  # time.time_ns() when the file leaves it out
+
+    order_book, account_manager = make_book()
+    assert all(result['accepted'] for result in order_book.add_orders(orders, account_manager))
+    assert account_manager.accounts['1']['positions'] == {'AAPL': 5}
+
+    path.write_text('{"action": "buy"}\nnot json\n')
+    assert read_order_batch(str(path)) is None
+    assert "line 2 of" in capsys.readouterr().out
+    assert read_order_batch(str(tmp_path / 'missing.jsonl')) is None
+    assert "cannot read" in capsys.readouterr().out
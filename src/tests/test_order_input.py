@@ -42,12 +42,12 @@ from datetime import datetime, timedelta
 from stock_info import StockInfo
 
 @pytest.fixture
-def account_manager():
+def account_manager(tmp_path):
     # Create a mock AccountManager with predefined accounts
-    account_manager = AccountManager()
+    account_manager = AccountManager(str(tmp_path / 'accounts.json'))
     account_manager.accounts = {
-        "1": {"balance": 10000.0, "positions": {"AAPL": 0}},
-        "2": {"balance": 5000.0, "positions": {"AAPL": 20}},
+        "1": {"balance": 1000000, "positions": {"AAPL": 0}},
+        "2": {"balance": 500000, "positions": {"AAPL": 20}},
     }
     return account_manager
 
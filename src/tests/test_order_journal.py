@@ -0,0 +1,159 @@
+"""
+Scenarios for the order book journal, checkpoints and per-ticker shards:
+1. Adds, fills, cancels and stop triggers are replayed on startup.
+2. A checkpoint is written every N events and empties the journal.
+3. Events already covered by the snapshot are not applied twice.
+4. A journal without a snapshot is discarded.
+5. Startup reads no shard; a ticker's shard is read on first use, without being rewritten.
+6. Cancelling an order of a ticker that has not been read yet still finds it.
+7. A book saved as one unmatched_orders.json with its journal is split into shards.
+"""
+import json
+import os
+import pytest
+from datetime import datetime
+from order_execution import OrderBook
+from stock_info import StockInfo
+from account import AccountManager
+
+
+@pytest.fixture
+def paths(tmp_path):
+    return {'unmatched_orders_file': str(tmp_path / 'unmatched_orders.json'),
+            'executed_trades_file': str(tmp_path / 'executed_trades.jsonl')}
+
+
+@pytest.fixture
+def account_manager(tmp_path):
+    account_manager = AccountManager(str(tmp_path / 'accounts.json'))
+    account_manager.accounts = {
+        "1": {"balance": 10000000, "positions": {}},
+        "2": {"balance": 10000000, "positions": {"AAPL": 100.0}},
+    }
+    return account_manager
+
+
+def limit_order(order_id, action, account_id, quantity, price):
+    return {'action': action, 'ticker': 'AAPL', 'quantity': quantity, 'price': price, 'account_id': account_id,
+            'order_type': 'limit', 'timestamp': datetime.now(), 'order_id': order_id}
+
+
+def shard_path(paths, ticker='AAPL'):
+    return os.path.join(os.path.splitext(paths['unmatched_orders_file'])[0], ticker + '.json')
+
+
+def book_state(order_book):
+    order_book.load_ticker('AAPL')
+    return {
+        'buy': [(o.order_id, o.quantity) for o in order_book.buy_orders.get('AAPL', [])],
+        'sell': [(o.order_id, o.quantity) for o in order_book.sell_orders.get('AAPL', [])],
+        'stop_sell': [(o.order_id, o.quantity) for o in order_book.stop_sell_orders.get('AAPL', [])],
+    }
+
+
+def test_replay_restores_book(paths, account_manager):
+    order_book = OrderBook(StockInfo(), **paths)
+    order_book.add_order(limit_order('b1', 'buy', '1', 10, 150.0), account_manager)
+    order_book.add_order(limit_order('b2', 'buy', '1', 10, 149.0), account_manager)
+    order_book.add_order(limit_order('b3', 'buy', '1', 5, 148.0), account_manager)
+    order_book.add_order({'action': 'sell', 'ticker': 'AAPL', 'quantity': 5, 'stop_price': 150.0, 'account_id': '2',
+                          'order_type': 'stop_market', 'timestamp': datetime.now(), 'order_id': 's1'}, account_manager)
+    order_book.add_order({'action': 'sell', 'ticker': 'AAPL', 'quantity': 5, 'stop_price': 100.0, 'account_id': '2',
+                          'order_type': 'stop_market', 'timestamp': datetime.now(), 'order_id': 's2'}, account_manager)
+    order_book.add_order(limit_order('a1', 'sell', '2', 4, 150.0), account_manager)
+    order_book.cancel_order('1', 'b3')
+
+    with open(shard_path(paths)) as f:
+        assert json.load(f)['buy_orders'] == []
+    reloaded = OrderBook(StockInfo(), **paths)
+    assert book_state(reloaded) == book_state(order_book)
+    assert book_state(reloaded) == {'buy': [('b1', 1.0), ('b2', 10.0)], 'sell': [], 'stop_sell': [('s2', 5.0)]}
+
+
+def test_checkpoint_every_n_events(paths, account_manager):
+    order_book = OrderBook(StockInfo(), checkpoint_every=3, **paths)
+    for i in range(3):
+        order_book.add_order(limit_order(f'b{i}', 'buy', '1', 1, 140.0), account_manager)
+    assert os.path.getsize(order_book.order_journal.shard('AAPL').path) == 0
+    with open(shard_path(paths)) as f:
+        snapshot = json.load(f)
+    assert len(snapshot['buy_orders']) == 3
+    assert snapshot['sequence'] == 3
+
+
+def test_events_in_snapshot_not_replayed(paths, account_manager):
+    order_book = OrderBook(StockInfo(), **paths)
+    order_book.add_order(limit_order('b1', 'buy', '1', 1, 140.0), account_manager)
+    journal_path = order_book.order_journal.shard('AAPL').path
+    with open(journal_path) as f:
+        journal = f.read()
+    order_book.save_unmatched_orders()
+    # Simulate a crash after the snapshot was written but before the journal was emptied
+    with open(journal_path, 'w') as f:
+        f.write(journal)
+    reloaded = OrderBook(StockInfo(), **paths)
+    assert book_state(reloaded)['buy'] == [('b1', 1.0)]
+
+
+def test_journal_without_snapshot_discarded(paths, account_manager):
+    order_book = OrderBook(StockInfo(), **paths)
+    order_book.add_order(limit_order('b1', 'buy', '1', 1, 140.0), account_manager)
+    os.remove(shard_path(paths))
+    reloaded = OrderBook(StockInfo(), **paths)
+    assert book_state(reloaded)['buy'] == []
+    reloaded.add_order(limit_order('b2', 'buy', '1', 1, 140.0), account_manager)
+    assert book_state(OrderBook(StockInfo(), **paths))['buy'] == [('b2', 1.0)]
+
+
+def test_shards_read_on_first_use(paths, account_manager, monkeypatch):
+    account_manager.accounts["2"]["positions"]["TSLA"] = 100.0
+    order_book = OrderBook(StockInfo(), **paths)
+    order_book.add_order(limit_order('b1', 'buy', '1', 5, 140.0), account_manager)
+    order_book.add_order(dict(limit_order('t1', 'sell', '2', 5, 700.0), ticker='TSLA'), account_manager)
+    order_book.save_unmatched_orders()
+    modified = os.path.getmtime(shard_path(paths))
+
+    loaded = []
+    reloaded = OrderBook(StockInfo(), **paths)
+    original_load = reloaded.order_journal.load
+    monkeypatch.setattr(reloaded.order_journal, 'load', lambda ticker: loaded.append(ticker) or original_load(ticker))
+    assert reloaded.unloaded_tickers == {'AAPL', 'TSLA'}
+    assert reloaded.buy_orders == {} and loaded == []
+
+    reloaded.add_order(limit_order('a1', 'sell', '2', 2, 140.0), account_manager)
+    assert loaded == ['AAPL']
+    assert [order.quantity for order in reloaded.buy_orders['AAPL']] == [3.0]
+    assert 'TSLA' not in reloaded.sell_orders
+    assert reloaded.get_top_of_book('TSLA')['ask'] == (700.0, 5.0, 1)
+    assert loaded == ['AAPL', 'TSLA']
+    assert os.path.getmtime(shard_path(paths)) == modified
+
+
+def test_cancel_order_of_unread_ticker(paths, account_manager):
+    order_book = OrderBook(StockInfo(), **paths)
+    order_book.add_order(limit_order('b1', 'buy', '1', 5, 140.0), account_manager)
+    reloaded = OrderBook(StockInfo(), **paths)
+    assert reloaded.cancel_order('1', 'b1')
+    assert book_state(OrderBook(StockInfo(), **paths))['buy'] == []
+
+
+def test_legacy_book_split_into_shards(paths, account_manager):
+    order = limit_order('b1', 'buy', '1', 5, 140.0)
+    order['timestamp'] = order['timestamp'].isoformat()
+    tesla = dict(order, ticker='TSLA', order_id='t1')
+    with open(paths['unmatched_orders_file'], 'w') as f:
+        json.dump({'buy_orders': {'AAPL': [order]}, 'sell_orders': {}, 'stop_buy_orders': {},
+                   'stop_sell_orders': {}, 'sequence': 4}, f)
+    legacy_journal = os.path.splitext(paths['unmatched_orders_file'])[0] + '.journal.jsonl'
+    with open(legacy_journal, 'w') as f:
+        f.write(json.dumps({'seq': 4, 'event': 'fill', 'order_id': 'b1', 'quantity': 4}) + '\n')
+        f.write(json.dumps({'seq': 5, 'event': 'add', 'order': tesla}) + '\n')
+        f.write(json.dumps({'seq': 6, 'event': 'fill', 'order_id': 'b1', 'quantity': 1}) + '\n')
+
+    reloaded = OrderBook(StockInfo(), **paths)
+    assert reloaded.unloaded_tickers == {'AAPL', 'TSLA'}
+    assert book_state(reloaded)['buy'] == [('b1', 4.0)]
+    reloaded.load_ticker('TSLA')
+    assert [o.order_id for o in reloaded.buy_orders['TSLA']] == ['t1']
+    assert not os.path.exists(paths['unmatched_orders_file'])
+    assert not os.path.exists(legacy_journal)
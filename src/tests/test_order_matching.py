@@ -20,20 +20,33 @@ Scenarios for Order Matching System Tests:
  18. Orders with zero quantity.
  19. Matching orders with price priority.
  20. FIFO priority for orders with same price.
+ 21. Same-account orders at the top of the book are skipped.
+ 22. A sweep stops at the first price level that no longer crosses.
+ 23. Cancelling an order from the middle of a price level.
+ 24. Cancelling with the wrong account or after a fill is rejected.
+ 25. Orders loaded from disk can be cancelled by order ID.
+ 26. Only stop orders whose stop price is reached are triggered.
+ 27. A long chain of stop orders is processed without recursion.
+ 28. Top of book follows inserts, partial fills and cancels.
+ 29. Same-account orders stepped over are not walked again on every fill.
 """
 
 import pytest
 from order_execution import OrderBook
+from order import Order
 from account import AccountManager
 from datetime import datetime, timedelta
 from stock_info import StockInfo
+from trade_index import to_ns
 import os
+import shutil
 
 @pytest.fixture(autouse=True)
 def cleanup_files():
-    for f in ["unmatched_orders.json", "executed_trades.json"]:
+    for f in ["unmatched_orders.json", "executed_trades.json", "executed_trades.jsonl", "sequence.json"]:
         if os.path.exists(f):
             os.remove(f)
+    shutil.rmtree("unmatched_orders", ignore_errors=True)
 
 @pytest.fixture
 def stock_info():
@@ -44,11 +57,11 @@ def order_book(stock_info):
     return OrderBook(stock_info)
 
 @pytest.fixture
-def account_manager():
-    account_manager = AccountManager()
+def account_manager(tmp_path):
+    account_manager = AccountManager(str(tmp_path / 'accounts.json'))
     account_manager.accounts = {
-        "1": {"balance": 10000.0, "positions": {"AAPL": 0}},
-        "2": {"balance": 10000.0, "positions": {"AAPL": 100}},  # Seller with sufficient shares
+        "1": {"balance": 1000000, "positions": {"AAPL": 0}},
+        "2": {"balance": 1000000, "positions": {"AAPL": 100}},  # Seller with sufficient shares
     }
     return account_manager
 
@@ -176,7 +189,7 @@ def test_order_book_prioritization(order_book, account_manager):
     order_book.add_order(buy_order, account_manager)
     assert len(order_book.sell_orders["AAPL"]) == 1
     remaining_order = order_book.sell_orders["AAPL"][0]
-    assert remaining_order["timestamp"] > (datetime.now() - timedelta(days=1))
+    assert remaining_order["timestamp"] > to_ns(datetime.now() - timedelta(days=1))
 
 # 13. Verifying orders are saved correctly
 def test_orders_are_saved_correctly(order_book, account_manager):
@@ -225,12 +238,12 @@ def test_multiple_matching_orders_detailed(order_book, account_manager):
     remaining_sell_orders = sum(order["quantity"] for order in order_book.sell_orders.get("AAPL", []))
     assert remaining_sell_orders == 0
     assert account_manager.accounts["1"]["positions"].get("AAPL", 0) == 25
-    assert account_manager.accounts["1"]["balance"] < 10000.0
-    assert account_manager.accounts["2"]["balance"] > 10000.0
+    assert account_manager.accounts["1"]["balance"] < 1000000
+    assert account_manager.accounts["2"]["balance"] > 1000000
 
 # 15. Rejected BUY order due to insufficient balance
 def test_buy_order_rejected_insufficient_balance(order_book, account_manager):
-    account_manager.accounts["1"]["balance"] = 100.0
+    account_manager.accounts["1"]["balance"] = 10000
     buy_order = {'action': 'buy', 'ticker': 'AAPL', 'quantity': 10, 'price': 150.0, 'account_id': '1', 'order_type': 'limit', 'timestamp': datetime.now()}
     result = order_book.add_order(buy_order, account_manager)
     assert result is False
@@ -282,3 +295,127 @@ def test_fifo_priority_matching(order_book, account_manager):
     assert result is True, "Matching should prioritize older sell order"
     remaining_sell_orders = sum(order["quantity"] for order in order_book.sell_orders.get("AAPL", []))
     assert remaining_sell_orders == 10, "Only one sell order should remain in the book"
+
+# 21. Same-account orders at the top of the book are skipped
+def test_same_account_orders_skipped(order_book, account_manager):
+    account_manager.accounts["1"]["positions"]["AAPL"] = 10
+    own_sell = {'action': 'sell', 'ticker': 'AAPL', 'quantity': 10, 'price': 149.0, 'account_id': '1', 'order_type': 'limit', 'timestamp': datetime.now()}
+    other_sell = {'action': 'sell', 'ticker': 'AAPL', 'quantity': 10, 'price': 150.0, 'account_id': '2', 'order_type': 'limit', 'timestamp': datetime.now()}
+    buy_order = {'action': 'buy', 'ticker': 'AAPL', 'quantity': 10, 'price': 150.0, 'account_id': '1', 'order_type': 'limit', 'timestamp': datetime.now()}
+    order_book.add_order(own_sell, account_manager)
+    order_book.add_order(other_sell, account_manager)
+    order_book.add_order(buy_order, account_manager)
+    remaining_sells = list(order_book.sell_orders["AAPL"])
+    assert len(remaining_sells) == 1
+    assert remaining_sells[0]["account_id"] == '1'
+    assert len(order_book.buy_orders["AAPL"]) == 0
+
+# 22. A sweep stops at the first price level that no longer crosses
+def test_sweep_stops_at_non_crossing_level(order_book, account_manager):
+    for price in [150.0, 151.0, 152.0, 153.0]:
+        sell_order = {'action': 'sell', 'ticker': 'AAPL', 'quantity': 5, 'price': price, 'account_id': '2', 'order_type': 'limit', 'timestamp': datetime.now()}
+        order_book.add_order(sell_order, account_manager)
+    buy_order = {'action': 'buy', 'ticker': 'AAPL', 'quantity': 20, 'price': 151.0, 'account_id': '1', 'order_type': 'limit', 'timestamp': datetime.now()}
+    order_book.add_order(buy_order, account_manager)
+    assert [order["price"] for order in order_book.sell_orders["AAPL"]] == [152.0, 153.0]
+    assert order_book.buy_orders["AAPL"][0]["quantity"] == 10
+    assert account_manager.accounts["1"]["positions"]["AAPL"] == 10
+
+# 23. Cancelling an order from the middle of a price level
+def test_cancel_order_middle_of_level(order_book, account_manager):
+    for order_id in ['b1', 'b2', 'b3']:
+        buy_order = {'action': 'buy', 'ticker': 'AAPL', 'quantity': 10, 'price': 140.0, 'account_id': '1', 'order_type': 'limit', 'timestamp': datetime.now(), 'order_id': order_id}
+        order_book.add_order(buy_order, account_manager)
+    assert order_book.cancel_order('1', 'b2') is True
+    assert [order['order_id'] for order in order_book.buy_orders["AAPL"]] == ['b1', 'b3']
+    assert 'b2' not in order_book.order_index
+
+# 24. Cancelling with the wrong account or after a fill is rejected
+def test_cancel_order_wrong_account_or_filled(order_book, account_manager):
+    buy_order = {'action': 'buy', 'ticker': 'AAPL', 'quantity': 10, 'price': 150.0, 'account_id': '1', 'order_type': 'limit', 'timestamp': datetime.now(), 'order_id': 'b1'}
+    order_book.add_order(buy_order, account_manager)
+    assert order_book.cancel_order('2', 'b1') is False
+    assert len(order_book.buy_orders["AAPL"]) == 1
+    sell_order = {'action': 'sell', 'ticker': 'AAPL', 'quantity': 10, 'price': 150.0, 'account_id': '2', 'order_type': 'limit', 'timestamp': datetime.now(), 'order_id': 's1'}
+    order_book.add_order(sell_order, account_manager)
+    assert order_book.cancel_order('1', 'b1') is False
+    assert order_book.order_index == {}
+
+# 25. Orders loaded from disk can be cancelled by order ID
+def test_cancel_orders_after_reload(stock_info, account_manager):
+    order_book = OrderBook(stock_info)
+    buy_order = {'action': 'buy', 'ticker': 'AAPL', 'quantity': 10, 'price': 140.0, 'account_id': '1', 'order_type': 'limit', 'timestamp': datetime.now(), 'order_id': 'b1'}
+    stop_order = {'action': 'sell', 'ticker': 'AAPL', 'quantity': 10, 'stop_price': 145.0, 'account_id': '2', 'order_type': 'stop_market', 'timestamp': datetime.now(), 'order_id': 's1'}
+    order_book.add_order(buy_order, account_manager)
+    order_book.add_order(stop_order, account_manager)
+    reloaded = OrderBook(stock_info)
+    assert reloaded.cancel_order('1', 'b1') is True
+    assert reloaded.cancel_stop_order('2', 's1') is True
+    assert len(reloaded.buy_orders["AAPL"]) == 0
+    assert len(reloaded.stop_sell_orders["AAPL"]) == 0
+
+# 26. Only stop orders whose stop price is reached are triggered
+def test_stop_orders_trigger_by_stop_price(order_book, account_manager):
+    for order_id, stop_price in [('s1', 140.0), ('s2', 146.0), ('s3', 144.0), ('s4', 145.0)]:
+        stop_order = {'action': 'sell', 'ticker': 'AAPL', 'quantity': 1, 'stop_price': stop_price, 'account_id': '2', 'order_type': 'stop_market', 'timestamp': datetime.now(), 'order_id': order_id}
+        order_book.add_order(stop_order, account_manager)
+    assert order_book.cancel_stop_order('2', 's4') is True
+    order_book.update_market_price('AAPL', 145.0, account_manager)
+    assert [order['order_id'] for order in order_book.sell_orders["AAPL"]] == ['s2']
+    assert [order['order_id'] for order in order_book.stop_sell_orders["AAPL"]] == ['s1', 's3']
+    assert order_book.cancel_stop_order('2', 's2') is False
+    assert order_book.order_index['s2'][0] == 'sell'
+
+# 27. A long chain of stop orders is processed without recursion
+def test_long_stop_cascade(order_book, account_manager):
+    chain_length = 600
+    account_manager.accounts["1"]["balance"] = 1000000000
+    account_manager.accounts["2"]["positions"]["AAPL"] = chain_length
+    for i in range(chain_length):
+        buy_order = {'action': 'buy', 'ticker': 'AAPL', 'quantity': 1.0, 'price': 1999.0 - i, 'account_id': '1', 'order_type': 'limit', 'timestamp': datetime.now(), 'order_id': f'b{i}'}
+        stop_order = {'action': 'sell', 'ticker': 'AAPL', 'quantity': 1.0, 'stop_price': 2000.0 - i, 'account_id': '2', 'order_type': 'stop_market', 'timestamp': datetime.now(), 'order_id': f's{i}'}
+        order_book._rest_order(Order.from_dict(buy_order), 'AAPL')
+        order_book._add_stop_order(Order.from_dict(stop_order), 'AAPL')
+    order_book.update_market_price('AAPL', 2000.0, account_manager)
+    assert len(order_book.buy_orders["AAPL"]) == 0
+    assert len(order_book.stop_sell_orders["AAPL"]) == 0
+    assert order_book.last_trade_price["AAPL"] == 2000.0 - chain_length
+    stats = order_book.cascade_stats[-1]
+    assert stats['depth'] == chain_length
+    assert stats['triggered'] == chain_length
+    assert stats['fills'] == chain_length
+
+# 28. Top of book follows inserts, partial fills and cancels
+def test_top_of_book_updates(order_book, account_manager):
+    for order_id, quantity, price in [('s1', 10, 150.0), ('s2', 5, 150.0), ('s3', 7, 151.0)]:
+        sell_order = {'action': 'sell', 'ticker': 'AAPL', 'quantity': quantity, 'price': price, 'account_id': '2', 'order_type': 'limit', 'timestamp': datetime.now(), 'order_id': order_id}
+        order_book.add_order(sell_order, account_manager)
+    assert order_book.get_top_of_book('AAPL') == {'bid': None, 'ask': (150.0, 15.0, 2)}
+    buy_order = {'action': 'buy', 'ticker': 'AAPL', 'quantity': 4, 'price': 150.0, 'account_id': '1', 'order_type': 'limit', 'timestamp': datetime.now()}
+    order_book.add_order(buy_order, account_manager)
+    assert order_book.get_top_of_book('AAPL')['ask'] == (150.0, 11.0, 2)
+    order_book.cancel_order('2', 's1')
+    order_book.cancel_order('2', 's2')
+    assert order_book.get_top_of_book('AAPL')['ask'] == (151.0, 7.0, 1)
+
+# 29. Same-account orders stepped over are not walked again on every fill
+def test_same_account_orders_walked_once(order_book, account_manager):
+    account_manager.accounts["1"]["positions"]["AAPL"] = 50
+    for account_id in ['1', '2']:
+        for i in range(50):
+            sell_order = {'action': 'sell', 'ticker': 'AAPL', 'quantity': 1, 'price': 150.0, 'account_id': account_id, 'order_type': 'limit', 'timestamp': datetime.now(), 'order_id': f's{account_id}-{i}'}
+            order_book.add_order(sell_order, account_manager)
+    sell_side = order_book.sell_orders["AAPL"]
+    nodes_after = sell_side.nodes_after
+    walked = []
+    def counting_nodes_after(node=None):
+        for next_node in nodes_after(node):
+            walked.append(next_node)
+            yield next_node
+    sell_side.nodes_after = counting_nodes_after
+    buy_order = {'action': 'buy', 'ticker': 'AAPL', 'quantity': 50, 'price': 150.0, 'account_id': '1', 'order_type': 'limit', 'timestamp': datetime.now()}
+    order_book.add_order(buy_order, account_manager)
+    assert [order['order_id'] for order in sell_side] == [f's1-{i}' for i in range(50)]
+    assert len(order_book.buy_orders["AAPL"]) == 0
+    # The 50 own orders are stepped over once, then each fill walks one order
+    assert len(walked) == 100
@@ -0,0 +1,46 @@
+"""
+Scenarios for the Order record:
+1. A dict order converts to an Order and back without losing fields; its timestamp is kept in nanoseconds.
+2. Orders can still be read like dicts.
+3. A triggered stop order becomes a market or limit order.
+"""
+from datetime import datetime
+from order import Order, OrderType, Side
+from trade_index import to_ns
+
+
+def test_dict_round_trip():
+    timestamp = datetime(2024, 12, 1, 10, 30)
+    data = {'action': 'buy', 'account_id': '1', 'ticker': 'AAPL', 'quantity': 10.0,
+            'order_type': 'limit', 'price': 150.0, 'timestamp': timestamp.isoformat(),
+            'order_id': '1_AAPL_1', 'all_or_nothing': True}
+    order = Order.from_dict(data)
+    assert order.side == Side.BUY
+    assert order.order_type == OrderType.LIMIT
+    assert order.timestamp == to_ns(timestamp)
+    assert Order.from_dict(dict(data, timestamp=timestamp)).timestamp == order.timestamp
+    assert order.extra == {'all_or_nothing': True}
+    assert order.to_dict() == data
+
+
+def test_dict_style_access():
+    order = Order.from_dict({'action': 'sell', 'account_id': '2', 'ticker': 'AAPL', 'quantity': 5.0,
+                             'order_type': 'market', 'timestamp': datetime.now()})
+    assert order['action'] == 'sell'
+    assert order['order_type'] == 'market'
+    assert order['price'] is None
+    assert order.get('missing', 'default') == 'default'
+    order['order_id'] = '2_AAPL_1'
+    assert order.order_id == '2_AAPL_1'
+
+
+def test_triggered_stop_orders():
+    stop_market = Order.from_dict({'action': 'sell', 'account_id': '2', 'ticker': 'AAPL', 'quantity': 5.0,
+                                   'order_type': 'stop_market', 'stop_price': 145.0, 'timestamp': datetime.now()})
+    stop_limit = Order.from_dict({'action': 'buy', 'account_id': '1', 'ticker': 'AAPL', 'quantity': 5.0,
+                                  'order_type': 'stop_limit', 'stop_price': 155.0, 'price': 156.0,
+                                  'timestamp': datetime.now()})
+    assert stop_market.triggered().order_type == OrderType.MARKET
+    assert stop_market.triggered().price is None
+    assert stop_limit.triggered().order_type == OrderType.LIMIT
+    assert stop_limit.triggered().price == 156.0
@@ -0,0 +1,73 @@
+"""
+Scenarios for the engine's id sequence:
+1. Orders from one account in the same second get distinct IDs, and each cancels only itself.
+2. Orders and trades draw increasing IDs from the same sequence.
+3. After a restart IDs continue above the last reserved block (json, sqlite, memory).
+4. The sequence store is written once per block, not once per ID.
+"""
+from datetime import datetime
+import pytest
+from helpers import make_book, order
+from sequence import IdSequence
+from storage import JsonStorage, MemorySequenceStore, MemoryStorage, SqliteStorage
+
+
+def test_same_second_orders_get_distinct_ids():
+    order_book, account_manager = make_book()
+    timestamp = datetime.now().replace(microsecond=0)
+    first, second = order('buy', '1', 1, 140.0, timestamp=timestamp), order('buy', '1', 1, 141.0, timestamp=timestamp)
+    order_book.add_order(first, account_manager)
+    order_book.add_order(second, account_manager)
+    assert first['order_id'] != second['order_id']
+    assert order_book.cancel_order('1', first['order_id'])
+    assert [o.order_id for o in order_book.buy_orders['AAPL']] == [second['order_id']]
+
+
+def test_orders_and_trades_share_the_sequence():
+    order_book, account_manager = make_book()
+    sell, buy = order('sell', '2', 1, 150.0), order('buy', '1', 1, 150.0)
+    order_book.add_order(sell, account_manager)
+    order_book.add_order(buy, account_manager)
+    trade = next(iter(order_book.trade_journal))
+    assert [int(sell['order_id']), int(buy['order_id']), int(trade['trade_id'])] == [1, 2, 3]
+
+
+@pytest.mark.parametrize('kind', ['json', 'sqlite', 'memory'])
+def test_ids_continue_after_restart(kind, tmp_path):
+    memory = MemoryStorage()
+
+    def make_storage():
+        if kind == 'json':
+            return JsonStorage(str(tmp_path / 'unmatched_orders.json'), str(tmp_path / 'executed_trades.jsonl'),
+                               str(tmp_path / 'accounts.json'))
+        if kind == 'sqlite':
+            return SqliteStorage(str(tmp_path / 'trading.db'))
+        return memory
+
+    storage = make_storage()
+    order_book, account_manager = make_book(storage=storage)
+    placed = order('buy', '1', 1, 140.0)
+    order_book.add_order(placed, account_manager)
+    storage.close()
+    if kind == 'json':
+        assert (tmp_path / 'sequence.json').exists()
+
+    storage = make_storage()
+    reloaded, account_manager = make_book(storage=storage)
+    again = order('buy', '1', 1, 141.0)
+    reloaded.add_order(again, account_manager)
+    assert int(again['order_id']) > int(placed['order_id'])
+    assert reloaded.cancel_order('1', placed['order_id'])
+    storage.close()
+
+
+def test_store_written_once_per_block():
+    store = MemorySequenceStore()
+    saves = []
+    store.save = saves.append
+    sequence = IdSequence(store, block=10)
+    assert [sequence.next() for _ in range(25)] == list(range(1, 26))
+    assert saves == [10, 20, 30]
+    store.value = saves[-1]
+    del store.save
+    assert IdSequence(store, block=10).next() == 31
@@ -13,8 +13,8 @@ def stock_info():
 def account_manager():
     account_manager = AccountManager()
     account_manager.accounts = {
-        "1": {"balance": 10000.0, "positions": {"AAPL": 10}},
-        "2": {"balance": 15000.0, "positions": {"MSFT": 5}}
+        "1": {"balance": 1000000, "positions": {"AAPL": 10}},
+        "2": {"balance": 1500000, "positions": {"MSFT": 5}}
     }  
     return account_manager
 
@@ -0,0 +1,115 @@
+"""
+Scenarios for the storage backends (json, sqlite, memory):
+1. The book, trades and accounts survive a restart on the same storage.
+2. Deleting a trade and resetting the book go through the trade store.
+3. The SQLite database runs in WAL mode and a matching run is one transaction.
+4. Unknown backend names are rejected.
+"""
+import os
+import pytest
+from datetime import datetime
+from account import AccountManager
+from order_execution import OrderBook
+from stock_info import StockInfo
+from storage import JsonStorage, MemoryStorage, SqliteStorage, open_storage
+
+
+@pytest.fixture(params=['json', 'sqlite', 'memory'])
+def make_storage(request, tmp_path):
+    opened = []
+
+    def make():
+        if request.param == 'json':
+            storage = JsonStorage(str(tmp_path / 'unmatched_orders.json'), str(tmp_path / 'executed_trades.jsonl'),
+                                  str(tmp_path / 'accounts.json'))
+        elif request.param == 'sqlite':
+            storage = SqliteStorage(str(tmp_path / 'trading.db'))
+        else:
+            storage = opened[0] if opened else MemoryStorage()
+        opened.append(storage)
+        return storage
+
+    yield make
+    for storage in opened:
+        storage.close()
+
+
+def order(order_id, action, account_id, quantity, order_type='limit', price=150.0, **extra):
+    return dict({'action': action, 'ticker': 'AAPL', 'quantity': quantity, 'price': price, 'account_id': account_id,
+                 'order_type': order_type, 'timestamp': datetime.now(), 'order_id': order_id}, **extra)
+
+
+def open_book(storage):
+    account_manager = AccountManager(storage=storage)
+    if not account_manager.accounts:
+        account_manager.reset_accounts({
+            "1": {"balance": 10000000, "positions": {}},
+            "2": {"balance": 10000000, "positions": {"AAPL": 100}},
+        })
+    return OrderBook(StockInfo(), storage=storage), account_manager
+
+
+def test_state_survives_restart(make_storage):
+    order_book, account_manager = open_book(make_storage())
+    order_book.add_order(order('b1', 'buy', '1', 10, price=151.0), account_manager)
+    order_book.add_order(order('b2', 'buy', '1', 10, price=149.0), account_manager)
+    order_book.add_order(order('b3', 'buy', '1', 10, price=149.0), account_manager)
+    order_book.add_order(order('s1', 'sell', '2', 5, order_type='stop_market', price=None, stop_price=151.0),
+                         account_manager)
+    order_book.add_order(order('a1', 'sell', '2', 4, price=151.0), account_manager)
+    order_book.cancel_order('1', 'b3')
+    account_manager.sync()
+
+    reloaded, reloaded_accounts = open_book(make_storage())
+    reloaded.load_ticker('AAPL')
+    assert [(o.order_id, o.quantity, o.order_type) for o in reloaded.buy_orders['AAPL']] == \
+        [(o.order_id, o.quantity, o.order_type) for o in order_book.buy_orders['AAPL']]
+    assert [(o.order_id, o.quantity) for o in reloaded.buy_orders['AAPL']] == [('b1', 1), ('b2', 10)]
+    assert len(reloaded.sell_orders.get('AAPL', [])) == 0
+    assert len(reloaded.stop_sell_orders.get('AAPL', [])) == 0
+    assert [trade['quantity'] for trade in reloaded.trade_journal] == [4, 5]
+    assert reloaded_accounts.accounts == account_manager.accounts
+    assert reloaded_accounts.accounts['1']['positions'] == {'AAPL': 9}
+
+
+def test_delete_trade_and_reset(make_storage):
+    order_book, account_manager = open_book(make_storage())
+    order_book.add_order(order('b1', 'buy', '1', 10), account_manager)
+    order_book.add_order(order('a1', 'sell', '2', 10), account_manager)
+    trade_id = next(iter(order_book.trade_journal))['trade_id']
+    order_book.delete_executed_trade(trade_id, account_manager)
+    assert list(order_book.trade_journal) == []
+    assert account_manager.accounts['2']['positions'] == {'AAPL': 100}
+
+    order_book.add_order(order('b2', 'buy', '1', 10, price=140.0), account_manager)
+    order_book.reset()
+    reloaded, _ = open_book(make_storage())
+    assert len(reloaded.buy_orders.get('AAPL', [])) == 0
+    assert list(reloaded.trade_journal) == []
+    account_manager.sync()  # before the storage is closed, as the owners of a storage do
+
+
+def test_sqlite_wal_and_one_transaction_per_match(tmp_path):
+    storage = SqliteStorage(str(tmp_path / 'trading.db'))
+    assert storage.conn.execute('PRAGMA journal_mode').fetchone()[0] == 'wal'
+    order_book, account_manager = open_book(storage)
+    for i in range(5):
+        order_book.add_order(order(f'a{i}', 'sell', '2', 1), account_manager)
+
+    statements = []
+    storage.conn.set_trace_callback(statements.append)
+    order_book.add_order(order('b1', 'buy', '1', 5), account_manager)
+    storage.conn.set_trace_callback(None)
+    # One transaction for the add and one for all five fills of the matching run
+    assert [s for s in statements if s in ('BEGIN', 'COMMIT')] == ['BEGIN', 'COMMIT', 'BEGIN', 'COMMIT']
+    assert storage.conn.execute('SELECT COUNT(*) FROM trades').fetchone()[0] == 5
+    assert storage.conn.execute('SELECT COUNT(*) FROM orders').fetchone()[0] == 0
+    account_manager.sync()
+    storage.close()
+
+
+def test_unknown_backend():
+    with pytest.raises(ValueError):
+        open_storage('csv')
+    assert isinstance(open_storage('memory'), MemoryStorage)
+    assert not os.path.exists('trading.db')
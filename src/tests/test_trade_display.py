@@ -0,0 +1,105 @@
+"""
+Scenarios for paging and exporting executed trades:
+1. --limit, --page and --tail pick the right trades, with page footers and empty-page messages.
+2. CSV and JSON-Lines exports hold every trade; the text export is unchanged, and unknown formats and
+   unwritable files are reported.
+3. Exporting streams the trades: memory use does not grow with the size of the history.
+4. The console display options are parsed, and bad ones are rejected with a message.
+"""
+import csv
+import json
+import tracemalloc
+from datetime import datetime, timedelta
+from helpers import make_trade
+from main import parse_display_options
+from order_execution import OrderBook
+from stock_info import StockInfo
+from storage import JsonStorage
+
+
+def numbered_trade(i):
+    return make_trade(f't{i}', price=100.0 + i, quantity=1.0,
+                      timestamp=(datetime(2024, 12, 1) + timedelta(seconds=i)).isoformat())
+
+
+def make_book(tmp_path, count):
+    storage = JsonStorage(str(tmp_path / 'unmatched_orders.json'), str(tmp_path / 'executed_trades.jsonl'),
+                          str(tmp_path / 'accounts.json'))
+    storage.trades.rewrite(numbered_trade(i) for i in range(1, count + 1))
+    return OrderBook(StockInfo(), storage=storage)
+
+
+def shown_ids(out):
+    return [line.split(': ')[1] for line in out.splitlines() if line.startswith('Trade ID: ')]
+
+
+def test_limit_page_and_tail(tmp_path, capsys):
+    order_book = make_book(tmp_path, 45)
+    order_book.display_executed_trades(limit=3)
+    assert shown_ids(capsys.readouterr().out) == ['t1', 't2', 't3']
+
+    order_book.display_executed_trades(page=2)
+    out = capsys.readouterr().out
+    assert shown_ids(out) == [f't{i}' for i in range(21, 41)]
+    assert "Page 2: trades 21-40." in out
+    assert "executed trades display --page 3" in out
+
+    order_book.display_executed_trades(page=3, limit=20)
+    out = capsys.readouterr().out
+    assert shown_ids(out) == [f't{i}' for i in range(41, 46)]
+    assert "Page 3: trades 41-45." in out and "--page 4" not in out
+
+    order_book.display_executed_trades(page=4)
+    assert capsys.readouterr().out == "No executed trades on page 4.\n"
+
+    order_book.display_executed_trades(tail=2)
+    assert shown_ids(capsys.readouterr().out) == ['t44', 't45']
+
+
+def test_export_formats(tmp_path, capsys):
+    order_book = make_book(tmp_path, 3)
+    order_book.export_executed_trades(str(tmp_path / 'trades.csv'), 'csv')
+    with open(tmp_path / 'trades.csv', newline='') as f:
+        rows = list(csv.DictReader(f))
+    assert [row['trade_id'] for row in rows] == ['t1', 't2', 't3']
+    assert rows[1] == {'trade_id': 't2', 'timestamp': '2024-12-01T00:00:02', 'ticker': 'AAPL', 'price': '102.0',
+                       'quantity': '1.0', 'buy_account_id': '1', 'sell_account_id': '2'}
+
+    order_book.export_executed_trades(str(tmp_path / 'trades.jsonl'), 'jsonl')
+    with open(tmp_path / 'trades.jsonl') as f:
+        assert [json.loads(line) for line in f] == [numbered_trade(i) for i in (1, 2, 3)]
+
+    order_book.export_executed_trades(str(tmp_path / 'trades.txt'))
+    assert (tmp_path / 'trades.txt').read_text().startswith(
+        "Trade ID: t1\n  Timestamp: 2024-12-01T00:00:01\n  Ticker: AAPL\n  Price: 101.0\n")
+
+    capsys.readouterr()
+    order_book.export_executed_trades(str(tmp_path / 'trades.xml'), 'xml')
+    assert "unknown export format 'xml'" in capsys.readouterr().out
+    assert not (tmp_path / 'trades.xml').exists()
+
+    order_book.export_executed_trades(str(tmp_path / 'missing' / 'trades.txt'))
+    assert capsys.readouterr().out.startswith(f"Error: cannot write {tmp_path / 'missing' / 'trades.txt'}: ")
+
+
+def export_peak(tmp_path, count, fmt):
+    order_book = make_book(tmp_path, count)
+    tracemalloc.start()
+    order_book.export_executed_trades(str(tmp_path / f'trades.{fmt}'), fmt)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return peak
+
+
+def test_export_streams(tmp_path):
+    for fmt in ('csv', 'jsonl', 'text'):
+        assert export_peak(tmp_path, 8000, fmt) < 1.5 * export_peak(tmp_path, 2000, fmt)
+
+
+def test_parse_display_options(capsys):
+    assert parse_display_options([]) == {}
+    assert parse_display_options(['--page', '2', '--limit', '50']) == {'page': 2, 'limit': 50}
+    assert parse_display_options(['--tail', '10']) == {'tail': 10}
+    for bad in (['--page'], ['--page', 'x'], ['--limit', '0'], ['--head', '3'], ['--tail', '3', '--page', '1']):
+        assert parse_display_options(bad) is None
+    assert "--tail cannot be combined" in capsys.readouterr().out
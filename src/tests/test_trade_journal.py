@@ -0,0 +1,136 @@
+"""
+Scenarios for the executed trades journal:
+1. Trades are appended one JSON line each and read back in order.
+2. A legacy executed_trades.json array is migrated once.
+3. A torn last line is skipped when reading.
+4. Deleting a trade reverses it and removes it from the journal.
+5. Display and export read the journal.
+6. Deleting appends a tombstone instead of rewriting, and survives a reopen.
+7. Trades are found through the trade_id index, including ones appended later.
+8. Compaction drops deleted trades, and starts by itself after enough deletes.
+9. Deleting an unknown trade keeps the existing messages.
+"""
+import json
+import os
+import pytest
+from order_execution import OrderBook
+from stock_info import StockInfo
+from account import AccountManager
+from helpers import make_trade
+from trade_journal import TradeJournal
+
+
+@pytest.fixture
+def order_book(tmp_path):
+    return OrderBook(StockInfo(), unmatched_orders_file=str(tmp_path / 'unmatched_orders.json'),
+                     executed_trades_file=str(tmp_path / 'executed_trades.jsonl'))
+
+
+@pytest.fixture
+def account_manager(tmp_path):
+    account_manager = AccountManager(str(tmp_path / 'accounts.json'))
+    account_manager.accounts = {
+        "1": {"balance": 850000, "positions": {"AAPL": 10.0}},
+        "2": {"balance": 1150000, "positions": {}},
+    }
+    return account_manager
+
+
+def test_append_and_read(tmp_path):
+    journal = TradeJournal(str(tmp_path / 'trades.jsonl'))
+    journal.append(make_trade('t1'))
+    journal.append(make_trade('t2'))
+    with open(journal.path) as f:
+        lines = f.readlines()
+    assert len(lines) == 2
+    assert [trade['trade_id'] for trade in journal] == ['t1', 't2']
+
+
+def test_legacy_file_migrated_once(tmp_path):
+    legacy_path = tmp_path / 'executed_trades.json'
+    legacy_path.write_text(json.dumps([make_trade('t1'), make_trade('t2')], indent=4))
+    journal = TradeJournal(str(tmp_path / 'executed_trades.jsonl'), str(legacy_path))
+    assert [trade['trade_id'] for trade in journal] == ['t1', 't2']
+    assert not legacy_path.exists()
+    journal.append(make_trade('t3'))
+    journal = TradeJournal(str(tmp_path / 'executed_trades.jsonl'), str(legacy_path))
+    assert [trade['trade_id'] for trade in journal] == ['t1', 't2', 't3']
+
+
+def test_torn_last_line_skipped(tmp_path):
+    journal = TradeJournal(str(tmp_path / 'trades.jsonl'))
+    journal.append(make_trade('t1'))
+    with open(journal.path, 'a') as f:
+        f.write('{"trade_id": "t2", "tick')
+    assert [trade['trade_id'] for trade in journal] == ['t1']
+
+
+def test_delete_trade_reverses_accounts(order_book, account_manager):
+    order_book.trade_journal.append(make_trade('t1'))
+    order_book.trade_journal.append(make_trade('t2', price=100.0, quantity=1.0))
+    order_book.delete_executed_trade('t1', account_manager)
+    assert [trade['trade_id'] for trade in order_book.trade_journal] == ['t2']
+    assert account_manager.accounts["1"]["balance"] == 1000000
+    assert account_manager.accounts["1"]["positions"] == {}
+    assert account_manager.accounts["2"]["positions"] == {"AAPL": 10.0}
+
+
+def test_display_and_export(order_book, tmp_path, capsys):
+    order_book.display_executed_trades()
+    assert "No executed trades found." in capsys.readouterr().out
+    order_book.trade_journal.append(make_trade('t1'))
+    order_book.display_executed_trades()
+    assert "Trade ID: t1" in capsys.readouterr().out
+    export_path = tmp_path / 'export.txt'
+    order_book.export_executed_trades(str(export_path))
+    assert "Trade ID: t1\n  Timestamp: 2024-12-01T10:30:00\n" in export_path.read_text()
+    assert os.path.exists(order_book.executed_trades_file)
+
+
+def test_delete_writes_tombstone(tmp_path):
+    journal = TradeJournal(str(tmp_path / 'trades.jsonl'))
+    journal.append(make_trade('t1'))
+    journal.append(make_trade('t2'))
+    size = os.path.getsize(journal.path)
+    assert journal.delete('t1')
+    assert not journal.delete('t1')
+    assert os.path.getsize(journal.path) == size
+    assert [trade['trade_id'] for trade in journal] == ['t2']
+    reopened = TradeJournal(journal.path)
+    assert [trade['trade_id'] for trade in reopened] == ['t2']
+    assert reopened.find('t1') is None
+
+
+def test_find_through_index(tmp_path):
+    journal = TradeJournal(str(tmp_path / 'trades.jsonl'))
+    journal.append(make_trade('t1'))
+    assert journal.find('t1')['trade_id'] == 't1'
+    journal.append(make_trade('t2', price=99.0))
+    assert journal.offsets['t2'] > 0
+    assert journal.find('t2')['price'] == 99.0
+    assert journal.find('t3') is None
+
+
+def test_compaction(tmp_path):
+    journal = TradeJournal(str(tmp_path / 'trades.jsonl'), compact_after=2)
+    for trade_id in ('t1', 't2', 't3'):
+        journal.append(make_trade(trade_id))
+    journal.delete('t1')
+    assert journal.compaction_thread is None
+    journal.delete('t3')
+    journal.compaction_thread.join()
+    with open(journal.path) as f:
+        assert [json.loads(line)['trade_id'] for line in f] == ['t2']
+    assert journal.deleted == set()
+    assert os.path.getsize(journal.deleted_path) == 0
+    journal.append(make_trade('t4'))
+    assert [trade['trade_id'] for trade in journal] == ['t2', 't4']
+    assert journal.find('t4')['trade_id'] == 't4'
+
+
+def test_delete_unknown_trade_messages(order_book, account_manager, capsys):
+    order_book.delete_executed_trade('t1', account_manager)
+    assert "No executed trades found." in capsys.readouterr().out
+    order_book.trade_journal.append(make_trade('t1'))
+    order_book.delete_executed_trade('t9', account_manager)
+    assert "Trade ID t9 not found." in capsys.readouterr().out
@@ -0,0 +1,147 @@
+"""
+Scenarios for the binary trade log:
+1. Trades round-trip through the fixed-width records, UUID and short trade IDs alike; ISO timestamps of older
+   trades are read back in nanoseconds.
+2. Records are read from the mapped file, and a torn last record is ignored.
+3. Tickers and accounts are stored once in the symbols file and reloaded.
+4. The order book can use the binary log, and export still writes the text format.
+5. Deleting a trade through the order book hides it from readers.
+6. The NumPy view (when NumPy is installed) sees the same records.
+7. Deleting flags the record in place; compaction drops it and keeps sequence numbers.
+8. Prices on tickers with ticks finer than a cent round-trip exactly, through the log and the order book.
+"""
+import os
+import uuid
+import pytest
+from datetime import datetime
+from account import AccountManager
+from helpers import make_trade
+from order_execution import OrderBook
+from stock_info import StockInfo
+from storage import JsonStorage
+from trade_index import format_timestamp, to_ns
+from trade_log import BinaryTradeLog, FLAG_DELETED, RECORD
+
+
+def test_round_trip(tmp_path):
+    log = BinaryTradeLog(str(tmp_path / 'trades.bin'))
+    stamp = 1733049000123456789  # time.time_ns()
+    trades = [make_trade(str(uuid.uuid4()), price=150.25, timestamp=stamp),
+              make_trade('t2', ticker='TSLA', price=0.01, quantity=2.5, buyer='3', timestamp=stamp)]
+    for trade in trades:
+        log.append(trade)
+    assert list(log) == trades
+    assert os.path.getsize(log.path) == 2 * RECORD.size
+    assert [record[0] for record in log.records()] == [1, 2]
+
+    log.append(make_trade('t3', timestamp='2024-12-01T10:30:00.123456'))
+    assert list(log)[2]['timestamp'] == to_ns(datetime(2024, 12, 1, 10, 30, 0, 123456))
+    assert format_timestamp(list(log)[2]['timestamp']) == '2024-12-01T10:30:00.123456'
+
+
+def test_torn_record_ignored_and_symbols_reloaded(tmp_path):
+    path = str(tmp_path / 'trades.bin')
+    log = BinaryTradeLog(path)
+    log.append(make_trade('t1'))
+    log.append(make_trade('t2', ticker='GOOG'))
+    with open(path, 'ab') as f:
+        f.write(b'\x01' * 10)
+
+    reloaded = BinaryTradeLog(path)
+    assert [trade['trade_id'] for trade in reloaded] == ['t1', 't2']
+    assert reloaded.values == {'ticker': ['AAPL', 'GOOG'], 'account': ['1', '2']}
+    with open(reloaded.symbols_path) as f:
+        assert len(f.readlines()) == 4
+
+
+def test_long_trade_id_rejected(tmp_path):
+    log = BinaryTradeLog(str(tmp_path / 'trades.bin'))
+    with pytest.raises(ValueError):
+        log.append(make_trade('x' * 17))
+
+
+def test_order_book_on_binary_log(tmp_path):
+    storage = JsonStorage(str(tmp_path / 'unmatched_orders.json'), str(tmp_path / 'executed_trades.jsonl'),
+                          str(tmp_path / 'accounts.json'), trade_log='binary')
+    account_manager = AccountManager(storage=storage)
+    account_manager.accounts = {
+        "1": {"balance": 10000000, "positions": {}},
+        "2": {"balance": 10000000, "positions": {"AAPL": 100}},
+    }
+    order_book = OrderBook(StockInfo(), storage=storage)
+    for order_id, action, account_id in (('b1', 'buy', '1'), ('a1', 'sell', '2')):
+        order_book.add_order({'action': action, 'ticker': 'AAPL', 'quantity': 10, 'price': 150.5,
+                              'account_id': account_id, 'order_type': 'limit', 'timestamp': datetime.now(),
+                              'order_id': order_id}, account_manager)
+    assert os.path.exists(str(tmp_path / 'executed_trades.bin'))
+    assert not os.path.exists(str(tmp_path / 'executed_trades.jsonl'))
+
+    trade = next(iter(order_book.trade_journal))
+    export_path = tmp_path / 'export.txt'
+    order_book.export_executed_trades(str(export_path))
+    text = export_path.read_text()
+    assert f"Trade ID: {trade['trade_id']}\n" in text
+    assert "  Price: 150.5\n  Quantity: 10.0\n  Buyer Account ID: 1\n" in text
+
+    order_book.delete_executed_trade(trade['trade_id'], account_manager)
+    assert list(order_book.trade_journal) == []
+    assert account_manager.accounts["2"]["positions"] == {"AAPL": 100}
+
+
+def test_numpy_view(tmp_path):
+    np = pytest.importorskip('numpy')
+    log = BinaryTradeLog(str(tmp_path / 'trades.bin'))
+    log.append(make_trade('t1', price=1.5))
+    log.append(make_trade('t2', price=2.25, quantity=3.0))
+    view = log.numpy_view()
+    assert view['price_ticks'].tolist() == [150, 225]
+    assert view['price_decimals'].tolist() == [2, 2]
+    assert float(np.sum(view['quantity'])) == 13.0
+    assert view['seq'].tolist() == [1, 2]
+
+
+def test_delete_flags_record_and_compaction(tmp_path):
+    log = BinaryTradeLog(str(tmp_path / 'trades.bin'), compact_after=2)
+    for trade_id in ('t1', 't2', 't3'):
+        log.append(make_trade(trade_id))
+    assert log.delete('t2')
+    assert not log.delete('t2')
+    assert os.path.getsize(log.path) == 3 * RECORD.size
+    assert [record[8] & FLAG_DELETED for record in log.records(include_deleted=True)] == [0, FLAG_DELETED, 0]
+    assert [trade['trade_id'] for trade in BinaryTradeLog(log.path)] == ['t1', 't3']
+    assert log.find('t3')['trade_id'] == 't3'
+
+    log.delete('t1')
+    log.compaction_thread.join()
+    assert os.path.getsize(log.path) == RECORD.size
+    log.append(make_trade('t4'))
+    reopened = BinaryTradeLog(log.path)
+    assert [record[0] for record in reopened.records()] == [3, 4]
+    assert reopened.sequence == 4
+
+
+def test_sub_cent_prices(tmp_path):
+    log = BinaryTradeLog(str(tmp_path / 'trades.bin'))
+    prices = [150.125, 0.0001, 12.5, 99999.99, 1 / 3]
+    for number, price in enumerate(prices):
+        log.append(make_trade(f't{number}', price=price))
+    assert [trade['price'] for trade in log][:4] == prices[:4]
+    assert [record[9] for record in log.records()][:4] == [3, 4, 2, 2]
+    assert abs(list(log)[4]['price'] - 1 / 3) < 1e-9
+
+    storage = JsonStorage(str(tmp_path / 'unmatched_orders.json'), str(tmp_path / 'executed_trades.jsonl'),
+                          str(tmp_path / 'accounts.json'), trade_log='binary')
+    account_manager = AccountManager(storage=storage)
+    account_manager.accounts = {
+        "1": {"balance": 10000000, "positions": {}},
+        "2": {"balance": 10000000, "positions": {"AAPL": 100}},
+    }
+    stock_info = StockInfo()
+    stock_info.ticks_per_unit['AAPL'] = 1000
+    order_book = OrderBook(stock_info, storage=storage)
+    for action, account_id in (('buy', '1'), ('sell', '2')):
+        order_book.add_order({'action': action, 'ticker': 'AAPL', 'quantity': 10, 'price': 150.125,
+                              'account_id': account_id, 'order_type': 'limit', 'timestamp': datetime.now()},
+                             account_manager)
+    reopened = BinaryTradeLog(str(tmp_path / 'executed_trades.bin'))
+    assert [trade['price'] for trade in reopened] == [150.125]
@@ -0,0 +1,127 @@
+"""
+Scenarios for querying executed trades:
+1. Ticker, account (either side) and time filters, alone and together, on every trade store; times with a
+   UTC offset are compared as local time.
+2. Trades appended after the first query are found through the updated indexes, and limit stops early.
+3. Deleted trades are left out, and compaction or a rewrite rebuilds the indexes; a query already reading
+   the journal when it is compacted still leaves them out.
+4. Trades whose timestamps go backwards are still found by time.
+5. The console filters are parsed, and bad ones are rejected with a message.
+"""
+from datetime import datetime, timezone
+import pytest
+from helpers import make_trade
+from main import parse_trade_query
+from storage import MemoryTradeStore, SqliteStorage
+from trade_journal import TradeJournal
+from trade_log import BinaryTradeLog
+
+
+def at_minute(minute):
+    return datetime(2024, 12, 1, 10, minute).isoformat()
+
+
+TRADES = [
+    make_trade('t1', 'AAPL', buyer='1', seller='2', timestamp=at_minute(0)),
+    make_trade('t2', 'TSLA', buyer='2', seller='3', timestamp=at_minute(1)),
+    make_trade('t3', 'AAPL', buyer='3', seller='1', timestamp=at_minute(2)),
+    make_trade('t4', 'AAPL', buyer='2', seller='1', timestamp=at_minute(3)),
+    make_trade('t5', 'GOOG', buyer='1', seller='3', timestamp=at_minute(4)),
+]
+
+
+@pytest.fixture(params=['jsonl', 'binary', 'sqlite', 'memory'])
+def store(request, tmp_path):
+    if request.param == 'jsonl':
+        yield TradeJournal(str(tmp_path / 'trades.jsonl'), compact_after=2)
+    elif request.param == 'binary':
+        yield BinaryTradeLog(str(tmp_path / 'trades.bin'), compact_after=2)
+    elif request.param == 'sqlite':
+        storage = SqliteStorage(str(tmp_path / 'trading.db'))
+        yield storage.trades
+        storage.close()
+    else:
+        yield MemoryTradeStore()
+
+
+def ids(trades):
+    return [trade['trade_id'] for trade in trades]
+
+
+def test_filters(store):
+    for trade in TRADES:
+        store.append(trade)
+    assert ids(store.query()) == ['t1', 't2', 't3', 't4', 't5']
+    assert ids(store.query(ticker='AAPL')) == ['t1', 't3', 't4']
+    assert ids(store.query(account_id='3')) == ['t2', 't3', 't5']
+    assert ids(store.query(account_id=1, ticker='AAPL')) == ['t1', 't3', 't4']
+    assert ids(store.query(start='2024-12-01T10:01:00', end=datetime(2024, 12, 1, 10, 3))) == ['t2', 't3']
+    assert ids(store.query(ticker='AAPL', account_id='2', start='2024-12-01T10:01:00')) == ['t4']
+    assert ids(store.query(ticker='MSFT')) == []
+    assert ids(store.query(account_id='9')) == []
+    assert ids(store.query(end='2024-12-01')) == []
+    local = datetime(2024, 12, 1, 10, 1).astimezone()
+    assert ids(store.query(start=local, end=local.astimezone(timezone.utc).isoformat())) == []
+    assert ids(store.query(start=local.astimezone(timezone.utc).isoformat())) == ['t2', 't3', 't4', 't5']
+
+
+def test_appended_trades_and_limit(store):
+    for trade in TRADES[:3]:
+        store.append(trade)
+    assert ids(store.query(ticker='AAPL')) == ['t1', 't3']
+    for trade in TRADES[3:]:
+        store.append(trade)
+    assert ids(store.query(ticker='AAPL')) == ['t1', 't3', 't4']
+    assert ids(store.query(account_id='1', limit=2)) == ['t1', 't3']
+    results = store.query(account_id='1')
+    assert next(results)['trade_id'] == 't1'
+
+
+def test_deleted_trades_and_compaction(store):
+    for trade in TRADES:
+        store.append(trade)
+    assert ids(store.query(ticker='AAPL')) == ['t1', 't3', 't4']
+    store.delete('t3')
+    assert ids(store.query(ticker='AAPL')) == ['t1', 't4']
+    store.delete('t1')
+    if getattr(store, 'compaction_thread', None):
+        store.compaction_thread.join()
+    assert ids(store.query(ticker='AAPL')) == ['t4']
+    store.append(make_trade('t6', 'AAPL', buyer='4', seller='1', timestamp=at_minute(5)))
+    assert ids(store.query(account_id='1')) == ['t4', 't5', 't6']
+    store.rewrite(TRADES[:2])
+    assert ids(store.query(account_id='2')) == ['t1', 't2']
+
+
+def test_query_during_compaction(tmp_path):
+    journal = TradeJournal(str(tmp_path / 'trades.jsonl'), compact_after=2)
+    for trade in TRADES:
+        journal.append(trade)
+    results = journal.query(ticker='AAPL')
+    assert next(results)['trade_id'] == 't1'
+    journal.delete('t3')
+    journal.delete('t4')
+    journal.compaction_thread.join()
+    assert not journal.deleted
+    assert ids(results) == []
+
+
+def test_timestamps_out_of_order(tmp_path):
+    journal = TradeJournal(str(tmp_path / 'trades.jsonl'))
+    for trade in (TRADES[2], TRADES[0], TRADES[3]):
+        journal.append(trade)
+    assert ids(journal.query(end='2024-12-01T10:01:00')) == ['t1']
+    assert ids(journal.query(ticker='AAPL', start='2024-12-01T10:02:00')) == ['t3', 't4']
+
+
+def test_parse_console_filters(capsys):
+    assert parse_trade_query(['ticker=aapl', 'account=2', 'from=2024-12-01', 'to=2024-12-02T09:30:00',
+                              'limit=5']) == {
+        'ticker': 'AAPL', 'account_id': '2', 'start': datetime(2024, 12, 1),
+        'end': datetime(2024, 12, 2, 9, 30), 'limit': 5}
+    assert parse_trade_query([]) == {}
+    aware = parse_trade_query(['from=2020-01-01T00:00:00+00:00'])['start']
+    assert aware.utcoffset() is not None
+    for bad in (['side=buy'], ['ticker'], ['from=yesterday'], ['limit=0'], ['limit=-3']):
+        assert parse_trade_query(bad) is None
+    assert "invalid query filter 'side=buy'" in capsys.readouterr().out
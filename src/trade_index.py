@@ -0,0 +1,156 @@
+import bisect
+import itertools
+from array import array
+from datetime import datetime, timedelta
+
+
+def as_datetime(value):
+    """A query bound given as a datetime or ISO text, as a naive local datetime (None stays None).
+
+    A time with a UTC offset is converted to local time.
+    """
+    if value is None:
+        return value
+    if not isinstance(value, datetime):
+        value = datetime.fromisoformat(value)
+    if value.tzinfo is not None:
+        value = value.astimezone().replace(tzinfo=None)
+    return value
+
+
+def to_seconds(timestamp):
+    """Seconds since 1970 UTC for a trade timestamp or a query bound.
+
+    Trades are stamped with ``time.time_ns()``. Trades stored before that,
+    and query bounds, are datetimes or ISO text, in local time unless they
+    have a UTC offset.
+    """
+    if isinstance(timestamp, int):
+        return timestamp / 1e9
+    return as_datetime(timestamp).timestamp()
+
+
+def to_ns(timestamp):
+    """Nanoseconds since 1970 UTC for a trade or order timestamp (see to_seconds)."""
+    if isinstance(timestamp, int):
+        return timestamp
+    value = as_datetime(timestamp)
+    return int(value.replace(microsecond=0).timestamp()) * 10 ** 9 + value.microsecond * 1000
+
+
+def format_timestamp(timestamp):
+    """A trade or order timestamp as ISO text in local time, as they are shown and saved; text is kept as it is."""
+    if isinstance(timestamp, int):
+        seconds, nanoseconds = divmod(timestamp, 10 ** 9)
+        timestamp = datetime.fromtimestamp(seconds) + timedelta(microseconds=nanoseconds // 1000)
+    if isinstance(timestamp, datetime):
+        return timestamp.isoformat()
+    return timestamp
+
+
+def matches(trade, ticker=None, account_id=None, start=None, end=None):
+    """Whether a trade passes the query filters.
+
+    ``account_id`` matches either side of the trade; ``start`` is inclusive
+    and ``end`` exclusive, both in seconds since 1970.
+    """
+    if ticker is not None and trade.get('ticker') != ticker:
+        return False
+    if account_id is not None and account_id not in (str(trade.get('buy_account_id')),
+                                                     str(trade.get('sell_account_id'))):
+        return False
+    if start is not None or end is not None:
+        if not trade.get('timestamp'):
+            return False
+        seconds = to_seconds(trade['timestamp'])
+        if start is not None and seconds < start:
+            return False
+        if end is not None and seconds >= end:
+            return False
+    return True
+
+
+def limited(trades, limit):
+    return trades if limit is None else itertools.islice(trades, limit)
+
+
+class _Postings:
+    """Store positions of a set of trades, in append order, with their times."""
+
+    __slots__ = ('positions', 'times', 'last', 'ordered')
+
+    def __init__(self):
+        self.positions = array('q')
+        self.times = array('d')
+        self.last = float('-inf')
+        self.ordered = True  # times never went backwards, so they can be bisected
+
+    def __len__(self):
+        return len(self.positions)
+
+    def add(self, position, seconds):
+        if seconds < self.last:
+            self.ordered = False
+        self.last = seconds
+        self.positions.append(position)
+        self.times.append(seconds)
+
+    def between(self, start, end):
+        """Yield the positions in the time range (all of them if the times are out of order)."""
+        lo, hi = 0, len(self.positions)
+        if self.ordered:
+            if start is not None:
+                lo = bisect.bisect_left(self.times, start)
+            if end is not None:
+                hi = bisect.bisect_left(self.times, end)
+        positions = self.positions
+        for i in range(lo, hi):
+            yield positions[i]
+
+
+class TradeIndex:
+    """Per-ticker, per-account and time indexes over a trade store.
+
+    Each index is a list of store positions (a byte offset or a record
+    number) in append order together with the trade times, so a time range
+    is two bisections. ``add`` is called for every appended trade; the
+    store reads and re-checks the trades at the candidate positions.
+    """
+
+    def __init__(self):
+        self.all = _Postings()
+        self.by_ticker = {}   # {ticker: _Postings}
+        self.by_account = {}  # {account_id: _Postings}, both sides of a trade
+
+    def add(self, position, ticker, buy_account_id, sell_account_id, seconds):
+        self.all.add(position, seconds)
+        postings = self.by_ticker.get(ticker)
+        if postings is None:
+            postings = self.by_ticker[ticker] = _Postings()
+        postings.add(position, seconds)
+        buy_account_id, sell_account_id = str(buy_account_id), str(sell_account_id)
+        self._add_account(buy_account_id, position, seconds)
+        if sell_account_id != buy_account_id:
+            self._add_account(sell_account_id, position, seconds)
+
+    def _add_account(self, account_id, position, seconds):
+        postings = self.by_account.get(account_id)
+        if postings is None:
+            postings = self.by_account[account_id] = _Postings()
+        postings.add(position, seconds)
+
+    def add_trade(self, position, trade):
+        self.add(position, trade.get('ticker'), trade.get('buy_account_id'), trade.get('sell_account_id'),
+                 to_seconds(trade['timestamp']) if trade.get('timestamp') else 0.0)
+
+    def candidates(self, ticker=None, account_id=None, start=None, end=None):
+        """Yield the positions of possible matches, from the shortest index that applies."""
+        indexes = []
+        if ticker is not None:
+            indexes.append(self.by_ticker.get(ticker))
+        if account_id is not None:
+            indexes.append(self.by_account.get(account_id))
+        if None in indexes:
+            return iter(())
+        postings = min(indexes, key=len) if indexes else self.all
+        return postings.between(start, end)
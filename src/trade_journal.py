@@ -0,0 +1,255 @@
+import json
+import os
+import threading
+from trade_index import TradeIndex, limited, matches, to_seconds
+
+
+class TradeJournal:
+    """Append-only JSON-Lines file of executed trades.
+
+    Every trade is one line written with a single ``write`` call, so saving
+    a trade does not depend on how many trades came before it. Readers
+    stream the file line by line. A legacy ``executed_trades.json`` array is
+    migrated into the journal once, the first time the journal is opened.
+
+    Deleting a trade appends its id to a tombstone file (``<path>.deleted``)
+    instead of rewriting the journal, and readers skip tombstoned trades. A
+    ``trade_id -> offset`` index, built on the first lookup and kept up to
+    date by ``append``, makes ``find`` a single seek. Once ``compact_after``
+    tombstones have piled up, a background thread rewrites the journal
+    without the deleted trades.
+
+    ``query`` reads through a TradeIndex of line offsets by ticker, account
+    and time, built on the first query and also kept up to date by
+    ``append``.
+    """
+
+    def __init__(self, path, legacy_path=None, compact_after=1000):
+        self.path = path
+        self.legacy_path = legacy_path
+        self.deleted_path = path + '.deleted'
+        self.compact_after = compact_after
+        self.offsets = None  # {trade_id: byte offset of its line}, built on first use
+        self.query_index = None  # TradeIndex of line offsets, built on first query
+        self.compaction_thread = None  # the last compaction started in the background
+        self._compacting = False
+        self._lock = threading.RLock()
+        self.deleted = self._load_deleted()
+        self.migrate_legacy()
+
+    def migrate_legacy(self):
+        if not self.legacy_path or os.path.exists(self.path) or not os.path.exists(self.legacy_path):
+            return
+        try:
+            with open(self.legacy_path, 'r') as f:
+                trades = json.load(f)
+        except json.JSONDecodeError:
+            trades = []
+        if isinstance(trades, list):
+            self.rewrite(trades)
+        # Keep the old file around, but out of the way of the next startup
+        os.replace(self.legacy_path, self.legacy_path + '.migrated')
+
+    def _load_deleted(self):
+        try:
+            with open(self.deleted_path, 'r') as f:
+                return {line.strip() for line in f if line.strip()}
+        except FileNotFoundError:
+            return set()
+
+    @staticmethod
+    def _encode(trade):
+        return json.dumps(trade, separators=(',', ':')) + '\n'
+
+    def append(self, trade):
+        line = self._encode(trade).encode()
+        with self._lock:
+            with open(self.path, 'ab') as f:
+                offset = f.tell()
+                f.write(line)
+            if self.offsets is not None:
+                self.offsets[trade.get('trade_id')] = offset
+            if self.query_index is not None:
+                self.query_index.add_trade(offset, trade)
+
+    def __iter__(self):
+        deleted = self.deleted
+        try:
+            with open(self.path, 'r') as f:
+                for line in f:
+                    if not line.strip():
+                        continue
+                    try:
+                        trade = json.loads(line)
+                    except json.JSONDecodeError:
+                        # A torn last line from an interrupted write
+                        continue
+                    if deleted and trade.get('trade_id') in deleted:
+                        continue
+                    yield trade
+        except FileNotFoundError:
+            return
+
+    @staticmethod
+    def _line_trade_id(line):
+        # Lines written by _encode have a plain "trade_id":"..." member, which
+        # is much cheaper to pick out than parsing the whole line
+        start = line.find(b'"trade_id":"')
+        if start >= 0:
+            start += 12
+            end = line.find(b'"', start)
+            if end > 0 and line.find(b'\\', start, end) < 0:
+                return line[start:end].decode()
+        return json.loads(line).get('trade_id')
+
+    def _build_index(self):
+        offsets = {}
+        try:
+            with open(self.path, 'rb') as f:
+                offset = 0
+                for line in f:
+                    try:
+                        offsets[self._line_trade_id(line)] = offset
+                    except ValueError:
+                        pass
+                    offset += len(line)
+        except FileNotFoundError:
+            pass
+        self.offsets = offsets
+
+    def find(self, trade_id):
+        """Return the trade with this id, or None if there is none or it was deleted."""
+        with self._lock:
+            if trade_id in self.deleted:
+                return None
+            if self.offsets is None:
+                self._build_index()
+            offset = self.offsets.get(trade_id)
+            if offset is None:
+                return None
+            with open(self.path, 'rb') as f:
+                f.seek(offset)
+                return json.loads(f.readline())
+
+    def _build_query_index(self):
+        index = TradeIndex()
+        try:
+            with open(self.path, 'rb') as f:
+                offset = 0
+                for line in f:
+                    try:
+                        trade = json.loads(line)
+                    except ValueError:
+                        trade = None
+                    if trade is not None:
+                        index.add_trade(offset, trade)
+                    offset += len(line)
+        except FileNotFoundError:
+            pass
+        self.query_index = index
+
+    def query(self, ticker=None, account_id=None, start=None, end=None, limit=None):
+        """Lazily yield the trades matching the filters, oldest first (see trade_index.matches)."""
+        return limited(self._query(ticker, None if account_id is None else str(account_id),
+                                   None if start is None else to_seconds(start),
+                                   None if end is None else to_seconds(end)), limit)
+
+    def _query(self, ticker, account_id, start, end):
+        with self._lock:
+            if self.query_index is None:
+                self._build_query_index()
+            candidates = self.query_index.candidates(ticker, account_id, start, end)
+            try:
+                # Opened now, so the offsets stay valid even if a compaction
+                # swaps the file, and with the tombstones of this file
+                f = open(self.path, 'rb')
+            except FileNotFoundError:
+                return
+            deleted = self.deleted
+        with f:
+            for offset in candidates:
+                f.seek(offset)
+                trade = json.loads(f.readline())
+                if trade.get('trade_id') not in deleted and matches(trade, ticker, account_id, start, end):
+                    yield trade
+
+    def delete(self, trade_id):
+        """Tombstone a trade; return False if there is no such trade."""
+        with self._lock:
+            if self.find(trade_id) is None:
+                return False
+            with open(self.deleted_path, 'a') as f:
+                f.write(trade_id + '\n')
+            self.deleted.add(trade_id)
+            if len(self.deleted) >= self.compact_after and not self._compacting:
+                self._compacting = True
+                self.compaction_thread = threading.Thread(target=self.compact, daemon=True)
+                self.compaction_thread.start()
+        return True
+
+    def compact(self):
+        """Rewrite the journal without the tombstoned trades.
+
+        Appends and deletes can go on while the copy is made: trades
+        appended meanwhile are copied over at the end, and tombstones added
+        meanwhile are kept.
+        """
+        with self._lock:
+            end = os.path.getsize(self.path) if os.path.exists(self.path) else 0
+            dropped = set(self.deleted)
+        tmp_path = self.path + '.compact'
+        with open(tmp_path, 'wb') as out:
+            if end:
+                with open(self.path, 'rb') as f:
+                    while f.tell() < end:
+                        line = f.readline()
+                        try:
+                            trade_id = self._line_trade_id(line)
+                        except ValueError:
+                            continue
+                        if trade_id not in dropped:
+                            out.write(line)
+            with self._lock:
+                if os.path.exists(self.path):
+                    with open(self.path, 'rb') as f:
+                        f.seek(end)
+                        out.write(f.read())
+                out.close()
+                os.replace(tmp_path, self.path)
+                # Tombstones are dropped only after the swap (a crash in between
+                # leaves tombstones for trades that are gone, which is harmless),
+                # and into a new set, so readers still on the old file keep theirs
+                self.deleted = self.deleted - dropped
+                self._write_deleted()
+                self.offsets = None
+                self.query_index = None
+                self._compacting = False
+
+    def _write_deleted(self):
+        tmp_path = self.deleted_path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            f.writelines(trade_id + '\n' for trade_id in self.deleted)
+        os.replace(tmp_path, self.deleted_path)
+
+    def clear(self):
+        with self._lock:
+            for path in (self.path, self.deleted_path):
+                if os.path.exists(path):
+                    os.remove(path)
+            self.deleted = set()
+            self.offsets = None
+            self.query_index = None
+
+    def rewrite(self, trades):
+        """Replace the whole journal with the given trades."""
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            for trade in trades:
+                f.write(self._encode(trade))
+        with self._lock:
+            os.replace(tmp_path, self.path)
+            if self.deleted:
+                self.deleted = set()
+                self._write_deleted()
+            self.offsets = None
+            self.query_index = None
@@ -0,0 +1,362 @@
+import json
+import mmap
+import os
+import struct
+import threading
+import uuid
+from trade_index import TradeIndex, limited, matches, to_ns, to_seconds
+
+try:
+    import numpy as np
+except ImportError:  # NumPy is optional; only numpy_view() needs it
+    np = None
+
+# Prices are stored as whole numbers of 10 ** -price_decimals, with the
+# fewest decimals from MIN_ to MAX_PRICE_DECIMALS that hold the price
+# exactly, so tickers with ticks finer than a cent keep their prices.
+# Records written before price_decimals was stored have 0 there and are
+# in cents.
+MIN_PRICE_DECIMALS = 2
+MAX_PRICE_DECIMALS = 9
+_PRICE_SCALES = tuple(10 ** decimals for decimals in range(MAX_PRICE_DECIMALS + 1))
+
+# seq, timestamp_ns, trade_id, price_ticks, quantity, ticker_id,
+# buy_account_id, sell_account_id, flags, price_decimals, padding to 64 bytes
+RECORD = struct.Struct('<Qq16sqdIIIBB2x')
+FIELDS = ('seq', 'timestamp_ns', 'trade_id', 'price_ticks', 'quantity', 'ticker_id',
+          'buy_account_id', 'sell_account_id', 'flags', 'price_decimals')
+FLAG_UUID = 1  # trade_id holds the 16 bytes of a UUID rather than short text
+FLAG_DELETED = 2  # the trade was deleted; dropped at the next compaction
+_FLAGS_OFFSET = 60
+
+if np is not None:
+    RECORD_DTYPE = np.dtype({
+        'names': list(FIELDS),
+        'formats': ['<u8', '<i8', 'S16', '<i8', '<f8', '<u4', '<u4', '<u4', 'u1', 'u1'],
+        'offsets': [0, 8, 16, 32, 40, 48, 52, 56, 60, 61],
+        'itemsize': RECORD.size,
+    })
+
+
+def price_decimals(price):
+    """The decimals a price is stored with: the fewest, but at least MIN_PRICE_DECIMALS, that read back exactly."""
+    for decimals in range(MIN_PRICE_DECIMALS, MAX_PRICE_DECIMALS):
+        scale = _PRICE_SCALES[decimals]
+        if round(price * scale) / scale == price:
+            return decimals
+    return MAX_PRICE_DECIMALS
+
+
+class BinaryTradeLog:
+    """Executed trades as fixed-width binary records.
+
+    Each trade is one 64-byte ``RECORD``. Tickers and account ids are stored
+    as small ids; the id -> value tables are kept in a JSON-Lines sidecar
+    file (``<path>.symbols``) that only grows when a new ticker or account
+    shows up. Reads map the file with ``mmap`` and unpack records straight
+    out of a ``memoryview``, and ``numpy_view()`` exposes the same memory as
+    a NumPy structured array without copying.
+
+    It can stand in for TradeJournal: iterating yields the same trade dicts,
+    so display and export work unchanged.
+
+    Deleting a trade sets ``FLAG_DELETED`` on its record in place; readers
+    skip flagged records. A ``trade_id -> record number`` index is built on
+    the first lookup and kept up to date by ``append``. Once
+    ``compact_after`` records are flagged, a background thread rewrites the
+    log without them.
+
+    ``query`` reads through a TradeIndex of record numbers by ticker,
+    account and time, built from the raw records on the first query and
+    kept up to date by ``append``.
+    """
+
+    def __init__(self, path, compact_after=1000):
+        self.path = path
+        self.symbols_path = path + '.symbols'
+        self.compact_after = compact_after
+        self.values = {'ticker': [], 'account': []}  # {kind: [value by id]}
+        self.ids = {'ticker': {}, 'account': {}}     # {kind: {value: id}}
+        self.positions = None  # {trade_id: record number}, built on first use
+        self.query_index = None  # TradeIndex of record numbers, built on first query
+        self.deleted_count = 0
+        self.compaction_thread = None  # the last compaction started in the background
+        self._compacting = False
+        self._deleted_while_compacting = []
+        self._lock = threading.RLock()
+        self._load_symbols()
+        self.sequence = self._last_sequence()
+
+    def _last_sequence(self):
+        # Compaction drops records, so the count of records is not the last sequence number
+        try:
+            with open(self.path, 'rb') as f:
+                count = os.fstat(f.fileno()).st_size // RECORD.size
+                if not count:
+                    return 0
+                f.seek((count - 1) * RECORD.size)
+                return RECORD.unpack(f.read(RECORD.size))[0]
+        except FileNotFoundError:
+            return 0
+
+    def _load_symbols(self):
+        try:
+            with open(self.symbols_path, 'r') as f:
+                for line in f:
+                    try:
+                        kind, value = json.loads(line)
+                    except ValueError:
+                        continue  # A torn last line from an interrupted write
+                    self.ids[kind][value] = len(self.values[kind])
+                    self.values[kind].append(value)
+        except FileNotFoundError:
+            pass
+
+    def _symbol_id(self, kind, value):
+        symbol_id = self.ids[kind].get(value)
+        if symbol_id is None:
+            # Written before any record that refers to it
+            with open(self.symbols_path, 'a') as f:
+                f.write(json.dumps([kind, value]) + '\n')
+            symbol_id = len(self.values[kind])
+            self.ids[kind][value] = symbol_id
+            self.values[kind].append(value)
+        return symbol_id
+
+    def _encode(self, trade, seq):
+        trade_id = trade.get('trade_id') or ''
+        try:
+            trade_id_bytes, flags = uuid.UUID(trade_id).bytes, FLAG_UUID
+        except ValueError:
+            trade_id_bytes, flags = trade_id.encode(), 0
+            if len(trade_id_bytes) > 16:
+                raise ValueError(f"Trade ID {trade_id!r} is neither a UUID nor at most 16 bytes long.")
+        timestamp = trade.get('timestamp')
+        timestamp_ns = to_ns(timestamp) if timestamp else 0
+        price = trade['price']
+        decimals = price_decimals(price)
+        return RECORD.pack(
+            seq, timestamp_ns, trade_id_bytes, round(price * _PRICE_SCALES[decimals]), trade['quantity'],
+            self._symbol_id('ticker', trade['ticker']),
+            self._symbol_id('account', trade['buy_account_id']),
+            self._symbol_id('account', trade['sell_account_id']),
+            flags, decimals)
+
+    @staticmethod
+    def _decode_trade_id(trade_id, flags):
+        if flags & FLAG_UUID:
+            # Same text as str(uuid.UUID(bytes=...)), without building the UUID
+            h = trade_id.hex()
+            return f'{h[:8]}-{h[8:12]}-{h[12:16]}-{h[16:20]}-{h[20:]}'
+        return trade_id.rstrip(b'\0').decode()
+
+    def _decode(self, record):
+        seq, timestamp_ns, trade_id, price_ticks, quantity, ticker_id, buyer_id, seller_id, flags, decimals = record
+        trade_id = self._decode_trade_id(trade_id, flags)
+        return {
+            'trade_id': trade_id,
+            'ticker': self.values['ticker'][ticker_id],
+            'price': price_ticks / _PRICE_SCALES[decimals or MIN_PRICE_DECIMALS],
+            'quantity': quantity,
+            'buy_account_id': self.values['account'][buyer_id],
+            'sell_account_id': self.values['account'][seller_id],
+            'timestamp': timestamp_ns or None
+        }
+
+    def append(self, trade):
+        with self._lock:
+            self.sequence += 1
+            record = self._encode(trade, self.sequence)
+            with open(self.path, 'ab') as f:
+                position = f.tell() // RECORD.size
+                f.write(record)
+            if self.positions is not None:
+                self.positions[trade.get('trade_id')] = position
+            if self.query_index is not None:
+                self.query_index.add_trade(position, trade)
+
+    def records(self, include_deleted=False):
+        """Yield raw record tuples (see FIELDS), unpacked from the mapped file."""
+        try:
+            f = open(self.path, 'rb')
+        except FileNotFoundError:
+            return
+        with f:
+            count = os.fstat(f.fileno()).st_size // RECORD.size  # ignore a torn last record
+            if not count:
+                return
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            view = memoryview(mapped)[:count * RECORD.size]
+            records = RECORD.iter_unpack(view)
+            try:
+                if include_deleted:
+                    yield from records
+                else:
+                    for record in records:
+                        if not record[8] & FLAG_DELETED:
+                            yield record
+            finally:
+                # The map can only be closed once nothing refers to its buffer
+                del records
+                view.release()
+                mapped.close()
+
+    def __iter__(self):
+        for record in self.records():
+            yield self._decode(record)
+
+    def numpy_view(self):
+        """The trades as a read-only NumPy structured array over the mapped file.
+
+        Prices are ``view['price_ticks'] / 10.0 ** view['price_decimals']``.
+        Deleted trades stay in the file until the next compaction; filter
+        them out with ``view['flags'] & FLAG_DELETED == 0``.
+        """
+        if np is None:
+            raise ImportError("numpy_view() needs NumPy, which is not installed.")
+        try:
+            f = open(self.path, 'rb')
+        except FileNotFoundError:
+            return np.empty(0, dtype=RECORD_DTYPE)
+        with f:
+            count = os.fstat(f.fileno()).st_size // RECORD.size
+            if not count:
+                return np.empty(0, dtype=RECORD_DTYPE)
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        # The array keeps the map open for as long as it is alive
+        return np.frombuffer(mapped, dtype=RECORD_DTYPE, count=count)
+
+    def _build_index(self):
+        positions = {}
+        deleted = 0
+        for position, record in enumerate(self.records(include_deleted=True)):
+            if record[8] & FLAG_DELETED:
+                deleted += 1
+            else:
+                positions[self._decode_trade_id(record[2], record[8])] = position
+        self.positions = positions
+        self.deleted_count = deleted
+
+    def _read_record(self, position):
+        with open(self.path, 'rb') as f:
+            f.seek(position * RECORD.size)
+            return RECORD.unpack(f.read(RECORD.size))
+
+    def find(self, trade_id):
+        """Return the trade with this id, or None if there is none or it was deleted."""
+        with self._lock:
+            if self.positions is None:
+                self._build_index()
+            position = self.positions.get(trade_id)
+            if position is None:
+                return None
+            return self._decode(self._read_record(position))
+
+    def _build_query_index(self):
+        index = TradeIndex()
+        tickers, accounts = self.values['ticker'], self.values['account']
+        for position, record in enumerate(self.records(include_deleted=True)):
+            index.add(position, tickers[record[5]], accounts[record[6]], accounts[record[7]], record[1] / 1e9)
+        self.query_index = index
+
+    def query(self, ticker=None, account_id=None, start=None, end=None, limit=None):
+        """Lazily yield the trades matching the filters, oldest first (see trade_index.matches)."""
+        return limited(self._query(ticker, None if account_id is None else str(account_id),
+                                   None if start is None else to_seconds(start),
+                                   None if end is None else to_seconds(end)), limit)
+
+    def _query(self, ticker, account_id, start, end):
+        with self._lock:
+            if self.query_index is None:
+                self._build_query_index()
+            candidates = self.query_index.candidates(ticker, account_id, start, end)
+            try:
+                # Opened now, so the record numbers stay valid even if a compaction swaps the file
+                f = open(self.path, 'rb')
+            except FileNotFoundError:
+                return
+        with f:
+            for position in candidates:
+                f.seek(position * RECORD.size)
+                record = RECORD.unpack(f.read(RECORD.size))
+                if record[8] & FLAG_DELETED:
+                    continue
+                trade = self._decode(record)
+                if matches(trade, ticker, account_id, start, end):
+                    yield trade
+
+    def delete(self, trade_id):
+        """Flag a trade as deleted; return False if there is no such trade."""
+        with self._lock:
+            if self.find(trade_id) is None:
+                return False
+            position = self.positions.pop(trade_id)
+            record = self._read_record(position)
+            with open(self.path, 'r+b') as f:
+                f.seek(position * RECORD.size + _FLAGS_OFFSET)
+                f.write(bytes([record[8] | FLAG_DELETED]))
+            self.deleted_count += 1
+            if self._compacting:
+                self._deleted_while_compacting.append(trade_id)
+            elif self.deleted_count >= self.compact_after:
+                self._compacting = True
+                self.compaction_thread = threading.Thread(target=self.compact, daemon=True)
+                self.compaction_thread.start()
+        return True
+
+    def compact(self):
+        """Rewrite the log without the deleted records, keeping their sequence numbers.
+
+        Appends and deletes can go on while the copy is made: records
+        appended meanwhile are copied over at the end, and trades deleted
+        meanwhile are flagged again in the new file.
+        """
+        with self._lock:
+            end = os.path.getsize(self.path) // RECORD.size * RECORD.size if os.path.exists(self.path) else 0
+        tmp_path = self.path + '.compact'
+        with open(tmp_path, 'wb') as out:
+            if end:
+                with open(self.path, 'rb') as f:
+                    while f.tell() < end:
+                        data = f.read(RECORD.size)
+                        if not data[_FLAGS_OFFSET] & FLAG_DELETED:
+                            out.write(data)
+            with self._lock:
+                if os.path.exists(self.path):
+                    with open(self.path, 'rb') as f:
+                        f.seek(end)
+                        out.write(f.read())
+                out.close()
+                os.replace(tmp_path, self.path)
+                self.positions = None
+                self.query_index = None
+                self._compacting = False
+                deleted, self._deleted_while_compacting = self._deleted_while_compacting, []
+                for trade_id in deleted:
+                    self.delete(trade_id)
+                if self.positions is None:
+                    self.deleted_count = 0
+
+    def clear(self):
+        with self._lock:
+            if os.path.exists(self.path):
+                os.remove(self.path)
+            self.sequence = 0
+            self.positions = None
+            self.query_index = None
+            self.deleted_count = 0
+
+    def rewrite(self, trades):
+        """Replace the whole log with the given trades."""
+        tmp_path = self.path + '.tmp'
+        sequence = 0
+        with open(tmp_path, 'wb') as f:
+            for trade in trades:
+                sequence += 1
+                f.write(self._encode(trade, sequence))
+        with self._lock:
+            os.replace(tmp_path, self.path)
+            self.sequence = sequence
+            self.positions = None
+            self.query_index = None
+            self.deleted_count = 0